@@ -0,0 +1,333 @@
+import os
+import ast
+import argparse
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from osgeo import gdal
+from REJILLAS import abrir_en_rejilla, opciones_warp
+from CATALOGO_SATELITAL import actualizar_catalogo, consultar
+from CONFIGURACION import cargar_configuracion
+from INSTRUMENTACION import etapa, anotar, informar, resumen
+from PRECARGA import en_tuberia
+from CODIFICACION import crear_salida, codificar, leer_banda, escalada
+from LANDSAT_TAR import bandas_landsat, destino_escena, mtl_escena, reflectancia_mtl
+
+# Alias de bandas de cada sensor (archivo Landsat o subdataset MOD09A1), valor mínimo válido
+# (los menores son relleno) y conversión a reflectancia (escala, desplazamiento) si es constante
+sensores = {
+    "LANDSAT8": {
+        "bandas": {"COASTAL": "B1", "BLUE": "B2", "GREEN": "B3", "RED": "B4", "NIR": "B5",
+                   "SWIR1": "B6", "SWIR2": "B7", "TIR": "B10"},
+        "minimo_valido": 1,
+        "reflectancia": (2.0e-5, -0.1)  # Colección 2 nivel 1 (TOA), igual para todas las bandas OLI
+    },
+    "LANDSAT7": {
+        "bandas": {"BLUE": "B1", "GREEN": "B2", "RED": "B3", "NIR": "B4", "SWIR1": "B5", "TIR": "B6", "SWIR2": "B7"},
+        "minimo_valido": 1,
+        "reflectancia": None  # ETM+ depende de la ganancia de cada escena
+    },
+    "MOD09A1": {
+        "bandas": {"RED": "sur_refl_b01", "NIR": "sur_refl_b02", "BLUE": "sur_refl_b03", "GREEN": "sur_refl_b04",
+                   "NIR2": "sur_refl_b05", "SWIR1": "sur_refl_b06", "SWIR2": "sur_refl_b07"},
+        "minimo_valido": 1,
+        "reflectancia": (1e-4, 0.0)
+    }
+}
+
+# Índices disponibles aunque la configuración no tenga la sección 'indices' (la configuración los amplía)
+indices_predeterminados = {
+    "NDVI": {"expresion": "(NIR - RED) / (NIR + RED)"},
+    "NDWI": {"expresion": "(GREEN - NIR) / (GREEN + NIR)", "por_sensor": {"MOD09A1": "(NIR - NIR2) / (NIR + NIR2)"}}
+}
+
+# Píxeles por bloque (~1 MB en float32 por banda, para que los temporales queden en caché)
+pixeles_bloque = 1 << 18
+
+# Hilos de cálculo (las operaciones de numpy liberan el GIL)
+hilos_calculo = os.cpu_count() or 1
+
+_operaciones = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.true_divide, ast.Pow: np.power}
+
+@lru_cache(maxsize=None)
+def compilar_expresion(expresion):
+    """Traduce una expresión de bandas a una secuencia de ufuncs de numpy con registros reutilizables.
+
+    Cada operación escribe en un registro temporal (in-place sobre el operando izquierdo o
+    derecho cuando ya es temporal), así una expresión usa pocos buffers del tamaño del bloque.
+    Devuelve (programa, n_registros, variables, resultado).
+    """
+    programa, libres, variables = [], [], []
+    n_registros = 0
+
+    def nuevo():
+        nonlocal n_registros
+        if libres:
+            return libres.pop()
+        n_registros += 1
+        return ("r", n_registros - 1)
+
+    def es_registro(operando):
+        return isinstance(operando, tuple) and operando[0] == "r"
+
+    def visitar(nodo):
+        if isinstance(nodo, ast.Constant) and isinstance(nodo.value, (int, float)):
+            return float(nodo.value)
+        if isinstance(nodo, ast.Name):
+            if nodo.id not in variables:
+                variables.append(nodo.id)
+            return ("v", nodo.id)
+        if isinstance(nodo, ast.UnaryOp) and isinstance(nodo.op, (ast.UAdd, ast.USub)):
+            a = visitar(nodo.operand)
+            if isinstance(nodo.op, ast.UAdd):
+                return a
+            if isinstance(a, float):
+                return -a
+            destino = a if es_registro(a) else nuevo()
+            programa.append((np.negative, destino, a, None))
+            return destino
+        if isinstance(nodo, ast.BinOp) and type(nodo.op) in _operaciones:
+            a, b = visitar(nodo.left), visitar(nodo.right)
+            ufunc = _operaciones[type(nodo.op)]
+            if isinstance(a, float) and isinstance(b, float):
+                return float(ufunc(a, b))
+            if es_registro(a):
+                destino = a
+                if es_registro(b):
+                    libres.append(b)
+            elif es_registro(b):
+                destino = b
+            else:
+                destino = nuevo()
+            programa.append((ufunc, destino, a, b))
+            return destino
+        raise ValueError(f"Operación no admitida en la expresión '{expresion}': {ast.dump(nodo)}")
+
+    resultado = visitar(ast.parse(expresion, mode="eval").body)
+    if isinstance(resultado, float):
+        raise ValueError(f"La expresión '{expresion}' no usa ninguna banda.")
+    if not es_registro(resultado):
+        destino = nuevo()
+        programa.append((np.multiply, destino, resultado, 1.0))
+        resultado = destino
+    return tuple(programa), n_registros, tuple(variables), resultado
+
+def _evaluar_bloque(programa, n_registros, resultado, entradas, nodata, minimo_valido, reflectancia):
+    """Evalúa el programa sobre un bloque de bandas float32 y marca con nodata los píxeles inválidos."""
+    forma = next(iter(entradas.values())).shape
+    invalido = np.zeros(forma, dtype=bool)
+    if minimo_valido is not None:
+        for arr in entradas.values():
+            invalido |= arr < minimo_valido
+    if reflectancia is not None:
+        for variable, arr in entradas.items():
+            escala, desplazamiento = reflectancia[variable] if isinstance(reflectancia, dict) else reflectancia
+            arr *= escala
+            arr += desplazamiento
+
+    registros = [np.empty(forma, dtype=np.float32) for _ in range(n_registros)]
+
+    def valor(operando):
+        if isinstance(operando, float):
+            return operando
+        return entradas[operando[1]] if operando[0] == "v" else registros[operando[1]]
+
+    with np.errstate(all="ignore"):
+        for ufunc, destino, a, b in programa:
+            if b is None:
+                ufunc(valor(a), out=registros[destino[1]])
+            else:
+                ufunc(valor(a), valor(b), out=registros[destino[1]])
+
+    salida = registros[resultado[1]]
+    invalido |= ~np.isfinite(salida)
+    salida[invalido] = nodata
+    return salida
+
+def evaluar_bloque(expresion, entradas, nodata=np.nan, minimo_valido=None, reflectancia=None):
+    """Evalúa una expresión sobre un bloque ya leído (variable -> array float32, que se modifica)."""
+    programa, n_registros, variables, resultado = compilar_expresion(expresion)
+    faltan = [v for v in variables if v not in entradas]
+    if faltan:
+        raise ValueError(f"Faltan las bandas {', '.join(faltan)} para la expresión '{expresion}'.")
+    return _evaluar_bloque(programa, n_registros, resultado, {v: entradas[v] for v in variables}, nodata,
+                           minimo_valido, reflectancia)
+
+def evaluar_expresion(expresion, fuentes, output_path, nodata=-9999, minimo_valido=None, reflectancia=None,
+                      hilos=None, producto=None):
+    """Evalúa una expresión de bandas por bloques y guarda el resultado como GeoTIFF.
+
+    `fuentes` asigna a cada variable de la expresión un dataset GDAL (banda 1) o una tupla
+    (dataset, banda); todas deben estar en la misma rejilla. Las bandas se leen como float32
+    en este hilo (las de productos guardados en int16 se desescalan) y los bloques se calculan
+    en paralelo mientras se lee el siguiente. Si `producto` tiene codificación (CODIFICACION)
+    la salida es Int16 con escala; si no, Float32.
+    """
+    programa, n_registros, variables, resultado = compilar_expresion(expresion)
+    faltan = [v for v in variables if v not in fuentes]
+    if faltan:
+        raise ValueError(f"Faltan las bandas {', '.join(faltan)} para la expresión '{expresion}'.")
+
+    bandas = {}
+    for variable in variables:
+        fuente = fuentes[variable]
+        ds, indice = fuente if isinstance(fuente, tuple) else (fuente, 1)
+        bandas[variable] = ds.GetRasterBand(indice)
+    referencia = fuentes[variables[0]]
+    referencia = referencia[0] if isinstance(referencia, tuple) else referencia
+    ancho, alto = referencia.RasterXSize, referencia.RasterYSize
+    if any((b.XSize, b.YSize) != (ancho, alto) for b in bandas.values()):
+        raise ValueError(f"Las bandas de '{expresion}' no tienen el mismo tamaño.")
+
+    out_ds, escala = crear_salida(output_path, ancho, alto, referencia.GetProjection(), referencia.GetGeoTransform(),
+                                  producto, nodata)
+    out_band = out_ds.GetRasterBand(1)
+    escaladas = {v for v, b in bandas.items() if escalada(b)}
+
+    hilos = hilos or hilos_calculo
+    filas = max(1, pixeles_bloque // ancho)
+    pendientes = deque()
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        for fila in range(0, alto, filas):
+            n_filas = min(filas, alto - fila)
+            entradas = {v: leer_banda(b, 0, fila, ancho, n_filas) if v in escaladas
+                        else b.ReadAsArray(0, fila, ancho, n_filas, buf_type=gdal.GDT_Float32) for v, b in bandas.items()}
+            pendientes.append((fila, executor.submit(_evaluar_bloque, programa, n_registros, resultado, entradas,
+                                                     nodata, minimo_valido, reflectancia)))
+            while len(pendientes) > 2 * hilos:
+                fila_lista, futuro = pendientes.popleft()
+                out_band.WriteArray(codificar(futuro.result(), escala, nodata), 0, fila_lista)
+        while pendientes:
+            fila_lista, futuro = pendientes.popleft()
+            out_band.WriteArray(codificar(futuro.result(), escala, nodata), 0, fila_lista)
+
+    out_band.FlushCache()
+    out_band = None
+    out_ds = None
+    anotar(expresion=expresion, forma=[alto, ancho], bloques=-(-alto // filas), hilos=hilos, registros=n_registros,
+           codificacion="int16" if escala else "float32")
+    return output_path
+
+def definicion_indice(nombre, sensor):
+    """Expresión de un índice para un sensor e indicación de si necesita reflectancia."""
+    indices = dict(indices_predeterminados)
+    try:
+        indices.update(cargar_configuracion().get("indices", {}))
+    except IOError:
+        pass
+    if nombre not in indices:
+        raise KeyError(f"Índice '{nombre}' no definido (sección 'indices' de la configuración)")
+    definicion = indices[nombre]
+    expresion = definicion.get("por_sensor", {}).get(sensor, definicion["expresion"])
+    return expresion, definicion.get("reflectancia", False)
+
+def bandas_indice(nombre, sensor):
+    """Bandas del sensor (archivo o subdataset) que necesita un índice."""
+    expresion, _ = definicion_indice(nombre, sensor)
+    alias = sensores[sensor]["bandas"]
+    return [alias.get(v, v) for v in compilar_expresion(expresion)[2]]
+
+def calcular_indice(nombre, sensor, fuentes, output_path, rejilla=None, nodata=-9999, reflectancia=None, hilos=None):
+    """Calcula un índice configurado a partir de sus bandas y lo guarda como GeoTIFF (Int16 escalado o Float32).
+
+    `fuentes` asigna a cada alias (RED, NIR...) o banda del sensor (B4, sur_refl_b01...) una
+    ruta, un dataset GDAL o una tupla (dataset, banda). Las rutas se abren reproyectadas a
+    `rejilla` si se indica. `reflectancia` reemplaza la conversión del sensor: (escala,
+    desplazamiento) o un diccionario banda (alias o del sensor) -> (escala, desplazamiento).
+    """
+    expresion, usa_reflectancia = definicion_indice(nombre, sensor)
+    tabla = sensores[sensor]
+    if usa_reflectancia:
+        reflectancia = reflectancia or tabla["reflectancia"]
+        if reflectancia is None:
+            raise ValueError(f"{nombre} necesita reflectancia y {sensor} no tiene una conversión constante.")
+        if isinstance(reflectancia, dict):
+            reflectancia = {alias: reflectancia.get(alias, reflectancia.get(tabla["bandas"].get(alias)))
+                            for alias in compilar_expresion(expresion)[2]}
+    else:
+        reflectancia = None
+
+    entradas = {}
+    for alias in compilar_expresion(expresion)[2]:
+        fuente = fuentes.get(alias, fuentes.get(tabla["bandas"].get(alias)))
+        if isinstance(fuente, str):
+            fuente = abrir_en_rejilla(fuente, rejilla) if rejilla else gdal.Open(fuente)
+        if fuente is not None:
+            entradas[alias] = fuente
+    return evaluar_expresion(expresion, entradas, output_path, nodata, tabla["minimo_valido"], reflectancia, hilos,
+                             producto=nombre)
+
+def falta_reflectancia(nombre, sensor, reflectancia):
+    """Indica si un índice necesita reflectancia y no hay conversión del MTL de la escena ni del sensor."""
+    return definicion_indice(nombre, sensor)[1] and reflectancia is None and sensores[sensor]["reflectancia"] is None
+
+def calcular_indice_escena(nombre, sensor, date_path, rejilla="LANDSAT_30"):
+    """Calcula un índice de una escena Landsat (carpeta de fecha o .tar) y devuelve la ruta de salida."""
+    output_dir, date_folder = destino_escena(date_path)
+    rutas = bandas_landsat(date_path, bandas_indice(nombre, sensor))
+    if rutas is None:
+        informar(f"Faltan algunas bandas en {date_path}.", "aviso")
+        return None
+
+    # La conversión a reflectancia del MTL de la escena, si la trae, reemplaza la del sensor
+    reflectancia = reflectancia_mtl(mtl_escena(date_path), rutas)
+    if falta_reflectancia(nombre, sensor, reflectancia):
+        informar(f"{nombre} necesita reflectancia y {date_path} no trae las constantes del MTL. Saltando...", "aviso")
+        return None
+    output_path = os.path.join(output_dir, f"{nombre}_{date_folder}.tif")
+    with etapa(f"{nombre.lower()}_{sensor.lower()}", fecha=date_folder, salida=output_path):
+        calcular_indice(nombre, sensor, rutas, output_path, rejilla, reflectancia=reflectancia)
+    return output_path
+
+def cargar_bandas(rutas, rejilla):
+    """Lee las bandas de una escena en datasets MEM sobre la rejilla (banda -> dataset)."""
+    return {banda: gdal.Warp("", path, format="MEM", **opciones_warp(rejilla)) for banda, path in rutas.items()}
+
+def procesar_indice_landsat(nombre, sensor, base_directory, rejilla="LANDSAT_30"):
+    """Calcula un índice en todas las escenas Landsat del catálogo que tienen sus bandas.
+
+    Las escenas se procesan en tubería: las bandas de las siguientes se leen en memoria en
+    segundo plano mientras se calcula y escribe la actual. Las escenas en .tar de Colección 2
+    se leen sin extraer y su resultado se guarda junto al .tar.
+    """
+    catalogo_db = actualizar_catalogo(base_directory)
+    bandas = bandas_indice(nombre, sensor)
+    escenas = consultar(catalogo_db, producto="LANDSAT", bandas=bandas, raiz=base_directory)
+    etiqueta = f"{nombre.lower()}_{sensor.lower()}"
+
+    def leer(date_path):
+        rutas = bandas_landsat(date_path, bandas)
+        if rutas is None:
+            informar(f"Faltan algunas bandas en {date_path}.", "aviso")
+            return None
+        reflectancia = reflectancia_mtl(mtl_escena(date_path), rutas)
+        if falta_reflectancia(nombre, sensor, reflectancia):
+            informar(f"{nombre} necesita reflectancia y {date_path} no trae las constantes del MTL. Saltando...", "aviso")
+            return None
+        with etapa(f"leer_{etiqueta}", fecha=destino_escena(date_path)[1]):
+            return cargar_bandas(rutas, rejilla), reflectancia
+
+    def calcular(date_path, leido):
+        fuentes, reflectancia = leido
+        output_dir, date_folder = destino_escena(date_path)
+        output_path = os.path.join(output_dir, f"{nombre}_{date_folder}.tif")
+        with etapa(etiqueta, fecha=date_folder, salida=output_path):
+            return calcular_indice(nombre, sensor, fuentes, output_path, reflectancia=reflectancia)
+
+    return en_tuberia([escena["ruta"] for escena in escenas], leer, calcular, nombre=f"tuberia_{etiqueta}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calcula un índice configurado en todas las escenas de una carpeta.")
+    parser.add_argument("indice", help="nombre del índice (NDVI, NDWI, NBR, SAVI, EVI...)")
+    parser.add_argument("sensor", choices=list(sensores))
+    parser.add_argument("carpeta", help="carpeta base de las escenas")
+    args = parser.parse_args()
+
+    if args.sensor == "MOD09A1":
+        from REFLECTANCIA_MOD09A1 import procesar_modis_indices
+        from CONFIGURACION import ruta
+        procesar_modis_indices(args.carpeta, ruta("aoi"), (args.indice,))
+    else:
+        procesar_indice_landsat(args.indice, args.sensor, args.carpeta)
+    resumen()
@@ -0,0 +1,310 @@
+import os
+import re
+import json
+import sqlite3
+from datetime import date, datetime, timedelta
+from osgeo import gdal, ogr, osr
+from INSTRUMENTACION import instrumentar, informar
+from LANDSAT_TAR import indexar_tar
+from REJILLAS import srs_epsg, transformar_extension
+
+# Nombre del archivo de catálogo que se guarda en la raíz de cada archivo satelital
+nombre_catalogo = "catalogo_satelital.sqlite"
+
+# Catalogar también las escenas Landsat empaquetadas (.tar de Colección 2), que se leen sin extraer
+incluir_tar = True
+
+# Carpetas de resultados que no forman parte del archivo original
+carpetas_ignoradas = {"Reproyectado", "LST", "resultados", "mascaras_cache"}
+
+esquema = """
+CREATE TABLE IF NOT EXISTS archivos (
+    ruta TEXT PRIMARY KEY,
+    producto TEXT,
+    sensor TEXT,
+    tile TEXT,
+    fecha TEXT,
+    bandas TEXT,
+    srs TEXT,
+    geotransform TEXT,
+    ancho INTEGER,
+    alto INTEGER,
+    lon_min REAL,
+    lat_min REAL,
+    lon_max REAL,
+    lat_max REAL,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS idx_archivos_producto_fecha ON archivos (producto, fecha);
+"""
+
+patron_banda_landsat = re.compile(r"(?:^|_)B(\d{1,2})\.tif$", re.IGNORECASE)
+patron_modis = re.compile(r"^(M[OY]D)(\w+?)\.A(\d{4})(\d{3})\.(h\d{2}v\d{2})", re.IGNORECASE)
+patron_path_row = re.compile(r"_(\d{6})_(\d{8})_")
+
+def fecha_desde_nombre(nombre):
+    """Intenta obtener la fecha (ISO) a partir del nombre de un archivo o carpeta."""
+    match = re.search(r"\.A(\d{4})(\d{3})\.", nombre)
+    if match:
+        return (date(int(match.group(1)), 1, 1) + timedelta(days=int(match.group(2)) - 1)).isoformat()
+
+    formatos = [
+        (r"(?<!\d)(\d{4})(\d{2})(\d{2})(?!\d)", "%Y%m%d"),
+        (r"(?<!\d)(\d{4})[-_](\d{2})[-_](\d{2})(?!\d)", "%Y%m%d"),
+        (r"(?<!\d)(\d{2})[-_](\d{2})[-_](\d{4})(?!\d)", "%d%m%Y"),
+        (r"(?<!\d)(\d{2})[-_](\d{4})(?!\d)", "%m%Y"),
+    ]
+    for patron, formato in formatos:
+        for match in re.finditer(patron, nombre):
+            try:
+                return datetime.strptime("".join(match.groups()), formato).date().isoformat()
+            except ValueError:
+                continue
+    return None
+
+def _info_raster(ruta):
+    """Devuelve SRC, geotransformación, tamaño y bbox lon/lat de un raster."""
+    ds = gdal.Open(ruta)
+    if ds is None:
+        return None
+    proyeccion = ds.GetProjection()
+    gt = ds.GetGeoTransform()
+    ancho, alto = ds.RasterXSize, ds.RasterYSize
+    ds = None
+
+    bbox = (None, None, None, None)
+    if proyeccion:
+        srs = osr.SpatialReference()
+        srs.ImportFromWkt(proyeccion)
+        x_min, y_max = gt[0], gt[3]
+        x_max, y_min = gt[0] + ancho * gt[1], gt[3] + alto * gt[5]
+        bbox = transformar_extension(srs, x_min, y_min, x_max, y_max, 4326)
+    return {"srs": proyeccion, "geotransform": json.dumps(list(gt)), "ancho": ancho, "alto": alto, "bbox": bbox}
+
+def _registro_hdf(ruta):
+    """Inspecciona un HDF de MODIS (producto, sensor, tile, fecha, subdatasets y rejilla)."""
+    nombre = os.path.basename(ruta)
+    match = patron_modis.match(nombre)
+    producto = nombre.split(".")[0].upper()
+    sensor, tile = None, None
+    if match:
+        sensor = "TERRA" if match.group(1).upper() == "MOD" else "AQUA"
+        tile = match.group(5).lower()
+
+    hdf_dataset = gdal.Open(ruta, gdal.GA_ReadOnly)
+    if hdf_dataset is None:
+        informar(f"No se pudo abrir el archivo: {ruta}", "error")
+        return None
+    subdatasets = [s[0] for s in hdf_dataset.GetSubDatasets()]
+    hdf_dataset = None
+
+    info = _info_raster(subdatasets[0]) if subdatasets else None
+    return {"producto": producto, "sensor": sensor, "tile": tile, "fecha": fecha_desde_nombre(nombre),
+            "bandas": subdatasets, "info": info}
+
+def _registro_landsat(carpeta, bandas):
+    """Inspecciona una carpeta de fecha Landsat con archivos B<n>.tif."""
+    nombres = sorted(bandas, key=lambda b: int(b[1:]))
+    ruta_upper = carpeta.upper()
+    if "OLI" in ruta_upper or "LANDSAT 8" in ruta_upper or "B10" in nombres:
+        sensor = "OLI"
+    elif "ETM" in ruta_upper or "LANDSAT 7" in ruta_upper:
+        sensor = "ETM"
+    else:
+        sensor = None
+
+    archivos = [f for f in os.listdir(carpeta) if patron_banda_landsat.search(f)]
+    fecha = fecha_desde_nombre(os.path.basename(carpeta))
+    tile = None
+    for archivo in archivos:
+        match = patron_path_row.search(archivo)
+        if match:
+            tile = match.group(1)
+            fecha = fecha or fecha_desde_nombre(match.group(2))
+            break
+
+    info = _info_raster(os.path.join(carpeta, bandas[nombres[0]]))
+    return {"producto": "LANDSAT", "sensor": sensor, "tile": tile, "fecha": fecha, "bandas": nombres, "info": info}
+
+def _registro_landsat_tar(ruta):
+    """Inspecciona un .tar de Colección 2 a partir de sus miembros y del MTL (sin extraer nada)."""
+    indice = indexar_tar(ruta)
+    if indice is None or not indice["bandas"]:
+        return None
+    nombres = sorted(indice["bandas"], key=lambda b: int(b[1:]))
+    info = _info_raster(indice["bandas"][nombres[0]])
+    return {"producto": "LANDSAT", "sensor": indice["sensor"], "tile": indice["tile"], "fecha": indice["fecha"],
+            "bandas": nombres, "info": info}
+
+def _registro_shapefile(ruta):
+    """Inspecciona un shapefile o GeoPackage; los de puntos se registran como focos de calor."""
+    shp_ds = ogr.Open(ruta)
+    if shp_ds is None:
+        informar(f"No se pudo abrir el shapefile: {ruta}", "error")
+        return None
+    layer = shp_ds.GetLayer()
+    es_puntos = ogr.GT_Flatten(layer.GetGeomType()) in (ogr.wkbPoint, ogr.wkbMultiPoint)
+    campos = [layer.GetLayerDefn().GetFieldDefn(i).GetName() for i in range(layer.GetLayerDefn().GetFieldCount())]
+
+    srs = layer.GetSpatialRef()
+    bbox = (None, None, None, None)
+    if srs is not None and layer.GetFeatureCount() > 0:
+        x_min, x_max, y_min, y_max = layer.GetExtent()
+        bbox = transformar_extension(srs, x_min, y_min, x_max, y_max, 4326)
+    srs_wkt = srs.ExportToWkt() if srs is not None else ""
+    shp_ds = None
+
+    info = {"srs": srs_wkt, "geotransform": None, "ancho": None, "alto": None, "bbox": bbox}
+    carpeta = os.path.dirname(ruta)
+    return {"producto": "HOTSPOTS" if es_puntos else "VECTOR", "sensor": None, "tile": None,
+            "fecha": fecha_desde_nombre(os.path.basename(carpeta)) or fecha_desde_nombre(os.path.basename(ruta)),
+            "bandas": campos, "info": info}
+
+def _candidatos(raiz):
+    """Recorre el archivo una vez y devuelve (ruta, tipo, mtime, extra) de cada unidad catalogable."""
+    for carpeta, subcarpetas, archivos in os.walk(raiz):
+        subcarpetas[:] = [d for d in subcarpetas if d not in carpetas_ignoradas]
+        bandas = {}
+        for archivo in archivos:
+            ruta = os.path.join(carpeta, archivo)
+            nombre = archivo.lower()
+            if nombre.endswith(".hdf"):
+                yield ruta, "hdf", os.path.getmtime(ruta), None
+            elif nombre.endswith(".shp") or nombre.endswith(".gpkg"):
+                yield ruta, "shp", os.path.getmtime(ruta), None
+            elif incluir_tar and nombre.endswith(".tar"):
+                yield ruta, "landsat_tar", os.path.getmtime(ruta), None
+            else:
+                match = patron_banda_landsat.search(archivo)
+                if match:
+                    bandas[f"B{int(match.group(1))}"] = archivo
+        if bandas:
+            mtime = max(os.path.getmtime(os.path.join(carpeta, f)) for f in bandas.values())
+            yield carpeta, "landsat", mtime, bandas
+
+def ruta_catalogo(raiz):
+    """Ruta del catálogo SQLite de un archivo satelital."""
+    return os.path.join(raiz, nombre_catalogo)
+
+def abrir_catalogo(catalogo_db):
+    """Abre (y crea si no existe) el catálogo SQLite."""
+    conexion = sqlite3.connect(catalogo_db)
+    conexion.row_factory = sqlite3.Row
+    conexion.executescript(esquema)
+    return conexion
+
+@instrumentar("actualizar_catalogo")
+def actualizar_catalogo(raiz, catalogo_db=None):
+    """Escanea el archivo y actualiza el catálogo de forma incremental según el mtime.
+
+    Solo se inspeccionan los archivos nuevos o modificados; las entradas cuyos archivos
+    ya no existen se eliminan. Devuelve la ruta del catálogo.
+    """
+    catalogo_db = catalogo_db or ruta_catalogo(raiz)
+    conexion = abrir_catalogo(catalogo_db)
+    raiz_abs = os.path.abspath(raiz)
+    conocidos = {fila["ruta"]: fila["mtime"] for fila in conexion.execute(
+        "SELECT ruta, mtime FROM archivos WHERE substr(ruta, 1, ?) = ?", (len(raiz_abs), raiz_abs))}
+
+    nuevos, actualizados, vistos = 0, 0, set()
+    for ruta, tipo, mtime, extra in _candidatos(raiz_abs):
+        vistos.add(ruta)
+        if conocidos.get(ruta) == mtime:
+            continue
+
+        if tipo == "hdf":
+            registro = _registro_hdf(ruta)
+        elif tipo == "shp":
+            registro = _registro_shapefile(ruta)
+        elif tipo == "landsat_tar":
+            registro = _registro_landsat_tar(ruta)
+        else:
+            registro = _registro_landsat(ruta, extra)
+        if registro is None:
+            continue
+
+        info = registro["info"] or {"srs": None, "geotransform": None, "ancho": None, "alto": None,
+                                    "bbox": (None, None, None, None)}
+        conexion.execute(
+            "INSERT OR REPLACE INTO archivos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (ruta, registro["producto"], registro["sensor"], registro["tile"], registro["fecha"],
+             json.dumps(registro["bandas"]), info["srs"], info["geotransform"], info["ancho"], info["alto"],
+             *info["bbox"], mtime))
+        if ruta in conocidos:
+            actualizados += 1
+        else:
+            nuevos += 1
+
+    eliminados = [ruta for ruta in conocidos if ruta not in vistos]
+    conexion.executemany("DELETE FROM archivos WHERE ruta = ?", [(ruta,) for ruta in eliminados])
+    conexion.commit()
+    conexion.close()
+    informar(f"Catálogo actualizado ({catalogo_db}): {nuevos} nuevos, {actualizados} modificados, {len(eliminados)} eliminados.")
+    return catalogo_db
+
+def bbox_aoi(mask_shp):
+    """Bbox lon/lat del shapefile del área de estudio."""
+    shp_ds = ogr.Open(mask_shp)
+    if shp_ds is None:
+        raise IOError(f"No se pudo abrir el shapefile del área de estudio: {mask_shp}")
+    layer = shp_ds.GetLayer()
+    x_min, x_max, y_min, y_max = layer.GetExtent()
+    srs = layer.GetSpatialRef()
+    bbox = transformar_extension(srs if srs is not None else srs_epsg(4326), x_min, y_min, x_max, y_max, 4326)
+    shp_ds = None
+    return bbox
+
+def consultar(catalogo_db, producto=None, sensor=None, desde=None, hasta=None, aoi=None, bandas=None, raiz=None):
+    """Consulta el catálogo por producto, sensor, rango de fechas y área de estudio.
+
+    `aoi` puede ser un shapefile o una tupla (lon_min, lat_min, lon_max, lat_max); `bandas`
+    es una lista de bandas o subdatasets que deben estar presentes. Devuelve una lista de
+    diccionarios ordenada por fecha.
+    """
+    condiciones, parametros = [], []
+    if producto:
+        condiciones.append("producto = ?")
+        parametros.append(producto)
+    if sensor:
+        condiciones.append("sensor = ?")
+        parametros.append(sensor)
+    if desde:
+        condiciones.append("fecha >= ?")
+        parametros.append(str(desde))
+    if hasta:
+        condiciones.append("fecha <= ?")
+        parametros.append(str(hasta))
+    if raiz:
+        raiz_abs = os.path.abspath(raiz)
+        condiciones.append("substr(ruta, 1, ?) = ?")
+        parametros += [len(raiz_abs), raiz_abs]
+    if aoi:
+        lon_min, lat_min, lon_max, lat_max = bbox_aoi(aoi) if isinstance(aoi, str) else aoi
+        condiciones.append("(lon_min IS NULL OR NOT (lon_max < ? OR lon_min > ? OR lat_max < ? OR lat_min > ?))")
+        parametros += [lon_min, lon_max, lat_min, lat_max]
+
+    consulta = "SELECT * FROM archivos"
+    if condiciones:
+        consulta += " WHERE " + " AND ".join(condiciones)
+    consulta += " ORDER BY fecha, ruta"
+
+    conexion = abrir_catalogo(catalogo_db)
+    filas = conexion.execute(consulta, parametros).fetchall()
+    conexion.close()
+
+    resultados = []
+    for fila in filas:
+        registro = dict(fila)
+        registro["bandas"] = json.loads(registro["bandas"]) if registro["bandas"] else []
+        if bandas and not all(any(d == b or d.endswith(":" + b) for d in registro["bandas"]) for b in bandas):
+            continue
+        resultados.append(registro)
+    return resultados
+
+if __name__ == "__main__":
+    # Archivos satelitales a catalogar
+    from CONFIGURACION import ruta
+    raices = [ruta(clave) for clave in ("modis_terra", "modis_aqua", "landsat_lst", "landsat_ndvi", "landsat_ndwi", "kernel")]
+    for raiz in dict.fromkeys(raices):
+        if os.path.isdir(raiz):
+            actualizar_catalogo(raiz)
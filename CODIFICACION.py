@@ -0,0 +1,116 @@
+import numpy as np
+from osgeo import gdal
+from CONFIGURACION import parametro
+
+# Codificación de los productos: "int16" (enteros con escala y desplazamiento) o "float32"
+# (se puede cambiar con "codificacion" en la sección 'parametros' de la configuración)
+codificacion = "int16"
+
+# Escala y desplazamiento de cada producto (valor real = entero * escala + desplazamiento):
+# 0,01 °C para la LST y 0,0001 para los índices normalizados
+escalas = {
+    "LST": (0.01, 0.0),
+    "NDVI": (0.0001, 0.0),
+    "NDWI": (0.0001, 0.0),
+    "NBR": (0.0001, 0.0),
+    "SAVI": (0.0001, 0.0),
+    "EVI": (0.0001, 0.0)
+}
+
+# Nodata de los productos enteros (el mínimo de int16, fuera del rango útil)
+nodata_entero = -32768
+
+# Opciones GTiff de las salidas: bloques de 256 x 256 comprimidos con DEFLATE y predictor
+opciones_gtiff = ["COMPRESS=DEFLATE", "TILED=YES", "BLOCKXSIZE=256", "BLOCKYSIZE=256"]
+
+def codificacion_producto(producto):
+    """(escala, desplazamiento) con que se guarda un producto, o None si se guarda en Float32."""
+    try:
+        modo = parametro("codificacion", codificacion)
+    except IOError:
+        modo = codificacion
+    if modo != "int16" or producto not in escalas:
+        return None
+    return escalas[producto]
+
+def opciones_creacion(tipo_gdal):
+    """Opciones GTiff de un tipo de dato: predictor horizontal (2) para enteros y de coma flotante (3) para reales."""
+    flotante = tipo_gdal in (gdal.GDT_Float32, gdal.GDT_Float64)
+    return opciones_gtiff + ["PREDICTOR=3" if flotante else "PREDICTOR=2"]
+
+def crear_salida(output_path, ancho, alto, proyeccion, geotransform, producto=None, nodata=-9999):
+    """Crea el GeoTIFF de una banda de un producto: Int16 escalado si tiene codificación, Float32 si no.
+
+    Devuelve (dataset, codificación); la codificación se pasa a `codificar` antes de escribir.
+    """
+    escala = codificacion_producto(producto)
+    tipo = gdal.GDT_Int16 if escala else gdal.GDT_Float32
+    out_ds = gdal.GetDriverByName("GTiff").Create(output_path, ancho, alto, 1, tipo, options=opciones_creacion(tipo))
+    out_ds.SetProjection(proyeccion)
+    out_ds.SetGeoTransform(geotransform)
+    out_band = out_ds.GetRasterBand(1)
+    if escala:
+        out_band.SetScale(escala[0])
+        out_band.SetOffset(escala[1])
+        out_band.SetNoDataValue(nodata_entero)
+    else:
+        out_band.SetNoDataValue(nodata)
+    return out_ds, escala
+
+def codificar(valores, escala, nodata=None):
+    """Enteros que se escriben para unos valores reales (NaN y nodata pasan a nodata_entero).
+
+    Los valores fuera del rango de int16 se saturan. Sin codificación devuelve los valores tal cual.
+    """
+    if escala is None:
+        return valores
+    invalidos = ~np.isfinite(valores)
+    if nodata is not None and not np.isnan(nodata):
+        invalidos |= valores == nodata
+    enteros = np.rint((np.where(invalidos, escala[1], valores) - escala[1]) / escala[0])
+    np.clip(enteros, nodata_entero + 1, np.iinfo(np.int16).max, out=enteros)
+    enteros = enteros.astype(np.int16)
+    enteros[invalidos] = nodata_entero
+    return enteros
+
+def decodificar(valores, escala=None, desplazamiento=None, nodata=None):
+    """Valores reales (float32, NaN en nodata) de los datos leídos de una banda con su escala y desplazamiento."""
+    reales = valores.astype(np.float32)
+    if nodata is not None and not np.isnan(nodata):
+        invalidos = valores == nodata
+    else:
+        invalidos = None
+    if escala not in (None, 1):
+        reales *= escala
+    if desplazamiento not in (None, 0):
+        reales += desplazamiento
+    if invalidos is not None:
+        reales[invalidos] = np.nan
+    return reales
+
+def escalada(band):
+    """Indica si una banda guarda enteros con escala o desplazamiento."""
+    return band.GetScale() not in (None, 1) or band.GetOffset() not in (None, 0)
+
+def leer_banda(band, xoff=0, yoff=0, ancho=None, alto=None, escala=None, pixeles=None):
+    """Lee una banda (o una ventana) en valores reales, con la escala aplicada y NaN en nodata.
+
+    `escala` (escala, desplazamiento) reemplaza la de la banda, por ejemplo la del archivo original
+    de una banda reproyectada; con `pixeles` (índices sobre la banda aplanada) solo se devuelven y
+    desescalan esos píxeles.
+    """
+    valores = band.ReadAsArray(xoff, yoff, ancho, alto)
+    if pixeles is not None:
+        valores = valores.ravel()[pixeles]
+    escala, desplazamiento = escala or (band.GetScale(), band.GetOffset())
+    return decodificar(valores, escala, desplazamiento, band.GetNoDataValue())
+
+def escala_raster(path, banda=1):
+    """(escala, desplazamiento) guardados en una banda de un raster ((1, 0) si no tiene)."""
+    ds = gdal.Open(path)
+    if ds is None:
+        return 1.0, 0.0
+    band = ds.GetRasterBand(banda)
+    escala, desplazamiento = band.GetScale(), band.GetOffset()
+    ds = None
+    return escala if escala is not None else 1.0, desplazamiento if desplazamiento is not None else 0.0
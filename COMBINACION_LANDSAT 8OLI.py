@@ -1,90 +1,210 @@
 import os
+import json
+from xml.sax.saxutils import escape
 from osgeo import gdal
 import numpy as np
-from qgis.core import QgsProject, QgsRasterLayer
+from CATALOGO_SATELITAL import actualizar_catalogo, consultar
+from REJILLAS import abrir_en_rejilla, opciones_warp
+from CONFIGURACION import ruta
+from INSTRUMENTACION import informar
+from LANDSAT_TAR import bandas_landsat, destino_escena, es_tar
 
 # Parámetros de entrada
-base_directory = r"C:\Users\rodov\Downloads\LANDSAT 8 OLI"
-
-def add_layer_to_project(path, name):
-    """Añade una capa raster al proyecto QGIS."""
-    layer = QgsRasterLayer(path, name)
-    if layer.isValid():
-        QgsProject.instance().addMapLayer(layer)
-        return layer
-    else:
-        print(f"Error al cargar la capa {name}")
-        return None
-
-def scale_to_byte(arr):
-    """Escala un array numpy a valores de 0-255."""
-    arr_min = np.min(arr)
-    arr_max = np.max(arr)
-    scale = 255 / (arr_max - arr_min) if arr_max > arr_min else 1
-    scaled_arr = ((arr - arr_min) * scale).astype(np.uint8)
+base_directory = ruta("landsat_combinaciones")
+
+# Rejilla común de salida (las bandas se reproyectan al leerlas)
+rejilla_landsat = "LANDSAT_30"
+
+# Combinaciones RGB disponibles (rojo, verde, azul)
+combinations = {
+    "B6_B5_B2": ("B6", "B5", "B2"),
+    "B7_B5_B3": ("B7", "B5", "B3"),
+    "B5_B4_B3": ("B5", "B4", "B3"),
+    "B6_B5_B4": ("B6", "B5", "B4")
+}
+
+# Combinaciones a generar en cada fecha
+active_combinations = ["B6_B5_B2", "B7_B5_B3", "B5_B4_B3", "B6_B5_B4"]
+
+# "vrt": compuestos virtuales sin copia de píxeles; "gtiff": GeoTIFF RGB escrito por bloques
+composite_mode = "vrt"
+
+# Materializar además cada compuesto virtual como COG (entregables)
+materialize = False
+
+# Percentiles de corte del realce (se ignora el 0 de relleno)
+low_percentile = 2
+high_percentile = 98
+
+# Filas por bloque en la lectura y escritura por bloques
+block_rows = 512
+
+# Opciones de creación del GeoTIFF RGB
+rgb_options = ["COMPRESS=DEFLATE", "TILED=YES", "BLOCKXSIZE=256", "BLOCKYSIZE=256"]
+
+def iterate_blocks(n_rows):
+    """Devuelve (yoff, ysize) de cada bloque de filas."""
+    for yoff in range(0, n_rows, block_rows):
+        yield yoff, min(block_rows, n_rows - yoff)
+
+def percentile_cuts(band_path, low=low_percentile, high=high_percentile):
+    """Calcula los valores de corte de una banda con un histograma acumulado por bloques."""
+    band_ds = gdal.Open(band_path)
+    band = band_ds.GetRasterBand(1)
+    hist = np.zeros(65536, dtype=np.int64)
+    for yoff, ysize in iterate_blocks(band_ds.RasterYSize):
+        block = band.ReadAsArray(0, yoff, band_ds.RasterXSize, ysize)
+        valid = block[block > 0].astype(np.int64)
+        hist += np.bincount(np.minimum(valid, 65535), minlength=65536)
+    band_ds = None
+
+    cdf = np.cumsum(hist)
+    if cdf[-1] == 0:
+        return 0, 1
+    low_value = max(int(np.searchsorted(cdf, cdf[-1] * low / 100.0)), 1)
+    high_value = int(np.searchsorted(cdf, cdf[-1] * high / 100.0))
+    return low_value, max(high_value, low_value + 1)
+
+def scale_to_byte(arr, low, high):
+    """Escala un bloque a 1-255 entre los valores de corte; el 0 de relleno queda en 0."""
+    scaled = (arr.astype(np.float32) - low) * (254.0 / (high - low)) + 1
+    np.clip(scaled, 1, 255, out=scaled)
+    scaled_arr = scaled.astype(np.uint8)
+    scaled_arr[arr == 0] = 0
     return scaled_arr
 
-def combine_bands(band2_path, band5_path, band6_path, output_path):
-    """Combina las bandas 6, 5 y 2 en un solo archivo TIFF (RGB)."""
-    # Abrir las bandas usando GDAL
-    band2_ds = gdal.Open(band2_path)
-    band5_ds = gdal.Open(band5_path)
-    band6_ds = gdal.Open(band6_path)
-    
-    # Leer los datos de las bandas
-    band2 = band2_ds.GetRasterBand(1).ReadAsArray()
-    band5 = band5_ds.GetRasterBand(1).ReadAsArray()
-    band6 = band6_ds.GetRasterBand(1).ReadAsArray()
-
-    # Escalar las bandas a 0-255
-    band2_scaled = scale_to_byte(band2)
-    band5_scaled = scale_to_byte(band5)
-    band6_scaled = scale_to_byte(band6)
-
-    # Crear un archivo TIFF para guardar el resultado RGB
-    combined = gdal.GetDriverByName('GTiff').Create(output_path, 
-                  band2_ds.RasterXSize, band2_ds.RasterYSize, 
-                  3, gdal.GDT_Byte)
-
-    # Escribir las bandas en el archivo de salida en el orden RGB especificado
-    combined.GetRasterBand(1).WriteArray(band6_scaled)  # Banda 6 - Red
-    combined.GetRasterBand(2).WriteArray(band5_scaled)  # Banda 5 - Green
-    combined.GetRasterBand(3).WriteArray(band2_scaled)  # Banda 2 - Blue
-
-    # Configurar la proyección y la transformación geográfica
-    combined.SetGeoTransform(band2_ds.GetGeoTransform())
-    combined.SetProjection(band2_ds.GetProjection())
+def combine_bands(rgb_paths, output_path):
+    """Combina tres bandas (rojo, verde, azul) en un GeoTIFF RGB con realce por percentiles, bloque a bloque."""
+    # Primera pasada: histogramas y valores de corte de cada banda
+    cuts = [percentile_cuts(path) for path in rgb_paths]
+
+    # Segunda pasada: escalado por bloques sobre la rejilla común
+    rgb_ds = [abrir_en_rejilla(path, rejilla_landsat) for path in rgb_paths]
+    n_cols, n_rows = rgb_ds[0].RasterXSize, rgb_ds[0].RasterYSize
+    combined = gdal.GetDriverByName('GTiff').Create(output_path, n_cols, n_rows, 3, gdal.GDT_Byte,
+                                                    options=rgb_options)
+    combined.SetGeoTransform(rgb_ds[0].GetGeoTransform())
+    combined.SetProjection(rgb_ds[0].GetProjection())
+
+    for yoff, ysize in iterate_blocks(n_rows):
+        for i, (ds, (low, high)) in enumerate(zip(rgb_ds, cuts)):
+            block = ds.GetRasterBand(1).ReadAsArray(0, yoff, n_cols, ysize)
+            combined.GetRasterBand(i + 1).WriteArray(scale_to_byte(block, low, high), 0, yoff)
+
+    for i in range(3):
+        combined.GetRasterBand(i + 1).SetNoDataValue(0)
     combined.FlushCache()
 
     # Cerrar datasets
-    band2_ds = None
-    band5_ds = None
-    band6_ds = None
+    rgb_ds = None
     combined = None
 
-def process_landsat_data(year_folder):
-    """Procesa los datos Landsat para cada carpeta de fecha."""
-    for date_folder in os.listdir(year_folder):
-        date_path = os.path.join(year_folder, date_folder)
-        if os.path.isdir(date_path):
-            # Definir las rutas de las bandas
-            band_2_path = os.path.join(date_path, "B2.tif")
-            band_5_path = os.path.join(date_path, "B5.tif")
-            band_6_path = os.path.join(date_path, "B6.tif")
-
-            # Verificar que todas las bandas existan
-            if os.path.exists(band_2_path) and os.path.exists(band_5_path) and os.path.exists(band_6_path):
-                # Ruta de salida para la banda combinada
-                combined_path = os.path.join(date_path, f"Combined_B6_B5_B2_{date_folder}.tif")
-                combine_bands(band_2_path, band_5_path, band_6_path, combined_path)
-                combined_layer = add_layer_to_project(combined_path, f"Combined_B6_B5_B2_{date_folder}")
+def band_vrt(date_path, band):
+    """Crea (una sola vez) el VRT de una banda reproyectada a la rejilla común y sus valores de corte.
+
+    En un .tar de Colección 2 el VRT apunta al miembro del .tar (/vsitar/), sin extraerlo.
+    """
+    band_path = (bandas_landsat(date_path, [band]) or {band: os.path.join(date_path, f"{band}.tif")})[band]
+    output_dir, date_folder = destino_escena(date_path)
+    vrt_folder = os.path.join(output_dir, f"VRT_{date_folder}" if es_tar(date_path) else "VRT")
+    vrt_path = os.path.join(vrt_folder, f"{band}.vrt")
+    cuts_path = os.path.join(vrt_folder, "cortes_percentiles.json")
+    os.makedirs(vrt_folder, exist_ok=True)
+
+    band_mtime = gdal.VSIStatL(band_path).mtime
+    all_cuts = {}
+    if os.path.exists(cuts_path):
+        with open(cuts_path, "r", encoding="utf-8") as f:
+            all_cuts = json.load(f)
+
+    entry = all_cuts.get(band)
+    if entry is None or entry["mtime"] != band_mtime or not os.path.exists(vrt_path):
+        warped = gdal.Warp(vrt_path, band_path, format="VRT", **opciones_warp(rejilla_landsat))
+        warped = None
+        entry = {"mtime": band_mtime, "cortes": list(percentile_cuts(band_path))}
+        all_cuts[band] = entry
+        with open(cuts_path, "w", encoding="utf-8") as f:
+            json.dump(all_cuts, f, indent=2)
+    return vrt_path, tuple(entry["cortes"])
+
+def build_virtual_composite(date_path, combination, output_vrt):
+    """Escribe un VRT RGB que referencia los VRT de las bandas con su realce (sin copiar píxeles)."""
+    sources = [band_vrt(date_path, band) for band in combinations[combination]]
+    ref_ds = gdal.Open(sources[0][0])
+    n_cols, n_rows = ref_ds.RasterXSize, ref_ds.RasterYSize
+    geotransform = ", ".join(repr(v) for v in ref_ds.GetGeoTransform())
+    projection = escape(ref_ds.GetProjection())
+    ref_ds = None
+
+    xml = [f'<VRTDataset rasterXSize="{n_cols}" rasterYSize="{n_rows}">',
+           f'  <SRS>{projection}</SRS>',
+           f'  <GeoTransform>{geotransform}</GeoTransform>']
+    for i, ((vrt_path, (low, high)), color) in enumerate(zip(sources, ["Red", "Green", "Blue"])):
+        relative = os.path.relpath(vrt_path, os.path.dirname(output_vrt)).replace("\\", "/")
+        xml += [f'  <VRTRasterBand dataType="Byte" band="{i + 1}">',
+                f'    <ColorInterp>{color}</ColorInterp>',
+                '    <NoDataValue>0</NoDataValue>',
+                '    <ComplexSource>',
+                f'      <SourceFilename relativeToVRT="1">{escape(relative)}</SourceFilename>',
+                '      <SourceBand>1</SourceBand>',
+                # La LUT aplica el realce entre los cortes y satura fuera de ellos; el 0 queda como nodata
+                f'      <LUT>1:1,{low}:1,{high}:255</LUT>',
+                '      <NODATA>0</NODATA>',
+                '    </ComplexSource>',
+                '  </VRTRasterBand>']
+    xml.append('</VRTDataset>')
+
+    with open(output_vrt, "w", encoding="utf-8") as f:
+        f.write("\n".join(xml) + "\n")
+    return output_vrt
+
+def materialize_cog(vrt_path, cog_path):
+    """Materializa un compuesto virtual como Cloud Optimized GeoTIFF para entregables."""
+    cog = gdal.Translate(cog_path, vrt_path, format="COG", creationOptions=["COMPRESS=DEFLATE"])
+    cog = None
+    return cog_path
+
+def process_landsat_scene(date_path):
+    """Procesa los datos Landsat de una carpeta de fecha o de un .tar de Colección 2.
+
+    Devuelve las rutas de los compuestos generados (VRT o GeoTIFF).
+    """
+    output_dir, date_folder = destino_escena(date_path)
+    composites = []
+
+    for combination in active_combinations:
+        bands = combinations[combination]
+        rutas = bandas_landsat(date_path, bands)
+
+        # Verificar que todas las bandas existan
+        if rutas is None:
+            informar(f"Faltan bandas de la combinación {combination} en {date_path}.", "aviso")
+            continue
+        band_paths = [rutas[band] for band in bands]
+
+        name = f"Combined_{combination}_{date_folder}"
+        if composite_mode == "vrt":
+            combined_path = build_virtual_composite(date_path, combination, os.path.join(output_dir, f"{name}.vrt"))
+            if materialize:
+                materialize_cog(combined_path, os.path.join(output_dir, f"{name}_COG.tif"))
+        else:
+            combined_path = os.path.join(output_dir, f"{name}.tif")
+            combine_bands(band_paths, combined_path)
+        composites.append(combined_path)
+    return composites
 
 def main():
     """Función principal para procesar todos los datos Landsat."""
-    for year_folder in os.listdir(base_directory):
-        year_path = os.path.join(base_directory, year_folder)
-        if os.path.isdir(year_path):
-            process_landsat_data(year_path)
+    catalogo_db = actualizar_catalogo(base_directory)
+    composites = []
+    for escena in consultar(catalogo_db, producto="LANDSAT", raiz=base_directory):
+        composites += process_landsat_scene(escena["ruta"])
+
+    # Agregar todos los compuestos al proyecto de una vez (QGIS solo se importa aquí, así el
+    # realce y la combinación se pueden usar sin QGIS, por ejemplo en los benchmarks)
+    from ENSAMBLAR_PROYECTO import ensamblar_proyecto
+    ensamblar_proyecto({"RGB_LANDSAT": composites})
 
 # Ejecutar el proceso
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import os
+import numpy as np
+from osgeo import gdal
+from MASCARA_AOI import recortar_array, guardar_recorte
+from CATALOGO_SATELITAL import actualizar_catalogo, consultar
+from REFLECTANCIA_MOD09A1 import leer_bandas_mod09a1, indice_normalizado, indices_mod09a1
+from INSTRUMENTACION import etapa, informar, resumen
+from CODIFICACION import codificacion_producto, codificar, nodata_entero
+
+# Banda de estado (banderas de nubes) de MOD09A1
+banda_estado = "sur_refl_state_500m"
+
+# Estaciones del hemisferio sur (diciembre se asigna al verano del año siguiente)
+estaciones = {12: "DEF", 1: "DEF", 2: "DEF", 3: "MAM", 4: "MAM", 5: "MAM",
+              6: "JJA", 7: "JJA", 8: "JJA", 9: "SON", 10: "SON", 11: "SON"}
+
+def mascara_estado(estado, excluir_adyacentes=True, cirros_max=1):
+    """Decodifica vectorialmente sur_refl_state_500m y devuelve True en los píxeles despejados.
+
+    Bits 0-1: estado de nubes (00 despejado, 11 no definido), bit 2: sombra de nube,
+    bits 8-9: cirros, bit 10: bandera interna de nubes, bit 13: adyacente a nube.
+    """
+    nubes = estado & 0b11
+    valido = (nubes == 0) | (nubes == 3)
+    valido &= (estado & (1 << 2)) == 0
+    valido &= ((estado >> 8) & 0b11) <= cirros_max
+    valido &= (estado & (1 << 10)) == 0
+    if excluir_adyacentes:
+        valido &= (estado & (1 << 13)) == 0
+    return valido
+
+def clave_periodo(fecha, periodo):
+    """Devuelve la clave del período de composición ('2020-08' o '2020-JJA') de una fecha ISO."""
+    anio, mes = int(fecha[:4]), int(fecha[5:7])
+    if periodo == "mes":
+        return f"{anio}-{mes:02d}"
+    if periodo == "estacion":
+        return f"{anio + 1 if mes == 12 else anio}-{estaciones[mes]}"
+    raise ValueError(f"Período de composición no válido: {periodo}")
+
+def incorporar_granulo(composito, valores, fecha):
+    """Incorpora un gránulo al compuesto de máximo valor y registra la fecha del máximo."""
+    fecha_int = int(fecha.replace("-", ""))
+    if composito is None:
+        composito = {"valor": np.full(valores.shape, np.nan, dtype=np.float32),
+                     "fecha": np.zeros(valores.shape, dtype=np.int32)}
+    with np.errstate(invalid="ignore"):
+        mejor = ~np.isnan(valores) & ~(valores <= composito["valor"])
+    composito["valor"][mejor] = valores[mejor]
+    composito["fecha"][mejor] = fecha_int
+    return composito
+
+def guardar_compositos(estado, output_folder, mask_shp):
+    """Escribe el compuesto y la fecha del máximo de cada índice del período actual."""
+    salidas = []
+    proyeccion, geotransform = estado["proyeccion"], estado["geotransform"]
+    for indice, composito in estado["compositos"].items():
+        base = os.path.join(output_folder, f"{indice}_MVC_{estado['periodo']}")
+        valor, fecha, gt = composito["valor"], composito["fecha"], geotransform
+        if mask_shp:
+            valor, gt = recortar_array(valor, mask_shp, proyeccion, geotransform, np.nan)
+            if valor is None:
+                informar(f"El área de estudio no se superpone con el compuesto {base}.", "aviso")
+                continue
+            fecha, _ = recortar_array(fecha, mask_shp, proyeccion, geotransform, 0)
+
+        escala = codificacion_producto(indice)
+        with etapa("guardar_composito", salida=f"{base}.tif", valor=valor):
+            if escala:
+                guardar_recorte(f"{base}.tif", codificar(valor, escala), proyeccion, gt, gdal.GDT_Int16, nodata_entero, escala)
+            else:
+                guardar_recorte(f"{base}.tif", valor, proyeccion, gt, gdal.GDT_Float32, np.nan)
+            guardar_recorte(f"{base}_FECHA.tif", fecha, proyeccion, gt, gdal.GDT_Int32, 0)
+        informar(f"Compuesto {indice} {estado['periodo']} guardado en: {base}.tif ({estado['granulos']} gránulos)")
+        salidas += [f"{base}.tif", f"{base}_FECHA.tif"]
+    return salidas
+
+def procesar_compositos(base_folder, mask_shp, indices=("NDVI", "NDWI"), periodo="mes", desde=None, hasta=None,
+                        output_folder=None, excluir_adyacentes=True):
+    """Genera compuestos de máximo valor mensuales o estacionales a partir de los gránulos de 8 días.
+
+    Los gránulos se recorren en orden de fecha y se acumulan en un único compuesto por
+    índice; al cambiar de período el compuesto se escribe y se libera, así la memoria
+    no depende del número de gránulos.
+    """
+    output_folder = output_folder or os.path.join(base_folder, "COMPOSITOS")
+    os.makedirs(output_folder, exist_ok=True)
+
+    bandas = []
+    for indice in indices:
+        for banda in indices_mod09a1[indice]:
+            if banda not in bandas:
+                bandas.append(banda)
+
+    catalogo_db = actualizar_catalogo(base_folder)
+    registros = consultar(catalogo_db, producto="MOD09A1", desde=desde, hasta=hasta, aoi=mask_shp,
+                          bandas=[banda_estado], raiz=base_folder)
+
+    salidas = []
+    estado = None
+    for registro in registros:
+        if not registro["fecha"]:
+            continue
+        clave = clave_periodo(registro["fecha"], periodo)
+        if estado is not None and estado["periodo"] != clave:
+            salidas += guardar_compositos(estado, output_folder, mask_shp)
+            estado = None
+
+        lectura = leer_bandas_mod09a1(registro["ruta"], bandas, bandas_qa=(banda_estado,))
+        if lectura is None:
+            continue
+        arrays, proyeccion, geotransform = lectura
+        valido = mascara_estado(arrays[banda_estado], excluir_adyacentes)
+
+        if estado is None:
+            estado = {"periodo": clave, "proyeccion": proyeccion, "geotransform": geotransform,
+                      "forma": valido.shape, "compositos": {}, "granulos": 0}
+        elif geotransform != estado["geotransform"] or valido.shape != estado["forma"]:
+            informar(f"La rejilla de {registro['ruta']} no coincide con la del compuesto {clave}. Saltando...", "aviso")
+            continue
+
+        for indice in indices:
+            banda_a, banda_b = indices_mod09a1[indice]
+            valores = indice_normalizado(arrays[banda_a], arrays[banda_b]).astype(np.float32)
+            valores[~valido] = np.nan
+            estado["compositos"][indice] = incorporar_granulo(estado["compositos"].get(indice), valores, registro["fecha"])
+        estado["granulos"] += 1
+        arrays = None
+
+    if estado is not None:
+        salidas += guardar_compositos(estado, output_folder, mask_shp)
+    return salidas
+
+if __name__ == "__main__":
+    from CONFIGURACION import ruta
+    base_directory = ruta("modis_aqua")
+    mask_shapefile = ruta("aoi")
+    procesar_compositos(base_directory, mask_shapefile, periodo="mes")
+    resumen()
@@ -0,0 +1,34 @@
+import os
+import json
+
+# Archivo de configuración común (se puede cambiar con la variable de entorno FIRE_MAPS_CONFIG)
+archivo_configuracion = os.environ.get("FIRE_MAPS_CONFIG",
+                                       os.path.join(os.path.dirname(os.path.abspath(__file__)), "fire_maps.json"))
+
+# Configuración ya leída en esta sesión
+_configuracion = None
+
+def cargar_configuracion(config_path=None):
+    """Lee el archivo de configuración (rutas, parámetros y etapas del pipeline)."""
+    global _configuracion
+    if config_path is None and _configuracion is not None:
+        return _configuracion
+    config_path = config_path or archivo_configuracion
+    if not os.path.exists(config_path):
+        raise IOError(f"No se encontró el archivo de configuración: {config_path}")
+    with open(config_path, encoding="utf-8") as f:
+        configuracion = json.load(f)
+    if config_path == archivo_configuracion:
+        _configuracion = configuracion
+    return configuracion
+
+def ruta(clave):
+    """Devuelve una ruta de la sección 'rutas' de la configuración."""
+    rutas = cargar_configuracion().get("rutas", {})
+    if clave not in rutas:
+        raise KeyError(f"Ruta '{clave}' no definida en {archivo_configuracion}")
+    return rutas[clave]
+
+def parametro(clave, defecto=None):
+    """Devuelve un valor de la sección 'parametros' de la configuración."""
+    return cargar_configuracion().get("parametros", {}).get(clave, defecto)
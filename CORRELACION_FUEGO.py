@@ -0,0 +1,215 @@
+import os
+import csv
+import glob
+import numpy as np
+from osgeo import gdal
+from REJILLAS import obtener_rejilla, abrir_en_rejilla
+from CATALOGO_SATELITAL import fecha_desde_nombre
+from INSTRUMENTACION import etapa, informar, resumen
+from CODIFICACION import leer_banda, escala_raster
+
+# Rejilla común del análisis (cada raster se promedia a ella al leerlo)
+rejilla_correlacion = "MODIS_1KM"
+
+# Desfases en meses: la variable del mes t - desfase se compara con la densidad de focos del mes t
+desfases = (0, 1, 2, 3)
+
+# Meses mínimos con datos de ambos productos para calcular la correlación de un píxel
+minimo_meses = 6
+
+# Valor nodata de los rasters de correlación y pendiente
+nodata_salida = -9999
+
+def indice_mes(fecha):
+    """Número de mes absoluto (año * 12 + mes - 1) de una fecha ISO."""
+    return int(fecha[:4]) * 12 + int(fecha[5:7]) - 1
+
+def meses_de_rutas(rutas):
+    """Agrupa los rasters por mes (índice de mes -> rutas) según la fecha de su nombre."""
+    por_mes = {}
+    for path in rutas:
+        fecha = fecha_desde_nombre(os.path.basename(path)) or fecha_desde_nombre(os.path.basename(os.path.dirname(path)))
+        if fecha is None:
+            informar(f"No se pudo obtener la fecha de: {path}. Se omite.", "aviso")
+            continue
+        por_mes.setdefault(indice_mes(fecha), []).append(path)
+    return por_mes
+
+def leer_en_rejilla(rutas, rejilla=rejilla_correlacion):
+    """Lee los rasters de un mes promediados a la rejilla común (nodata como NaN) y los promedia entre sí.
+
+    Los productos guardados en int16 se desescalan con la escala del archivo original.
+    """
+    suma = None
+    for path in rutas:
+        ds = abrir_en_rejilla(path, rejilla, remuestreo=gdal.GRA_Average)
+        band = ds.GetRasterBand(1)
+        valores = leer_banda(band, escala=escala_raster(path)).astype(np.float64)
+        ds = None
+        if suma is None:
+            suma, cuenta = np.zeros_like(valores), np.zeros(valores.shape, dtype=np.int32)
+        validos = np.isfinite(valores)
+        suma[validos] += valores[validos]
+        cuenta += validos
+    with np.errstate(invalid="ignore"):
+        return np.where(cuenta > 0, suma / cuenta, np.nan)
+
+def nuevos_acumuladores(forma):
+    """Sumas corridas por píxel (n, Σx, Σy, Σx², Σy², Σxy) de un par de series."""
+    return {clave: np.zeros(forma, dtype=np.int32 if clave == "n" else np.float64)
+            for clave in ("n", "sx", "sy", "sxx", "syy", "sxy")}
+
+def acumular(acumuladores, x, y):
+    """Suma un mes a los acumuladores (solo los píxeles con dato en ambas series)."""
+    validos = np.isfinite(x) & np.isfinite(y)
+    x = np.where(validos, x, 0)
+    y = np.where(validos, y, 0)
+    acumuladores["n"] += validos
+    acumuladores["sx"] += x
+    acumuladores["sy"] += y
+    acumuladores["sxx"] += x * x
+    acumuladores["syy"] += y * y
+    acumuladores["sxy"] += x * y
+
+def correlacion_y_pendiente(acumuladores, minimo=minimo_meses):
+    """Correlación de Pearson y pendiente de la regresión de y sobre x a partir de las sumas corridas.
+
+    Los píxeles con menos de `minimo` meses o sin variación quedan en NaN.
+    """
+    n = acumuladores["n"].astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covarianza = acumuladores["sxy"] - acumuladores["sx"] * acumuladores["sy"] / n
+        varianza_x = acumuladores["sxx"] - acumuladores["sx"] ** 2 / n
+        varianza_y = acumuladores["syy"] - acumuladores["sy"] ** 2 / n
+        r = covarianza / np.sqrt(varianza_x * varianza_y)
+        pendiente = covarianza / varianza_x
+    invalidos = (n < minimo) | (varianza_x <= 0) | (varianza_y <= 0)
+    r[invalidos] = np.nan
+    pendiente[invalidos] = np.nan
+    return np.clip(r, -1, 1), pendiente
+
+def correlacionar_series(kernel_rutas, variables, rejilla=rejilla_correlacion, desfases=desfases,
+                         minimo=minimo_meses):
+    """Correlación y pendiente por píxel entre la densidad de focos y cada variable, con desfases.
+
+    `variables` es un diccionario nombre -> rutas. Se recorre la serie mes a mes una sola vez:
+    cada raster se lee una vez y solo se guardan las sumas corridas y los últimos meses que
+    piden los desfases, así la memoria no crece con el largo de la serie. Los meses sin kernel
+    no se cuentan (no se sabe si hubo cero focos o faltan datos).
+
+    Devuelve un diccionario nombre -> {desfase: (correlación, pendiente, meses por píxel)}.
+    """
+    definicion = obtener_rejilla(rejilla)
+    forma = (definicion["alto"], definicion["ancho"])
+    kernel_meses = meses_de_rutas(kernel_rutas)
+    variables_meses = {nombre: meses_de_rutas(rutas) for nombre, rutas in variables.items()}
+    acumuladores = {nombre: {d: nuevos_acumuladores(forma) for d in desfases} for nombre in variables}
+    recientes = {nombre: {} for nombre in variables}
+    max_desfase = max(desfases)
+
+    todos = set(kernel_meses).union(*(set(m) for m in variables_meses.values()))
+    with etapa("correlacionar_series", meses=len(todos), variables=len(variables)):
+        for mes in sorted(todos):
+            for nombre, por_mes in variables_meses.items():
+                if mes in por_mes:
+                    recientes[nombre][mes] = leer_en_rejilla(por_mes[mes], rejilla)
+                for viejo in [m for m in recientes[nombre] if m < mes - max_desfase]:
+                    del recientes[nombre][viejo]
+
+            if mes not in kernel_meses:
+                continue
+            densidad = leer_en_rejilla(kernel_meses[mes], rejilla)
+            for nombre in variables:
+                for d in desfases:
+                    x = recientes[nombre].get(mes - d)
+                    if x is not None:
+                        acumular(acumuladores[nombre][d], x, densidad)
+
+    resultados = {}
+    for nombre in variables:
+        resultados[nombre] = {}
+        for d in desfases:
+            r, pendiente = correlacion_y_pendiente(acumuladores[nombre][d], minimo)
+            resultados[nombre][d] = (r, pendiente, acumuladores[nombre][d]["n"])
+    return resultados
+
+def guardar_bandas(output_path, bandas, nombres_bandas, rejilla=rejilla_correlacion, nodata=nodata_salida):
+    """Guarda varias capas (una por desfase) como un GeoTIFF Float32 multibanda en la rejilla común."""
+    definicion = obtener_rejilla(rejilla)
+    driver = gdal.GetDriverByName("GTiff")
+    out_ds = driver.Create(output_path, definicion["ancho"], definicion["alto"], len(bandas), gdal.GDT_Float32,
+                           options=["COMPRESS=DEFLATE"])
+    out_ds.SetProjection(definicion["proyeccion"])
+    out_ds.SetGeoTransform(definicion["geotransform"])
+    for i, (capa, nombre) in enumerate(zip(bandas, nombres_bandas), start=1):
+        out_band = out_ds.GetRasterBand(i)
+        out_band.WriteArray(np.where(np.isfinite(capa), capa, nodata).astype(np.float32))
+        out_band.SetNoDataValue(nodata)
+        out_band.SetDescription(nombre)
+    out_ds.FlushCache()
+    out_ds = None
+    return output_path
+
+def resumen_correlacion(resultados):
+    """Filas del resumen: una por variable y desfase con la distribución de r y la pendiente media."""
+    filas = []
+    for nombre, por_desfase in resultados.items():
+        for d, (r, pendiente, n) in por_desfase.items():
+            validos = np.isfinite(r)
+            fila = {"variable": nombre, "desfase_meses": d, "pixeles": int(validos.sum()),
+                    "meses_max": int(n.max()) if n.size else 0}
+            if validos.any():
+                valores = r[validos]
+                p10, p50, p90 = np.percentile(valores, (10, 50, 90))
+                fila.update({"r_media": float(valores.mean()), "r_p10": float(p10), "r_mediana": float(p50),
+                             "r_p90": float(p90), "fraccion_positiva": float((valores > 0).mean()),
+                             "pendiente_media": float(np.nanmean(pendiente[validos]))})
+            filas.append(fila)
+    return filas
+
+def guardar_correlaciones(resultados, output_dir, rejilla=rejilla_correlacion):
+    """Escribe CORRELACION_<variable>.tif, PENDIENTE_<variable>.tif (una banda por desfase) y RESUMEN_CORRELACION.csv."""
+    os.makedirs(output_dir, exist_ok=True)
+    for nombre, por_desfase in resultados.items():
+        nombres_bandas = [f"desfase_{d}" for d in por_desfase]
+        guardar_bandas(os.path.join(output_dir, f"CORRELACION_{nombre}.tif"),
+                       [r for r, _, _ in por_desfase.values()], nombres_bandas, rejilla)
+        guardar_bandas(os.path.join(output_dir, f"PENDIENTE_{nombre}.tif"),
+                       [p for _, p, _ in por_desfase.values()], nombres_bandas, rejilla)
+
+    filas = resumen_correlacion(resultados)
+    campos = ["variable", "desfase_meses", "pixeles", "meses_max", "r_media", "r_p10", "r_mediana", "r_p90",
+              "fraccion_positiva", "pendiente_media"]
+    csv_path = os.path.join(output_dir, "RESUMEN_CORRELACION.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.DictWriter(f, fieldnames=campos)
+        escritor.writeheader()
+        for fila in filas:
+            escritor.writerow({clave: round(valor, 6) if isinstance(valor, float) else valor
+                               for clave, valor in fila.items()})
+    for fila in filas:
+        if "r_media" in fila:
+            informar(f"{fila['variable']} (desfase {fila['desfase_meses']} meses): r medio {fila['r_media']:.3f}, "
+                     f"mediana {fila['r_mediana']:.3f} en {fila['pixeles']} píxeles", **fila)
+    informar(f"Correlaciones guardadas en: {output_dir}")
+    return csv_path
+
+if __name__ == "__main__":
+    from CONFIGURACION import ruta
+
+    # Densidad de focos mensual y variables a correlacionar (se omiten los recortes, los compuestos
+    # y los rasters de fecha del máximo, que repiten meses)
+    kernel_patron = os.path.join(ruta("kernel"), "**", "resultados", "KERNEL_*.tif")
+    patrones = {
+        "LST_MODIS": os.path.join(ruta("modis_terra"), "**", "LST", "LST_*.tif"),
+        "NDVI_MODIS": os.path.join(ruta("modis_aqua"), "**", "NDVI_*.tif")
+    }
+    excluidos = ("_BENJAMIN_ACEVAL.tif", "_FECHA.tif")
+
+    def buscar(patron):
+        return sorted(r for r in glob.glob(patron, recursive=True)
+                      if not r.endswith(excluidos) and "_MVC_" not in os.path.basename(r))
+
+    resultados = correlacionar_series(buscar(kernel_patron), {nombre: buscar(p) for nombre, p in patrones.items()})
+    guardar_correlaciones(resultados, ruta("correlacion"))
+    resumen()
@@ -0,0 +1,207 @@
+import os
+import numpy as np
+from osgeo import gdal, ogr, osr
+from scipy.ndimage import gaussian_filter
+
+def rejilla_densidad(extension, pixel_size):
+    """Tamaño (n_cols, n_rows) y geotransformación de la rejilla de densidad de una extensión."""
+    min_x, min_y, max_x, max_y = extension
+    n_cols = int((max_x - min_x) / pixel_size) + 1  # +1 para incluir el borde
+    n_rows = int((max_y - min_y) / pixel_size) + 1  # +1 para incluir el borde
+    return n_cols, n_rows, (min_x, pixel_size, 0, max_y, 0, -pixel_size)
+
+# Clases de isodensidad: fracción del rango (mínimo a máximo) donde empieza cada clase y su etiqueta,
+# las mismas paradas de la rampa KERNEL de ENSAMBLAR_PROYECTO (la última clase llega al máximo)
+clases_isodensidad = [(0.1, "Densidades Medias"), (0.5, "Densidades Altas")]
+
+# Valor numérico de la confianza de VIIRS (baja, nominal, alta) para compararla con la de MODIS (0-100)
+confianza_viirs = {"l": 0, "n": 50, "h": 100}
+
+def conteo_puntos(x, y, extension, pixel_size, pesos=None):
+    """Cuenta (o suma los pesos de) los puntos de cada celda de la rejilla con un único bincount.
+
+    `pesos` puede ser un vector (un peso por punto) o una matriz (canal, punto): en ese caso
+    todos los canales se acumulan en el mismo bincount y se devuelve un array (canal, fila, columna).
+    """
+    min_x, min_y, max_x, max_y = extension
+    n_cols, n_rows, _ = rejilla_densidad(extension, pixel_size)
+    cols = ((np.asarray(x) - min_x) / pixel_size).astype(np.int64)
+    rows = ((max_y - np.asarray(y)) / pixel_size).astype(np.int64)
+    dentro = (cols >= 0) & (cols < n_cols) & (rows >= 0) & (rows < n_rows)
+    celdas = rows[dentro] * n_cols + cols[dentro]
+    if pesos is not None and np.ndim(pesos) == 2:
+        pesos = np.asarray(pesos, dtype=np.float64)[:, dentro]
+        n_canales = pesos.shape[0]
+        indices = (np.arange(n_canales)[:, np.newaxis] * (n_rows * n_cols) + celdas).ravel()
+        conteo = np.bincount(indices, weights=pesos.ravel(), minlength=n_canales * n_rows * n_cols)
+        return conteo.reshape(n_canales, n_rows, n_cols)
+    if pesos is not None:
+        pesos = np.asarray(pesos, dtype=np.float64)[dentro]
+    conteo = np.bincount(celdas, weights=pesos, minlength=n_rows * n_cols)
+    return conteo.astype(np.float64).reshape(n_rows, n_cols)
+
+def _sigma_canales(conteo, sigma):
+    """Sigma del filtro: solo en filas y columnas, nunca entre canales."""
+    return (0,) * (conteo.ndim - 2) + (sigma, sigma)
+
+def densidad_kernel(x, y, extension, pixel_size, radius, pesos=None):
+    """Densidad de kernel gaussiana (sigma = radio / tamaño de píxel) de un conjunto de puntos.
+
+    Con una matriz de pesos (canal, punto) se devuelve una densidad por canal, filtradas todas
+    en una sola llamada.
+    """
+    conteo = conteo_puntos(x, y, extension, pixel_size, pesos)
+    return gaussian_filter(conteo, sigma=_sigma_canales(conteo, radius / pixel_size))
+
+def valor_numerico(valor, defecto=0.0):
+    """Convierte un atributo de foco en número (la confianza de VIIRS 'l', 'n', 'h' a 0, 50, 100)."""
+    if valor is None:
+        return defecto
+    if isinstance(valor, str):
+        texto = valor.strip().lower()
+        if texto in confianza_viirs:
+            return float(confianza_viirs[texto])
+        try:
+            return float(texto)
+        except ValueError:
+            return defecto
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return defecto
+    return numero if np.isfinite(numero) else defecto
+
+def pesos_canales(atributos, canales, n_puntos):
+    """Matriz de pesos (canal, punto) a partir de los atributos de los focos.
+
+    `atributos` es un diccionario campo -> valores por punto y `canales` un diccionario
+    nombre -> (campo, umbral): sin campo el peso es 1 (conteo), sin umbral es el valor del
+    campo (por ejemplo FRP) y con umbral es 1 si el valor lo alcanza (por ejemplo confianza alta).
+    Los campos que faltan dan peso 0.
+    """
+    pesos = np.zeros((len(canales), n_puntos), dtype=np.float64)
+    for i, (campo, umbral) in enumerate(canales.values()):
+        if campo is None:
+            pesos[i] = 1.0
+            continue
+        if campo not in atributos:
+            continue
+        valores = np.array([valor_numerico(v) for v in atributos[campo]], dtype=np.float64)
+        pesos[i] = valores if umbral is None else (valores >= umbral)
+    return pesos
+
+def densidades_kernel(x, y, extension, pixel_size, radios, pesos=None):
+    """Densidades de kernel gaussianas de varios radios con un solo conteo de puntos.
+
+    Los radios se suavizan en cascada de menor a mayor: como la composición de dos
+    gaussianas es otra gaussiana, cada sigma se alcanza desde la densidad anterior con
+    sigma_incremental = sqrt(sigma² - sigma_anterior²). Devuelve un array (radio, fila,
+    columna) en el orden de `radios` (con una matriz de pesos, (radio, canal, fila, columna)).
+    """
+    conteo = conteo_puntos(x, y, extension, pixel_size, pesos)
+    densidades = np.empty((len(radios),) + conteo.shape, dtype=np.float64)
+    actual, sigma_actual = conteo, 0.0
+    for i in sorted(range(len(radios)), key=lambda i: radios[i]):
+        sigma = radios[i] / pixel_size
+        incremento = np.sqrt(max(sigma * sigma - sigma_actual * sigma_actual, 0.0))
+        if incremento > 0:
+            actual = gaussian_filter(actual, sigma=_sigma_canales(actual, incremento))
+        densidades[i] = actual
+        sigma_actual = sigma
+    return densidades
+
+def guardar_densidad(output_raster, density, extension, pixel_size, epsg=32721, nodata=-9999, descripciones=None):
+    """Guarda una densidad (2D o bandas en el primer eje) como GeoTIFF Float32, con nombre opcional por banda."""
+    bandas = density if density.ndim == 3 else density[np.newaxis]
+    _, _, geotransform = rejilla_densidad(extension, pixel_size)
+    driver = gdal.GetDriverByName('GTiff')
+    out_raster = driver.Create(output_raster, bandas.shape[2], bandas.shape[1], bandas.shape[0], gdal.GDT_Float32)
+    out_raster.SetGeoTransform(geotransform)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    out_raster.SetProjection(srs.ExportToWkt())
+    for i, banda in enumerate(bandas):
+        outband = out_raster.GetRasterBand(i + 1)
+        outband.WriteArray(banda)
+        outband.SetNoDataValue(nodata)
+        if descripciones:
+            outband.SetDescription(descripciones[i])
+    out_raster.FlushCache()
+    out_raster = None
+    return output_raster
+
+def contornos_densidad(density, extension, pixel_size, gpkg_path, capa, clases=clases_isodensidad, tolerancia=None,
+                       epsg=32721, atributos=None):
+    """Polígonos rellenos de isodensidad de una densidad en memoria, escritos como una capa de un GeoPackage.
+
+    Los niveles son mínimo + (máximo - mínimo) × fracción de cada clase. Las curvas se trazan
+    con el generador de contornos de GDAL (marching squares) sobre un dataset MEM con el mismo
+    array, sin volver a leer el raster guardado; cada polígono se simplifica con `tolerancia`
+    metros (por defecto, medio píxel) y lleva su clase, etiqueta, niveles, área y los
+    `atributos` fijos indicados (por ejemplo la fecha). La capa se reemplaza si ya existe.
+    Devuelve el número de polígonos escritos.
+    """
+    minimo, maximo = float(np.nanmin(density)), float(np.nanmax(density))
+    if not maximo > minimo:
+        return 0
+    inicios = [minimo + (maximo - minimo) * fraccion for fraccion, _ in clases]
+    niveles = inicios + [float(np.nextafter(maximo, np.inf))]
+    tolerancia = pixel_size / 2 if tolerancia is None else tolerancia
+    atributos = atributos or {}
+
+    n_cols, n_rows, geotransform = rejilla_densidad(extension, pixel_size)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    mem_ds = gdal.GetDriverByName("MEM").Create("", n_cols, n_rows, 1, gdal.GDT_Float64)
+    mem_ds.SetGeoTransform(geotransform)
+    mem_ds.SetProjection(srs.ExportToWkt())
+    mem_ds.GetRasterBand(1).WriteArray(density)
+
+    driver_mem = ogr.GetDriverByName("Memory") or ogr.GetDriverByName("MEM")
+    curvas_ds = driver_mem.CreateDataSource("contornos")
+    curvas = curvas_ds.CreateLayer("contornos", srs, ogr.wkbMultiPolygon)
+    curvas.CreateField(ogr.FieldDefn("nivel_min", ogr.OFTReal))
+    curvas.CreateField(ogr.FieldDefn("nivel_max", ogr.OFTReal))
+    gdal.ContourGenerateEx(mem_ds.GetRasterBand(1), curvas,
+                           options=["FIXED_LEVELS=" + ",".join(repr(n) for n in niveles), "POLYGONIZE=YES",
+                                    "ELEV_FIELD_MIN=nivel_min", "ELEV_FIELD_MAX=nivel_max"])
+    mem_ds = None
+
+    gpkg_ds = ogr.Open(gpkg_path, 1) if os.path.exists(gpkg_path) else ogr.GetDriverByName("GPKG").CreateDataSource(gpkg_path)
+    layer = gpkg_ds.CreateLayer(capa, srs, ogr.wkbMultiPolygon, options=["OVERWRITE=YES"])
+    for nombre, tipo in [("clase", ogr.OFTInteger), ("etiqueta", ogr.OFTString), ("nivel_min", ogr.OFTReal),
+                         ("nivel_max", ogr.OFTReal), ("area_ha", ogr.OFTReal)]:
+        layer.CreateField(ogr.FieldDefn(nombre, tipo))
+    for nombre, valor in atributos.items():
+        layer.CreateField(ogr.FieldDefn(nombre, ogr.OFTInteger if isinstance(valor, int) else
+                                        ogr.OFTReal if isinstance(valor, float) else ogr.OFTString))
+
+    # Solo los intervalos desde la primera clase; la clase sale de los límites inferiores
+    margen = (maximo - minimo) * 1e-9
+    escritos = 0
+    gpkg_ds.StartTransaction()
+    for curva in curvas:
+        nivel_min = curva.GetField("nivel_min")
+        if nivel_min is None or nivel_min < inicios[0] - margen:
+            continue
+        clase = int(np.searchsorted(inicios, nivel_min + margen, side="right")) - 1
+        geom = curva.GetGeometryRef()
+        if tolerancia > 0:
+            geom = geom.SimplifyPreserveTopology(tolerancia)
+        if geom is None or geom.IsEmpty():
+            continue
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetGeometry(ogr.ForceToMultiPolygon(geom))
+        feature.SetField("clase", clase + 1)
+        feature.SetField("etiqueta", clases[clase][1])
+        feature.SetField("nivel_min", inicios[clase])
+        feature.SetField("nivel_max", niveles[clase + 1] if clase + 1 < len(inicios) else maximo)
+        feature.SetField("area_ha", geom.GetArea() / 10000)
+        for nombre, valor in atributos.items():
+            feature.SetField(nombre, valor)
+        layer.CreateFeature(feature)
+        escritos += 1
+    gpkg_ds.CommitTransaction()
+    gpkg_ds = None
+    curvas_ds = None
+    return escritos
@@ -0,0 +1,217 @@
+import os
+import glob
+import json
+import hashlib
+from osgeo import gdal
+from qgis.core import (
+    QgsApplication,
+    QgsProject,
+    QgsRasterLayer,
+    QgsColorRampShader,
+    QgsRasterShader,
+    QgsSingleBandPseudoColorRenderer,
+    QgsMultiBandColorRenderer,
+    QgsCoordinateReferenceSystem
+)
+from PyQt5.QtGui import QColor
+from CATALOGO_SATELITAL import fecha_desde_nombre
+from INSTRUMENTACION import instrumentar, informar
+
+# Carpeta donde se guardan las plantillas QML de cada producto
+carpeta_estilos = os.path.join(os.path.dirname(os.path.abspath(__file__)), "estilos_qml")
+
+# Grupo raíz del árbol de capas donde se agrupan los resultados (producto / año)
+grupo_resultados = "Resultados"
+
+# Simbología de cada producto: paradas (valor, color RGB(A), etiqueta) de una rampa interpolada.
+# En los productos relativos el valor es una fracción del rango (mínimo-máximo) de cada capa.
+# "nombre" reemplaza el prefijo del archivo en el nombre de la capa (lo usan las plantillas de mapas).
+# Los productos "multibanda" (compuestos RGB ya realzados) se muestran con sus tres bandas, sin plantilla.
+estilos_producto = {
+    "NDVI_LANDSAT": {"paradas": [(-1, (0, 0, 128), "-1"), (0, (128, 128, 128), "0"),
+                                 (0.5, (60, 179, 113), "0.5"), (1, (0, 100, 0), "1")]},
+    "NDWI_LANDSAT": {"paradas": [(-1, (0, 0, 255), "-1"), (0, (0, 128, 255), "0"),
+                                 (0.5, (0, 191, 255), "0.5"), (1, (173, 216, 230), "1")]},
+    "NDVI_MODIS": {"paradas": [(-1.0, (255, 255, 255, 0), ""), (0.0, (165, 42, 42), ""), (0.3, (190, 255, 150), ""),
+                               (0.6, (34, 139, 34), ""), (1.0, (0, 100, 0), "")]},
+    "NDWI_MODIS": {"paradas": [(-1.0, (255, 255, 255, 0), ""), (0.0, (198, 219, 239), ""), (0.3, (107, 174, 214), ""),
+                               (0.6, (33, 113, 181), ""), (1.0, (8, 69, 148), "")]},
+    "LST": {"paradas": [(0, (255, 255, 0), None), (0.33, (255, 165, 0), None),
+                        (0.66, (255, 69, 0), None), (1, (153, 0, 0), None)],
+            "relativo": True, "etiqueta": "{:.2f}°C"},
+    "KERNEL": {"paradas": [(0, (255, 247, 181), "Bajas Densidades"), (0.1, (255, 169, 49), "Densidades Medias"),
+                           (0.5, (255, 51, 51), "Densidades Altas"), (1, (153, 0, 0), "Máxima Densidad")],
+               "relativo": True, "opacidad": 0.76, "nombre": ("KERNEL_", "Densidad Kernel ")},
+    "RGB_LANDSAT": {"multibanda": True}
+}
+
+# Plantillas QML ya generadas en esta sesión (producto -> ruta)
+_plantillas = {}
+
+def firma_estilo(producto):
+    """Firma de la definición de estilo de un producto (cambia si se editan las paradas)."""
+    definicion = json.dumps(estilos_producto[producto], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(definicion.encode("utf-8")).hexdigest()[:8]
+
+def crear_renderer(layer, estilo):
+    """Crea el renderer de pseudocolor de una capa a partir de la definición de estilo."""
+    items = [QgsColorRampShader.ColorRampItem(valor, QColor(*color), etiqueta or str(valor))
+             for valor, color, etiqueta in estilo["paradas"]]
+    color_ramp_shader = QgsColorRampShader()
+    color_ramp_shader.setColorRampType(QgsColorRampShader.Interpolated)
+    color_ramp_shader.setColorRampItemList(items)
+    raster_shader = QgsRasterShader()
+    raster_shader.setRasterShaderFunction(color_ramp_shader)
+    renderer = QgsSingleBandPseudoColorRenderer(layer.dataProvider(), 1, raster_shader)
+    renderer.setClassificationMin(items[0].value)
+    renderer.setClassificationMax(items[-1].value)
+    renderer.setOpacity(estilo.get("opacidad", 1.0))
+    return renderer
+
+def plantilla_qml(producto, layer, carpeta=None):
+    """Devuelve la plantilla QML del producto; la genera una sola vez a partir de la primera capa."""
+    if producto in _plantillas:
+        return _plantillas[producto]
+    carpeta = carpeta or carpeta_estilos
+    os.makedirs(carpeta, exist_ok=True)
+    qml_path = os.path.join(carpeta, f"{producto}_{firma_estilo(producto)}.qml")
+    if not os.path.exists(qml_path):
+        layer.setRenderer(crear_renderer(layer, estilos_producto[producto]))
+        mensaje, ok = layer.saveNamedStyle(qml_path)
+        if not ok:
+            informar(f"No se pudo guardar la plantilla {qml_path}: {mensaje}", "error")
+            return None
+    _plantillas[producto] = qml_path
+    return qml_path
+
+def reescalar_estilo(layer, ruta, estilo):
+    """Ajusta una rampa relativa al rango de la capa (mínimo/máximo aproximado con GDAL, sin leer toda la imagen)."""
+    ds = gdal.Open(ruta)
+    if ds is None:
+        return
+    band = ds.GetRasterBand(1)
+    min_value, max_value = band.ComputeRasterMinMax(True)
+    # QGIS muestra los productos en int16 con su escala aplicada: la rampa va en valores reales
+    escala, desplazamiento = band.GetScale() or 1.0, band.GetOffset() or 0.0
+    min_value, max_value = min_value * escala + desplazamiento, max_value * escala + desplazamiento
+    band = None
+    ds = None
+
+    renderer = layer.renderer()
+    color_ramp_shader = renderer.shader().rasterShaderFunction()
+    items = []
+    for item, (fraccion, _, etiqueta) in zip(color_ramp_shader.colorRampItemList(), estilo["paradas"]):
+        valor = min_value + (max_value - min_value) * fraccion
+        if etiqueta is None:
+            etiqueta = estilo.get("etiqueta", "{}").format(valor)
+        items.append(QgsColorRampShader.ColorRampItem(valor, item.color, etiqueta))
+    color_ramp_shader.setColorRampItemList(items)
+    renderer.setClassificationMin(min_value)
+    renderer.setClassificationMax(max_value)
+
+def anio_de_ruta(ruta):
+    """Año de un resultado a partir de su nombre o de sus carpetas."""
+    partes = [os.path.basename(ruta)] + os.path.normpath(os.path.dirname(ruta)).split(os.sep)[::-1]
+    for parte in partes:
+        fecha = fecha_desde_nombre(parte)
+        if fecha:
+            return fecha[:4]
+    for parte in partes:
+        if parte.isdigit() and len(parte) == 4:
+            return parte
+    return "Sin fecha"
+
+def _grupo(padre, nombre):
+    grupo = padre.findGroup(nombre)
+    if grupo is None:
+        grupo = padre.addGroup(nombre)
+        grupo.setExpanded(False)
+    return grupo
+
+@instrumentar("ensamblar_proyecto")
+def ensamblar_proyecto(salidas, proyecto=None, ocultas=False, diferidas=False, carpeta=None):
+    """Agrega de una vez los resultados al proyecto, agrupados por producto y año.
+
+    `salidas` es un diccionario producto -> lista de rasters. Cada capa carga la
+    plantilla QML de su producto en lugar de construir su propio shader, y todas se
+    registran con una sola llamada a addMapLayers antes de insertarlas en el árbol.
+    Con `ocultas` las capas se agregan apagadas; con `diferidas` no se carga el estilo
+    por defecto ni se valida el SRC de cada archivo, y el proyecto confía en los
+    metadatos de las capas al reabrirse. Devuelve la lista de capas agregadas.
+    """
+    proyecto = proyecto or QgsProject.instance()
+    opciones = QgsRasterLayer.LayerOptions()
+    if diferidas:
+        opciones.loadDefaultStyle = False
+        opciones.skipCrsValidation = True
+        proyecto.setTrustLayerMetadata(True)
+
+    capas = []
+    for producto, rutas in salidas.items():
+        if producto not in estilos_producto:
+            informar(f"Producto sin estilo registrado: {producto}", "aviso")
+            continue
+        estilo = estilos_producto[producto]
+        for ruta in rutas:
+            nombre = os.path.splitext(os.path.basename(ruta))[0]
+            if "nombre" in estilo and nombre.startswith(estilo["nombre"][0]):
+                nombre = estilo["nombre"][1] + nombre[len(estilo["nombre"][0]):]
+            layer = QgsRasterLayer(ruta, nombre, "gdal", opciones)
+            if not layer.isValid():
+                informar(f"Error al cargar la capa {ruta}", "error")
+                continue
+            if estilo.get("multibanda"):
+                # Los bytes ya traen el realce por percentiles: rojo, verde y azul sin estiramiento
+                layer.setRenderer(QgsMultiBandColorRenderer(layer.dataProvider(), 1, 2, 3))
+            else:
+                qml_path = plantilla_qml(producto, layer, carpeta)
+                if qml_path:
+                    layer.loadNamedStyle(qml_path)
+            if estilo.get("relativo"):
+                reescalar_estilo(layer, ruta, estilo)
+            capas.append((producto, anio_de_ruta(ruta), layer))
+
+    if not capas:
+        return []
+    proyecto.addMapLayers([layer for _, _, layer in capas], False)
+
+    raiz = _grupo(proyecto.layerTreeRoot(), grupo_resultados)
+    for producto, anio, layer in sorted(capas, key=lambda c: (c[0], c[1], c[2].name())):
+        nodo = _grupo(_grupo(raiz, producto), anio).addLayer(layer)
+        nodo.setItemVisibilityChecked(not ocultas)
+
+    informar(f"Capas agregadas al proyecto: {len(capas)}")
+    return [layer for _, _, layer in capas]
+
+@instrumentar("escribir_qgz")
+def escribir_qgz(salidas, qgz_path, epsg=32721, ocultas=True, diferidas=True, carpeta=None):
+    """Arma un proyecto nuevo con los resultados y lo guarda como .qgz sin interfaz gráfica."""
+    proyecto = QgsProject()
+    proyecto.setCrs(QgsCoordinateReferenceSystem(f"EPSG:{epsg}"))
+    ensamblar_proyecto(salidas, proyecto, ocultas, diferidas, carpeta)
+    if not proyecto.write(qgz_path):
+        informar(f"No se pudo guardar el proyecto: {qgz_path}", "error")
+        return None
+    informar(f"Proyecto guardado en: {qgz_path}")
+    return qgz_path
+
+if __name__ == "__main__":
+    # Patrones de los resultados de cada producto (se admiten comodines recursivos **)
+    from CONFIGURACION import ruta
+    patrones = {
+        "LST": [os.path.join(ruta("landsat_lst"), "**", "LST_*.tif")],
+        "NDVI_LANDSAT": [os.path.join(ruta("landsat_ndvi"), "**", "NDVI_*.tif")],
+        "KERNEL": [os.path.join(ruta("kernel"), "**", "resultados", "KERNEL_*.tif")]
+    }
+    proyecto_qgz = ruta("proyecto_qgz")
+
+    salidas = {producto: sorted(ruta for patron in lista for ruta in glob.glob(patron, recursive=True))
+               for producto, lista in patrones.items()}
+
+    app = None
+    if QgsApplication.instance() is None:
+        app = QgsApplication([], False)
+        app.initQgis()
+    escribir_qgz(salidas, proyecto_qgz)
+    if app is not None:
+        app.exitQgis()
@@ -0,0 +1,190 @@
+import os
+import csv
+import glob
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from osgeo import gdal, ogr
+from MASCARA_AOI import firma_rejilla
+from CATALOGO_SATELITAL import fecha_desde_nombre
+from INSTRUMENTACION import etapa, instrumentar, informar, resumen
+from CODIFICACION import leer_banda
+
+# Percentiles que se calculan por zona (interpolación lineal, como numpy.percentile)
+percentiles = (10, 50, 90)
+
+# Rasters leídos y resumidos a la vez (la lectura domina; numpy libera el GIL)
+hilos_lectura = 4
+
+# Etiquetas ya rasterizadas en esta sesión ((shapefile, mtime, campo, firma) -> etiquetas)
+_etiquetas_en_memoria = {}
+_lock = threading.Lock()
+
+@instrumentar("rasterizar_zonas")
+def rasterizar_zonas(zonas_shp, proyeccion, geotransform, n_cols, n_rows, campo_id=None):
+    """Rasteriza los polígonos de zonas como etiquetas enteras (0 fuera, i + 1 dentro de la zona i).
+
+    Devuelve (etiquetas, nombres de las zonas).
+    """
+    shp_ds = ogr.Open(zonas_shp)
+    if shp_ds is None:
+        raise IOError(f"No se pudo abrir el shapefile de zonas: {zonas_shp}")
+    layer = shp_ds.GetLayer()
+
+    # Copia en memoria con la etiqueta de cada zona como atributo para quemarla con RasterizeLayer
+    driver = ogr.GetDriverByName("Memory") or ogr.GetDriverByName("MEM")
+    vector_ds = driver.CreateDataSource("zonas")
+    capa = vector_ds.CreateLayer("zonas", layer.GetSpatialRef(), ogr.wkbUnknown)
+    capa.CreateField(ogr.FieldDefn("etiqueta", ogr.OFTInteger))
+    nombres = []
+    for feature in layer:
+        geom = feature.GetGeometryRef()
+        if geom is None or geom.IsEmpty():
+            continue
+        nueva = ogr.Feature(capa.GetLayerDefn())
+        nueva.SetGeometry(geom.Clone())
+        nueva.SetField("etiqueta", len(nombres) + 1)
+        capa.CreateFeature(nueva)
+        nombres.append(feature.GetField(campo_id) if campo_id else feature.GetFID())
+
+    mem_ds = gdal.GetDriverByName("MEM").Create("", n_cols, n_rows, 1, gdal.GDT_Int32)
+    mem_ds.SetProjection(proyeccion)
+    mem_ds.SetGeoTransform(geotransform)
+    # RasterizeLayer reproyecta las geometrías si el SRC del shapefile es distinto
+    gdal.RasterizeLayer(mem_ds, [1], capa, options=["ATTRIBUTE=etiqueta"])
+    etiquetas = mem_ds.GetRasterBand(1).ReadAsArray()
+    mem_ds = None
+    vector_ds = None
+    shp_ds = None
+    return etiquetas, nombres
+
+def obtener_etiquetas(zonas_shp, proyeccion, geotransform, n_cols, n_rows, campo_id=None):
+    """Etiquetas de zona de una rejilla, preparadas para resumir cualquier raster de esa rejilla.
+
+    Se rasterizan una sola vez por rejilla. Devuelve un diccionario con los nombres de las
+    zonas, los índices (aplanados) de los píxeles dentro de alguna zona ordenados por zona,
+    la etiqueta de cada uno de esos píxeles y el número de zonas.
+    """
+    firma = firma_rejilla(proyeccion, geotransform, n_cols, n_rows)
+    clave = (os.path.abspath(zonas_shp), os.path.getmtime(zonas_shp), campo_id, firma)
+    with _lock:
+        if clave not in _etiquetas_en_memoria:
+            etiquetas, nombres = rasterizar_zonas(zonas_shp, proyeccion, geotransform, n_cols, n_rows, campo_id)
+            planas = etiquetas.ravel()
+            pixeles = np.flatnonzero(planas > 0)
+            pixeles = pixeles[np.argsort(planas[pixeles], kind="stable")]
+            _etiquetas_en_memoria[clave] = {"nombres": nombres, "pixeles": pixeles,
+                                            "etiquetas": planas[pixeles] - 1, "n_zonas": len(nombres)}
+        return _etiquetas_en_memoria[clave]
+
+def estadisticas_array(valores, etiquetas, n_zonas, nodata=None, percentiles=percentiles):
+    """Estadísticos por zona de valores ya agrupados por zona (etiquetas ordenadas de 0 a n_zonas - 1).
+
+    Conteo, suma y suma de cuadrados salen de bincount; mínimo, máximo y percentiles de un
+    único ordenamiento por (zona, valor). Devuelve un diccionario estadístico -> array por zona.
+    """
+    validos = np.isfinite(valores)
+    if nodata is not None and not np.isnan(nodata):
+        validos &= valores != nodata
+    etiquetas = etiquetas[validos]
+    valores = valores[validos].astype(np.float64)
+
+    n = np.bincount(etiquetas, minlength=n_zonas)
+    suma = np.bincount(etiquetas, weights=valores, minlength=n_zonas)
+    suma_cuadrados = np.bincount(etiquetas, weights=valores * valores, minlength=n_zonas)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        media = suma / n
+        desvio = np.sqrt(np.maximum(suma_cuadrados / n - media * media, 0))
+
+    # Las etiquetas ya vienen ordenadas: basta ordenar los valores dentro de cada zona
+    ordenados = valores[np.lexsort((valores, etiquetas))]
+    inicio = np.cumsum(n) - n
+    con_datos = n > 0
+    resultado = {"n": n, "media": media, "minimo": np.full(n_zonas, np.nan), "maximo": np.full(n_zonas, np.nan),
+                 "desvio": desvio}
+    resultado["minimo"][con_datos] = ordenados[inicio[con_datos]]
+    resultado["maximo"][con_datos] = ordenados[inicio[con_datos] + n[con_datos] - 1]
+    for p in percentiles:
+        posicion = (n[con_datos] - 1) * (p / 100)
+        abajo = np.floor(posicion).astype(np.int64)
+        arriba = np.minimum(abajo + 1, n[con_datos] - 1)
+        bajo = ordenados[inicio[con_datos] + abajo]
+        valor = np.full(n_zonas, np.nan)
+        valor[con_datos] = bajo + (ordenados[inicio[con_datos] + arriba] - bajo) * (posicion - abajo)
+        resultado[f"p{p}"] = valor
+    return resultado
+
+def resumir_raster(producto, raster_path, zonas_shp, campo_id=None, percentiles=percentiles):
+    """Filas de la tabla larga de un raster: una por banda (corte de la serie) y zona."""
+    ds = gdal.Open(raster_path)
+    if ds is None:
+        informar(f"No se pudo abrir el raster: {raster_path}", "error")
+        return []
+    zonas = obtener_etiquetas(zonas_shp, ds.GetProjection(), ds.GetGeoTransform(),
+                              ds.RasterXSize, ds.RasterYSize, campo_id)
+    # En una serie apilada (VRT) cada banda viene de un archivo: la fecha se toma de su nombre
+    fuentes = ds.GetFileList() or []
+    por_banda = ds.RasterCount > 1 and len(fuentes) == ds.RasterCount + 1
+
+    filas = []
+    for b in range(1, ds.RasterCount + 1):
+        band = ds.GetRasterBand(b)
+        # Solo se desescalan los píxeles de las zonas (productos en int16)
+        valores = leer_banda(band, pixeles=zonas["pixeles"])
+        estadisticas = estadisticas_array(valores, zonas["etiquetas"], zonas["n_zonas"], None, percentiles)
+        nombre_fuente = os.path.basename(fuentes[b] if por_banda else raster_path)
+        fecha = fecha_desde_nombre(nombre_fuente)
+        for i, nombre in enumerate(zonas["nombres"]):
+            fila = {"producto": producto, "raster": raster_path, "banda": b, "fecha": fecha, "zona": i, "nombre": nombre}
+            fila.update({clave: valores_zona[i] for clave, valores_zona in estadisticas.items()})
+            filas.append(fila)
+    ds = None
+    return filas
+
+def estadisticas_zonales(rasters, zonas_shp, campo_id=None, percentiles=percentiles, hilos=hilos_lectura):
+    """Resume por zona todos los rasters (producto -> lista de rutas) y devuelve la tabla larga."""
+    tareas = [(producto, ruta) for producto, rutas in rasters.items() for ruta in rutas]
+    with etapa("estadisticas_zonales", rasters=len(tareas)) as medicion:
+        with ThreadPoolExecutor(max_workers=hilos) as executor:
+            partes = executor.map(lambda t: resumir_raster(t[0], t[1], zonas_shp, campo_id, percentiles), tareas)
+            filas = [fila for parte in partes for fila in parte]
+        medicion["filas"] = len(filas)
+    return filas
+
+def guardar_tabla(filas, csv_path):
+    """Escribe la tabla larga como CSV (una fila por raster, banda y zona)."""
+    if not filas:
+        informar("No hay estadísticas zonales que guardar.", "aviso")
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(csv_path)), exist_ok=True)
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.DictWriter(f, fieldnames=list(filas[0]))
+        escritor.writeheader()
+        for fila in filas:
+            escritor.writerow({clave: round(float(valor), 6) if isinstance(valor, (float, np.floating)) else valor
+                               for clave, valor in fila.items()})
+    informar(f"Estadísticas zonales guardadas en: {csv_path} ({len(filas)} filas)")
+    return csv_path
+
+if __name__ == "__main__":
+    from CONFIGURACION import ruta
+
+    # Zonas (uno o varios distritos) y campo con su nombre (None usa el FID)
+    zonas_shp = ruta("aoi")
+    campo_zona = None
+
+    # Patrones de los resultados de cada producto (se omiten los recortes, que repiten los valores,
+    # y los rasters de fecha del máximo de los compuestos)
+    patrones = {
+        "LST_MODIS": os.path.join(ruta("modis_terra"), "**", "LST", "LST_*.tif"),
+        "LST_LANDSAT": os.path.join(ruta("landsat_lst"), "**", "LST_*.tif"),
+        "NDVI_MODIS": os.path.join(ruta("modis_aqua"), "**", "NDVI_*.tif"),
+        "NDVI_LANDSAT": os.path.join(ruta("landsat_ndvi"), "**", "NDVI_*.tif"),
+        "KERNEL": os.path.join(ruta("kernel"), "**", "resultados", "KERNEL_*.tif")
+    }
+    excluidos = ("_BENJAMIN_ACEVAL.tif", "_FECHA.tif")
+    rasters = {producto: sorted(r for r in glob.glob(patron, recursive=True) if not r.endswith(excluidos))
+               for producto, patron in patrones.items()}
+
+    guardar_tabla(estadisticas_zonales(rasters, zonas_shp, campo_zona), ruta("estadisticas_zonales"))
+    resumen()
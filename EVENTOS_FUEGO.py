@@ -0,0 +1,250 @@
+import os
+import csv
+from datetime import date, datetime
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from osgeo import ogr, osr
+from CATALOGO_SATELITAL import actualizar_catalogo, consultar
+from INSTRUMENTACION import etapa, anotar, informar, resumen
+from REJILLAS import orden_tradicional, srs_epsg
+
+# Distancia máxima entre focos vecinos de un mismo evento (metros) y separación máxima en días
+eps_metros = 1500
+eps_dias = 2
+
+# Vecinos (incluido el propio foco) que necesita un foco para ser núcleo de un evento (1 = todos lo son)
+minimo_focos = 1
+
+# Campos de fecha y potencia radiativa (FRP) de los focos, en orden de preferencia
+campos_fecha = ("ACQ_DATE", "acq_date", "FECHA", "fecha")
+campos_frp = ("FRP", "frp")
+
+# Formatos de los campos de fecha de texto (FIRMS usa AAAA-MM-DD; otras exportaciones, DD/MM/AAAA)
+formatos_fecha = ("%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%Y%m%d")
+
+def _primer_campo(layer, candidatos):
+    nombres = [layer.GetLayerDefn().GetFieldDefn(i).GetName() for i in range(layer.GetLayerDefn().GetFieldCount())]
+    return next((c for c in candidatos if c in nombres), None)
+
+def dia_de_campo(feature, campo):
+    """Día ordinal del campo de fecha de un foco (tipo fecha de OGR o texto en `formatos_fecha`); None si no se entiende."""
+    indice = feature.GetFieldIndex(campo)
+    if feature.GetFieldDefnRef(indice).GetType() in (ogr.OFTDate, ogr.OFTDateTime):
+        anio, mes, dia = feature.GetFieldAsDateTime(indice)[:3]
+        try:
+            return date(anio, mes, dia).toordinal()
+        except ValueError:
+            return None
+    texto = str(feature.GetField(indice)).strip()[:10]
+    for formato in formatos_fecha:
+        try:
+            return datetime.strptime(texto, formato).date().toordinal()
+        except ValueError:
+            continue
+    return None
+
+def leer_focos(path, fecha_defecto=None, epsg=32721):
+    """Lee los focos de un shapefile o GeoPackage: coordenadas en el SRC de trabajo, día y FRP.
+
+    El día sale del campo de fecha de adquisición o, si no existe, de la fecha de la carpeta;
+    los focos con una fecha que no se puede interpretar se omiten y se informan. Devuelve (x, y, dia ordinal, frp) como arrays; el FRP es NaN si la capa no lo tiene.
+    """
+    ds = ogr.Open(path)
+    if ds is None:
+        raise IOError(f"No se pudo abrir la capa de focos: {path}")
+    layer = ds.GetLayer()
+    srs = layer.GetSpatialRef()
+    transformacion = None
+    if srs is not None:
+        srs = orden_tradicional(srs)
+        if not srs.IsSame(srs_epsg(epsg)):
+            transformacion = osr.CoordinateTransformation(srs, srs_epsg(epsg))
+    campo_fecha = _primer_campo(layer, campos_fecha)
+    campo_frp = _primer_campo(layer, campos_frp)
+    dia_defecto = date.fromisoformat(fecha_defecto[:10]).toordinal() if fecha_defecto else None
+
+    xy, dias, frp = [], [], []
+    ilegibles, ejemplo = 0, None
+    for feature in layer:
+        geom = feature.GetGeometryRef()
+        if geom is None or geom.IsEmpty():
+            continue
+        dia = dia_defecto
+        if campo_fecha and feature.IsFieldSetAndNotNull(campo_fecha):
+            dia = dia_de_campo(feature, campo_fecha)
+            if dia is None:
+                ilegibles += 1
+                ejemplo = ejemplo or feature.GetField(campo_fecha)
+                continue
+        if dia is None:
+            continue
+        xy.append((geom.GetX(), geom.GetY()))
+        dias.append(dia)
+        frp.append(feature.GetField(campo_frp) if campo_frp and feature.IsFieldSetAndNotNull(campo_frp) else np.nan)
+    ds = None
+    if ilegibles:
+        informar(f"{ilegibles} focos de {path} con fecha ilegible en {campo_fecha} (por ejemplo '{ejemplo}'); se omiten.",
+                 "aviso", omitidos=ilegibles)
+
+    xy = np.array(xy, dtype=np.float64).reshape(-1, 2)
+    if transformacion is not None and len(xy):
+        xy = np.array(transformacion.TransformPoints(xy.tolist()))[:, :2]
+    return xy[:, 0], xy[:, 1], np.array(dias, dtype=np.int64), np.array(frp, dtype=np.float64)
+
+def _por_evento(ufunc, valores, eventos, n_eventos):
+    """Reduce los valores de cada evento (todos con al menos un foco) con ufunc.reduceat."""
+    orden = np.argsort(eventos, kind="stable")
+    focos = np.bincount(eventos, minlength=n_eventos)
+    return ufunc.reduceat(valores[orden], np.cumsum(focos) - focos)
+
+def agrupar_eventos(x, y, dias, eps_m=eps_metros, eps_d=eps_dias, minimo=minimo_focos):
+    """Agrupa los focos en eventos (DBSCAN con distancia en metros y separación en días).
+
+    Dos focos son vecinos si están a menos de `eps_m` metros y `eps_d` días. Los vecinos se
+    buscan con un KD-tree sobre coordenadas escaladas (x / eps_m, y / eps_m, día / eps_d),
+    nunca con todas las distancias, y los eventos son las componentes conexas de los focos
+    núcleo; los demás se asignan al evento de un núcleo vecino o quedan en -1 (ruido).
+    Devuelve (evento de cada foco, número de eventos).
+    """
+    n = len(x)
+    if n == 0:
+        return np.empty(0, dtype=np.int64), 0
+    escalados = np.column_stack((x / eps_m, y / eps_m, dias / eps_d))
+    pares = cKDTree(escalados).query_pairs(1.0, p=np.inf, output_type="ndarray")
+    # La caja de Chebyshev cubre el tiempo; en el espacio se exige la distancia euclídea
+    dx = escalados[pares[:, 0], 0] - escalados[pares[:, 1], 0]
+    dy = escalados[pares[:, 0], 1] - escalados[pares[:, 1], 1]
+    pares = pares[dx * dx + dy * dy <= 1.0]
+    anotar(focos=n, pares=len(pares))
+
+    vecinos = np.bincount(pares.ravel(), minlength=n) + 1
+    nucleo = vecinos >= minimo
+    entre_nucleos = pares[nucleo[pares[:, 0]] & nucleo[pares[:, 1]]]
+    grafo = coo_matrix((np.ones(len(entre_nucleos), dtype=np.int8), (entre_nucleos[:, 0], entre_nucleos[:, 1])),
+                       shape=(n, n))
+    _, componentes = connected_components(grafo, directed=False)
+
+    eventos = np.full(n, -1, dtype=np.int64)
+    eventos[nucleo] = componentes[nucleo]
+    # Focos de borde: toman el evento de algún núcleo vecino
+    for a, b in ((0, 1), (1, 0)):
+        borde = ~nucleo[pares[:, a]] & nucleo[pares[:, b]]
+        eventos[pares[borde, a]] = eventos[pares[borde, b]]
+
+    # Numerar los eventos de 0 a n_eventos - 1 en orden de inicio
+    validos = eventos >= 0
+    unicos, eventos[validos] = np.unique(eventos[validos], return_inverse=True)
+    if len(unicos) == 0:
+        return eventos, 0
+    inicio = _por_evento(np.minimum, dias[validos], eventos[validos], len(unicos))
+    orden = np.empty(len(unicos), dtype=np.int64)
+    orden[np.lexsort((np.arange(len(unicos)), inicio))] = np.arange(len(unicos))
+    eventos[validos] = orden[eventos[validos]]
+    return eventos, len(unicos)
+
+def tabla_eventos(x, y, dias, frp, eventos, n_eventos):
+    """Una fila por evento: inicio, fin, duración, focos, FRP total, centroide y área de la envolvente convexa."""
+    if n_eventos == 0:
+        return []
+    validos = eventos >= 0
+    e, x, y, dias, frp = eventos[validos], x[validos], y[validos], dias[validos], frp[validos]
+    focos = np.bincount(e, minlength=n_eventos)
+    frp_total = np.bincount(e, weights=np.nan_to_num(frp), minlength=n_eventos)
+    x_medio = np.bincount(e, weights=x, minlength=n_eventos) / np.maximum(focos, 1)
+    y_medio = np.bincount(e, weights=y, minlength=n_eventos) / np.maximum(focos, 1)
+    inicio = _por_evento(np.minimum, dias, e, n_eventos)
+    fin = _por_evento(np.maximum, dias, e, n_eventos)
+
+    # Envolvente convexa de cada evento con OGR (los focos de cada evento quedan contiguos)
+    orden = np.argsort(e, kind="stable")
+    cortes = np.cumsum(focos)[:-1]
+    filas = []
+    for i, indices in enumerate(np.split(orden, cortes)):
+        area_ha = 0.0
+        if len(indices) >= 3:
+            multipunto = ogr.Geometry(ogr.wkbMultiPoint)
+            for px, py in zip(x[indices], y[indices]):
+                punto = ogr.Geometry(ogr.wkbPoint)
+                punto.AddPoint_2D(float(px), float(py))
+                multipunto.AddGeometry(punto)
+            area_ha = multipunto.ConvexHull().GetArea() / 10000
+        filas.append({"evento": i, "inicio": date.fromordinal(int(inicio[i])).isoformat(),
+                      "fin": date.fromordinal(int(fin[i])).isoformat(), "dias": int(fin[i] - inicio[i] + 1),
+                      "focos": int(focos[i]), "frp_total": round(float(frp_total[i]), 2),
+                      "x": round(float(x_medio[i]), 1), "y": round(float(y_medio[i]), 1), "area_ha": round(area_ha, 2)})
+    return filas
+
+def guardar_eventos(filas, csv_path):
+    """Escribe la tabla de eventos como CSV."""
+    os.makedirs(os.path.dirname(os.path.abspath(csv_path)), exist_ok=True)
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.DictWriter(f, fieldnames=["evento", "inicio", "fin", "dias", "focos", "frp_total", "x", "y",
+                                                 "area_ha"])
+        escritor.writeheader()
+        escritor.writerows(filas)
+    return csv_path
+
+def guardar_focos_eventos(x, y, dias, frp, eventos, gpkg_path, epsg=32721):
+    """Guarda los focos con el evento asignado (-1 = sin evento) como GeoPackage de puntos."""
+    if os.path.exists(gpkg_path):
+        os.remove(gpkg_path)
+    ds = ogr.GetDriverByName("GPKG").CreateDataSource(gpkg_path)
+    layer = ds.CreateLayer("focos_eventos", srs_epsg(epsg), ogr.wkbPoint)
+    layer.CreateField(ogr.FieldDefn("evento", ogr.OFTInteger))
+    layer.CreateField(ogr.FieldDefn("fecha", ogr.OFTDate))
+    layer.CreateField(ogr.FieldDefn("frp", ogr.OFTReal))
+    definicion = layer.GetLayerDefn()
+    ds.StartTransaction()
+    for px, py, dia, potencia, evento in zip(x, y, dias, frp, eventos):
+        feature = ogr.Feature(definicion)
+        punto = ogr.Geometry(ogr.wkbPoint)
+        punto.AddPoint_2D(float(px), float(py))
+        feature.SetGeometry(punto)
+        feature.SetField("evento", int(evento))
+        feature.SetField("fecha", date.fromordinal(int(dia)).isoformat())
+        if np.isfinite(potencia):
+            feature.SetField("frp", float(potencia))
+        layer.CreateFeature(feature)
+    ds.CommitTransaction()
+    ds = None
+    return gpkg_path
+
+def cargar_archivo_focos(base_directory):
+    """Lee todos los focos del catálogo (una capa por carpeta de fecha) y los concatena."""
+    catalogo_db = actualizar_catalogo(base_directory)
+    carpetas_procesadas = set()
+    partes = []
+    for registro in consultar(catalogo_db, producto="HOTSPOTS", raiz=base_directory):
+        date_path = os.path.dirname(registro["ruta"])
+        if date_path in carpetas_procesadas:
+            continue
+        carpetas_procesadas.add(date_path)
+        partes.append(leer_focos(registro["ruta"], registro.get("fecha")))
+    if not partes:
+        return tuple(np.empty(0) for _ in range(4))
+    return tuple(np.concatenate(columna) for columna in zip(*partes))
+
+if __name__ == "__main__":
+    from CONFIGURACION import ruta
+
+    # Directorio base de los focos (carpetas de fecha) y carpeta de salida
+    base_directory = ruta("kernel")
+    output_directory = ruta("eventos")
+
+    with etapa("leer_focos_archivo") as medicion:
+        x, y, dias, frp = cargar_archivo_focos(base_directory)
+        medicion["focos"] = len(x)
+    with etapa("agrupar_eventos"):
+        eventos, n_eventos = agrupar_eventos(x, y, dias.astype(np.int64))
+    informar(f"Focos: {len(x)}, eventos: {n_eventos}, focos sin evento: {int(np.count_nonzero(eventos < 0))}",
+             focos=len(x), eventos=n_eventos)
+
+    os.makedirs(output_directory, exist_ok=True)
+    with etapa("guardar_eventos", salida=os.path.join(output_directory, "EVENTOS.csv")):
+        filas = tabla_eventos(x, y, dias.astype(np.int64), frp, eventos, n_eventos)
+        guardar_eventos(filas, os.path.join(output_directory, "EVENTOS.csv"))
+        guardar_focos_eventos(x, y, dias, frp, eventos, os.path.join(output_directory, "FOCOS_EVENTOS.gpkg"))
+    informar(f"Eventos guardados en: {output_directory}")
+    resumen()
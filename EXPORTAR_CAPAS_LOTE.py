@@ -0,0 +1,183 @@
+import os
+import shutil
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from osgeo import ogr, osr
+from CONFIGURACION import ruta
+from REJILLAS import orden_tradicional, srs_epsg
+from INSTRUMENTACION import instrumentar, informar, resumen
+
+# Directorio con los shapefiles a reproyectar (se recorre de forma recursiva)
+directorio_entrada = ruta("kernel")
+
+# SRC de salida y SRC supuesto para los shapefiles sin .prj
+epsg_salida = 32721
+epsg_por_defecto = 4326
+
+# Carpeta donde se archivan los originales (None para no archivarlos)
+carpeta_originales = ruta("originales_epsg4326")
+
+# Eliminar los originales después de verificar la exportación
+eliminar_originales = False
+
+# Número de procesos (None usa todos los núcleos, 1 procesa en serie)
+procesos = None
+
+# Archivos asociados a un shapefile
+extensiones_shapefile = [".shp", ".shx", ".dbf", ".prj", ".cpg", ".qpj", ".sbn", ".sbx", ".shp.xml"]
+
+def buscar_shapefiles(directorio):
+    """Devuelve los shapefiles del árbol de directorios que todavía no fueron reproyectados."""
+    shapefiles = []
+    for carpeta, subcarpetas, archivos in os.walk(directorio):
+        if carpeta_originales and os.path.abspath(carpeta).startswith(os.path.abspath(carpeta_originales)):
+            continue
+        for archivo in archivos:
+            if archivo.lower().endswith(".shp") and f"_EPSG{epsg_salida}" not in archivo:
+                shapefiles.append(os.path.join(carpeta, archivo))
+    return sorted(shapefiles)
+
+def transformar_coordenadas(coordenadas, transformacion):
+    """Transforma un array (n, 2) de coordenadas en una sola llamada."""
+    if len(coordenadas) == 0:
+        return coordenadas
+    return np.array(transformacion.TransformPoints(coordenadas.tolist()))[:, :2]
+
+def reproyectar_shapefile(shp_path, epsg=epsg_salida):
+    """Reproyecta un shapefile a un GeoPackage con índice espacial R-tree.
+
+    Las capas de puntos se transforman con un único array de coordenadas; el resto de
+    geometrías se transforman entidad por entidad. Devuelve un diccionario con el resultado.
+    """
+    gpkg_path = os.path.splitext(shp_path)[0] + f"_EPSG{epsg}.gpkg"
+    src_ds = ogr.Open(shp_path)
+    if src_ds is None:
+        return {"origen": shp_path, "salida": None, "error": "No se pudo abrir el shapefile"}
+    src_layer = src_ds.GetLayer()
+    src_srs = src_layer.GetSpatialRef()
+    src_srs = orden_tradicional(src_srs) if src_srs is not None else srs_epsg(epsg_por_defecto)
+    dst_srs = srs_epsg(epsg)
+    transformacion = osr.CoordinateTransformation(src_srs, dst_srs)
+
+    geom_type = src_layer.GetGeomType()
+    es_puntos = ogr.GT_Flatten(geom_type) == ogr.wkbPoint
+    layer_defn = src_layer.GetLayerDefn()
+
+    # Leer atributos y geometrías de una vez
+    atributos, geometrias = [], []
+    for feature in src_layer:
+        atributos.append([feature.GetField(i) for i in range(layer_defn.GetFieldCount())])
+        geom = feature.GetGeometryRef()
+        geometrias.append(geom.Clone() if geom is not None else None)
+
+    if es_puntos:
+        validos = [i for i, g in enumerate(geometrias) if g is not None and not g.IsEmpty()]
+        coordenadas = np.array([(geometrias[i].GetX(), geometrias[i].GetY()) for i in validos], dtype=np.float64).reshape(-1, 2)
+        transformadas = transformar_coordenadas(coordenadas, transformacion)
+        for i, (x, y) in zip(validos, transformadas):
+            punto = ogr.Geometry(ogr.wkbPoint)
+            punto.AddPoint_2D(float(x), float(y))
+            geometrias[i] = punto
+    else:
+        for geom in geometrias:
+            if geom is not None:
+                geom.Transform(transformacion)
+
+    # Escribir el GeoPackage dentro de una transacción
+    driver = ogr.GetDriverByName("GPKG")
+    if os.path.exists(gpkg_path):
+        driver.DeleteDataSource(gpkg_path)
+    dst_ds = driver.CreateDataSource(gpkg_path)
+    nombre_capa = os.path.splitext(os.path.basename(gpkg_path))[0]
+    dst_layer = dst_ds.CreateLayer(nombre_capa, dst_srs, geom_type, options=["SPATIAL_INDEX=YES"])
+    for i in range(layer_defn.GetFieldCount()):
+        dst_layer.CreateField(layer_defn.GetFieldDefn(i))
+
+    dst_defn = dst_layer.GetLayerDefn()
+    dst_layer.StartTransaction()
+    for valores, geom in zip(atributos, geometrias):
+        feature = ogr.Feature(dst_defn)
+        for i, valor in enumerate(valores):
+            if valor is not None:
+                feature.SetField(i, valor)
+        if geom is not None:
+            feature.SetGeometry(geom)
+        dst_layer.CreateFeature(feature)
+    dst_layer.CommitTransaction()
+    dst_ds = None
+
+    src_ds = None
+    return {"origen": shp_path, "salida": gpkg_path, "entidades": len(atributos), "error": None}
+
+def verificar_exportacion(resultado, epsg=epsg_salida):
+    """Comprueba el GeoPackage exportado (entidades, SRC, extensión e índice) antes de tocar el original."""
+    dst_ds = ogr.Open(resultado["salida"])
+    if dst_ds is None:
+        return "No se pudo abrir el GeoPackage exportado"
+    layer = dst_ds.GetLayer()
+    if layer.GetFeatureCount() != resultado["entidades"]:
+        return f"Entidades distintas: {layer.GetFeatureCount()} exportadas de {resultado['entidades']}"
+    srs = layer.GetSpatialRef()
+    if srs is None or srs.GetAuthorityCode(None) != str(epsg):
+        return "El SRC del GeoPackage no es el esperado"
+    if resultado["entidades"] > 0:
+        extension = layer.GetExtent()
+        if not all(np.isfinite(extension)):
+            return "La extensión del GeoPackage no es válida"
+    tabla_indice = f"rtree_{layer.GetName()}_{layer.GetGeometryColumn()}"
+    consulta = dst_ds.ExecuteSQL(f"SELECT 1 FROM sqlite_master WHERE name = '{tabla_indice}'")
+    tiene_indice = consulta is not None and consulta.GetFeatureCount() > 0
+    if consulta is not None:
+        dst_ds.ReleaseResultSet(consulta)
+    dst_ds = None
+    if not tiene_indice:
+        return "El GeoPackage no tiene índice espacial"
+    return None
+
+def archivar_o_eliminar_original(shp_path, directorio_base):
+    """Archiva (o elimina) todos los archivos asociados al shapefile original."""
+    base_name = os.path.splitext(shp_path)[0]
+    for ext in extensiones_shapefile:
+        archivo = base_name + ext
+        if not os.path.exists(archivo):
+            continue
+        if carpeta_originales:
+            destino = os.path.join(carpeta_originales, os.path.relpath(archivo, directorio_base))
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            shutil.move(archivo, destino)
+        elif eliminar_originales:
+            os.remove(archivo)
+
+@instrumentar("reproyectar_lote")
+def reproyectar_lote(directorio, epsg=epsg_salida, n_procesos=procesos):
+    """Reproyecta todos los shapefiles de un árbol de directorios en paralelo."""
+    shapefiles = buscar_shapefiles(directorio)
+    informar(f"Shapefiles encontrados: {len(shapefiles)}")
+
+    resultados = []
+    if n_procesos == 1:
+        resultados = [reproyectar_shapefile(shp, epsg) for shp in shapefiles]
+    else:
+        with ProcessPoolExecutor(max_workers=n_procesos) as executor:
+            futuros = [executor.submit(reproyectar_shapefile, shp, epsg) for shp in shapefiles]
+            for futuro in as_completed(futuros):
+                resultados.append(futuro.result())
+
+    exportados, errores = 0, 0
+    for resultado in sorted(resultados, key=lambda r: r["origen"]):
+        error = resultado["error"] or verificar_exportacion(resultado, epsg)
+        if error:
+            errores += 1
+            informar(f"Error al exportar {resultado['origen']}: {error}. El original se conserva.", "error")
+            continue
+        exportados += 1
+        informar(f"Exportación completada correctamente en: {resultado['salida']}")
+        if carpeta_originales or eliminar_originales:
+            archivar_o_eliminar_original(resultado["origen"], directorio)
+
+    informar(f"Proceso completado: {exportados} exportados, {errores} con errores.")
+    return resultados
+
+if __name__ == "__main__":
+    reproyectar_lote(directorio_entrada)
+    resumen()
@@ -0,0 +1,149 @@
+import numpy as np
+from osgeo import ogr, osr
+from REJILLAS import orden_tradicional, srs_epsg
+
+# Celdas por lado de la rejilla del índice preparado
+celdas_indice = 512
+
+# Máximo de comparaciones punto-arista evaluadas a la vez (limita la memoria)
+max_comparaciones = 4_000_000
+
+def cargar_zonas(zonas_shp, campo_id=None, epsg=32721):
+    """Lee los polígonos de zonas (uno o varios departamentos) en el SRC de trabajo.
+
+    Devuelve una lista de zonas con su nombre, sus anillos como arrays (n, 2) y su bbox.
+    """
+    shp_ds = ogr.Open(zonas_shp)
+    if shp_ds is None:
+        raise IOError(f"No se pudo abrir el shapefile de zonas: {zonas_shp}")
+    layer = shp_ds.GetLayer()
+    srs = layer.GetSpatialRef()
+    transformacion = None
+    if srs is not None:
+        transformacion = osr.CoordinateTransformation(orden_tradicional(srs), srs_epsg(epsg))
+
+    zonas = []
+    for feature in layer:
+        geom = feature.GetGeometryRef()
+        if geom is None or geom.IsEmpty():
+            continue
+        geom = geom.Clone()
+        if transformacion is not None:
+            geom.Transform(transformacion)
+
+        poligonos = [geom.GetGeometryRef(i) for i in range(geom.GetGeometryCount())] \
+            if ogr.GT_Flatten(geom.GetGeometryType()) == ogr.wkbMultiPolygon else [geom]
+        anillos = []
+        for poligono in poligonos:
+            for i in range(poligono.GetGeometryCount()):
+                anillo = poligono.GetGeometryRef(i)
+                anillos.append(np.array(anillo.GetPoints(), dtype=np.float64)[:, :2])
+
+        x_min, x_max, y_min, y_max = geom.GetEnvelope()
+        nombre = feature.GetField(campo_id) if campo_id else feature.GetFID()
+        zonas.append({"nombre": nombre, "anillos": anillos, "bbox": (x_min, y_min, x_max, y_max)})
+    shp_ds = None
+    return zonas
+
+def puntos_en_anillos(x, y, anillos):
+    """Prueba exacta punto en polígono (regla par-impar, los huecos quedan fuera), vectorizada."""
+    dentro = np.zeros(x.shape, dtype=bool)
+    if x.size == 0:
+        return dentro
+    paso = max(1, max_comparaciones // x.size)
+    xc, yc = x[:, None], y[:, None]
+    for anillo in anillos:
+        for inicio in range(0, len(anillo) - 1, paso):
+            tramo = anillo[inicio:inicio + paso + 1]
+            x1, y1 = tramo[:-1, 0], tramo[:-1, 1]
+            x2, y2 = tramo[1:, 0], tramo[1:, 1]
+            cruza_y = (y1 > yc) != (y2 > yc)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x_corte = x1 + (yc - y1) * (x2 - x1) / (y2 - y1)
+            cruces = np.count_nonzero(cruza_y & (xc < x_corte), axis=1)
+            dentro ^= (cruces % 2).astype(bool)
+    return dentro
+
+def construir_indice(zonas, n_celdas=celdas_indice):
+    """Construye el índice preparado de las zonas.
+
+    Se usa una rejilla regular sobre la extensión de las zonas: las celdas que no tocan
+    ningún borde se clasifican de una vez (interior de una zona o exterior) y solo los
+    puntos que caen en celdas de borde necesitan la prueba exacta.
+    """
+    bboxes = np.array([z["bbox"] for z in zonas])
+    x_min, y_min = bboxes[:, 0].min(), bboxes[:, 1].min()
+    x_max, y_max = bboxes[:, 2].max(), bboxes[:, 3].max()
+    tamano = max(x_max - x_min, y_max - y_min) / n_celdas
+    n_cols = int(np.ceil((x_max - x_min) / tamano)) + 1
+    n_rows = int(np.ceil((y_max - y_min) / tamano)) + 1
+
+    # Marcar las celdas que atraviesan los bordes muestreando cada arista a medio tamaño de celda
+    borde = np.zeros((n_rows, n_cols), dtype=bool)
+    for zona in zonas:
+        for anillo in zona["anillos"]:
+            inicio, fin = anillo[:-1], anillo[1:]
+            longitud = np.hypot(*(fin - inicio).T)
+            n_muestras = np.maximum(np.ceil(longitud / (tamano / 2)).astype(int), 1) + 1
+            arista = np.repeat(np.arange(len(inicio)), n_muestras)
+            t = np.concatenate([np.linspace(0, 1, n) for n in n_muestras])
+            muestras = inicio[arista] + (fin[arista] - inicio[arista]) * t[:, None]
+            cols = ((muestras[:, 0] - x_min) / tamano).astype(int)
+            rows = ((muestras[:, 1] - y_min) / tamano).astype(int)
+            borde[rows, cols] = True
+
+    # Dilatar una celda para cubrir las esquinas que las muestras no alcanzan
+    dilatado = borde.copy()
+    dilatado[1:, :] |= borde[:-1, :]
+    dilatado[:-1, :] |= borde[1:, :]
+    dilatado[:, 1:] |= dilatado[:, :-1].copy()
+    dilatado[:, :-1] |= dilatado[:, 1:].copy()
+    borde = dilatado
+
+    # Clasificar el centro de las celdas interiores con la prueba exacta
+    etiquetas = np.full((n_rows, n_cols), -1, dtype=np.int32)
+    rows, cols = np.nonzero(~borde)
+    cx = x_min + (cols + 0.5) * tamano
+    cy = y_min + (rows + 0.5) * tamano
+    for i, zona in enumerate(zonas):
+        dentro = puntos_en_anillos(cx, cy, zona["anillos"])
+        etiquetas[rows[dentro], cols[dentro]] = i
+    etiquetas[borde] = -2
+
+    return {"zonas": zonas, "origen": (x_min, y_min), "tamano": tamano, "etiquetas": etiquetas,
+            "extension": (x_min, y_min, x_max, y_max)}
+
+def zona_de_puntos(x, y, indice):
+    """Devuelve el índice de zona de cada punto (-1 fuera de todas las zonas)."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    etiquetas = indice["etiquetas"]
+    x_min, y_min = indice["origen"]
+    cols = np.floor((x - x_min) / indice["tamano"]).astype(np.int64)
+    rows = np.floor((y - y_min) / indice["tamano"]).astype(np.int64)
+
+    zona = np.full(x.shape, -1, dtype=np.int32)
+    en_rejilla = (cols >= 0) & (rows >= 0) & (cols < etiquetas.shape[1]) & (rows < etiquetas.shape[0])
+    zona[en_rejilla] = etiquetas[rows[en_rejilla], cols[en_rejilla]]
+
+    # Puntos en celdas de borde: prueba exacta solo contra las zonas cuyo bbox los contiene
+    pendientes = np.flatnonzero(zona == -2)
+    zona[pendientes] = -1
+    for i, z in enumerate(indice["zonas"]):
+        if pendientes.size == 0:
+            break
+        bx_min, by_min, bx_max, by_max = z["bbox"]
+        px, py = x[pendientes], y[pendientes]
+        candidatos = (px >= bx_min) & (px <= bx_max) & (py >= by_min) & (py <= by_max)
+        dentro = np.zeros(pendientes.shape, dtype=bool)
+        dentro[candidatos] = puntos_en_anillos(px[candidatos], py[candidatos], z["anillos"])
+        zona[pendientes[dentro]] = i
+        pendientes = pendientes[~dentro]
+    return zona
+
+def indice_aoi(zonas_shp, campo_id=None, epsg=32721):
+    """Carga las zonas de un shapefile y construye su índice preparado."""
+    zonas = cargar_zonas(zonas_shp, campo_id, epsg)
+    if not zonas:
+        raise ValueError(f"El shapefile de zonas no tiene polígonos: {zonas_shp}")
+    return construir_indice(zonas)
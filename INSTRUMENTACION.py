@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Identificador de la ejecución (el pipeline lo comparte con sus etapas mediante FIRE_MAPS_EJECUCION)
+ejecucion = os.environ.get("FIRE_MAPS_EJECUCION") or f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+
+# Mostrar también los mensajes en la consola (además del registro JSON-lines)
+mostrar_mensajes = True
+
+MB = 1024 * 1024
+
+# Etapas medidas en esta sesión (para el resumen) y etapas abiertas de cada hilo
+_mediciones = []
+_abiertas = threading.local()
+_lock = threading.Lock()
+
+def archivo_registro():
+    """Archivo JSON-lines del registro: FIRE_MAPS_REGISTRO o el parámetro 'registro' de la configuración."""
+    path = os.environ.get("FIRE_MAPS_REGISTRO")
+    if path is None:
+        try:
+            from CONFIGURACION import parametro
+            path = parametro("registro")
+        except IOError:
+            path = None
+    return path
+
+def emitir(evento):
+    """Agrega un evento (una línea JSON) al registro, si hay uno configurado."""
+    path = archivo_registro()
+    if not path:
+        return
+    linea = json.dumps(dict({"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "ejecucion": ejecucion, "pid": os.getpid()},
+                            **evento), default=str, ensure_ascii=False)
+    with _lock:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(linea + "\n")
+
+def informar(mensaje, nivel="info", **campos):
+    """Reemplaza a print: muestra el mensaje y lo registra con la etapa en curso y los campos dados."""
+    if mostrar_mensajes:
+        print(mensaje)
+    pila = getattr(_abiertas, "pila", [])
+    emitir(dict({"evento": "mensaje", "nivel": nivel, "mensaje": mensaje,
+                 "etapa": pila[-1][0] if pila else None}, **_serializar(campos)))
+
+def contadores_io():
+    """Bytes leídos y escritos por el proceso (psutil o /proc/self/io); None si no hay forma de medirlos."""
+    if psutil is not None:
+        io = psutil.Process().io_counters()
+        return io.read_bytes, io.write_bytes
+    if os.path.exists("/proc/self/io"):
+        valores = {}
+        with open("/proc/self/io") as f:
+            for linea in f:
+                clave, valor = linea.split(":")
+                valores[clave] = int(valor)
+        return valores["rchar"], valores["wchar"]
+    return None
+
+def pico_rss():
+    """Pico de memoria residente del proceso en bytes.
+
+    En Linux y macOS se usa ru_maxrss (psutil solo da el pico en Windows, con peak_wset;
+    fuera de Windows su rss es la memoria actual).
+    """
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico if sys.platform == "darwin" else pico * 1024
+    if psutil is not None:
+        memoria = psutil.Process().memory_info()
+        return getattr(memoria, "peak_wset", None) or memoria.rss
+    return None
+
+def cache_gdal():
+    """Bytes ocupados en la caché de bloques de GDAL."""
+    return gdal.GetCacheUsed() if gdal is not None else None
+
+def describir_array(array):
+    """Forma, tipo y tamaño en MB de un array."""
+    return {"forma": list(array.shape), "tipo": str(array.dtype), "mb": round(array.nbytes / MB, 2)}
+
+def _serializar(campos):
+    """Convierte los arrays de los campos en su descripción (no se registran los datos)."""
+    return {clave: describir_array(valor) if hasattr(valor, "shape") and hasattr(valor, "dtype") else valor
+            for clave, valor in campos.items()}
+
+def anotar(**campos):
+    """Agrega campos (por ejemplo, arrays o conteos) a la etapa abierta más interna de este hilo."""
+    pila = getattr(_abiertas, "pila", [])
+    if pila:
+        pila[-1][1].update(_serializar(campos))
+
+def registrar_etapa(nombre, segundos, estado="ok", **campos):
+    """Registra una etapa ya medida (para el resumen y el registro JSON-lines)."""
+    medicion = dict({"evento": "etapa", "etapa": nombre, "segundos": round(segundos, 4), "estado": estado},
+                    **_serializar(campos))
+    with _lock:
+        _mediciones.append(medicion)
+    emitir(medicion)
+    return medicion
+
+@contextmanager
+def etapa(nombre, **campos):
+    """Mide un bloque: tiempo, bytes leídos y escritos por el proceso, caché de GDAL y pico de RSS.
+
+    Devuelve un diccionario al que se pueden agregar campos; si tiene una clave 'salida' que
+    apunta a un archivo, se registra también su tamaño. Los errores se registran y se propagan.
+    """
+    registro = _serializar(campos)
+    pila = _abiertas.__dict__.setdefault("pila", [])
+    padre = pila[-1][0] if pila else None
+    pila.append((nombre, registro))
+    io_inicial = contadores_io()
+    inicio = time.perf_counter()
+    estado = "ok"
+    try:
+        yield registro
+    except BaseException as e:
+        estado = "error"
+        registro["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        pila.pop()
+        io_final = contadores_io()
+        medidas = {"padre": padre}
+        if io_inicial is not None:
+            medidas["leido_mb"] = round((io_final[0] - io_inicial[0]) / MB, 2)
+            medidas["escrito_mb"] = round((io_final[1] - io_inicial[1]) / MB, 2)
+        rss = pico_rss()
+        if rss is not None:
+            medidas["pico_rss_mb"] = round(rss / MB, 1)
+        cache = cache_gdal()
+        if cache is not None:
+            medidas["cache_gdal_mb"] = round(cache / MB, 1)
+        salida = registro.get("salida")
+        if isinstance(salida, str) and os.path.isfile(salida):
+            medidas["salida_mb"] = round(os.path.getsize(salida) / MB, 2)
+        registrar_etapa(nombre, segundos, estado, **dict(medidas, **registro))
+
+def instrumentar(nombre=None):
+    """Decorador que mide cada llamada a la función como una etapa."""
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with etapa(nombre or funcion.__name__):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+def leer_registro(path, ejecucion_id=None):
+    """Lee las etapas de un registro JSON-lines (solo las de una ejecución, si se indica)."""
+    mediciones = []
+    if not path or not os.path.exists(path):
+        return mediciones
+    with open(path, encoding="utf-8") as f:
+        for linea in f:
+            try:
+                evento = json.loads(linea)
+            except ValueError:
+                continue
+            if evento.get("evento") == "etapa" and (ejecucion_id is None or evento.get("ejecucion") == ejecucion_id):
+                mediciones.append(evento)
+    return mediciones
+
+def resumen(mediciones=None, mostrar=True):
+    """Tabla de fin de ejecución: tiempo total, medio y máximo, E/S y pico de RSS por etapa."""
+    if mediciones is None:
+        with _lock:
+            mediciones = list(_mediciones)
+    filas = {}
+    for m in mediciones:
+        fila = filas.setdefault(m["etapa"], {"etapa": m["etapa"], "n": 0, "errores": 0, "total_s": 0.0, "max_s": 0.0,
+                                             "leido_mb": 0.0, "escrito_mb": 0.0, "pico_rss_mb": 0.0})
+        fila["n"] += 1
+        fila["errores"] += m.get("estado") != "ok"
+        fila["total_s"] += m["segundos"]
+        fila["max_s"] = max(fila["max_s"], m["segundos"])
+        fila["leido_mb"] += m.get("leido_mb") or 0
+        fila["escrito_mb"] += m.get("escrito_mb") or 0
+        fila["pico_rss_mb"] = max(fila["pico_rss_mb"], m.get("pico_rss_mb") or 0)
+    filas = sorted(filas.values(), key=lambda f: f["total_s"], reverse=True)
+
+    if mostrar and filas:
+        print(f"{'etapa':<28}{'n':>5}{'err':>5}{'total s':>10}{'medio s':>9}{'máx s':>9}"
+              f"{'leído MB':>10}{'escrito MB':>11}{'pico RSS MB':>12}")
+        for f in filas:
+            print(f"{f['etapa'][:27]:<28}{f['n']:>5}{f['errores']:>5}{f['total_s']:>10.1f}{f['total_s'] / f['n']:>9.2f}"
+                  f"{f['max_s']:>9.2f}{f['leido_mb']:>10.1f}{f['escrito_mb']:>11.1f}{f['pico_rss_mb']:>12.0f}")
+    return filas
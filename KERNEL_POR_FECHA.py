@@ -1,179 +1,187 @@
 import os
+import csv
 import numpy as np
-from osgeo import gdal, osr
-from scipy.ndimage import gaussian_filter
 from qgis.core import (
-    QgsProject,
     QgsVectorLayer,
-    QgsRasterLayer,
-    QgsSingleBandPseudoColorRenderer,
-    QgsRasterShader,
-    QgsColorRampShader,
     QgsWkbTypes
 )
-from PyQt5.QtGui import QColor
+from CATALOGO_SATELITAL import actualizar_catalogo, consultar
+from FILTRO_AOI import indice_aoi, zona_de_puntos
+from ENSAMBLAR_PROYECTO import ensamblar_proyecto
+from DENSIDAD_KERNEL import densidad_kernel, densidades_kernel, pesos_canales, guardar_densidad, contornos_densidad
+from CONFIGURACION import ruta
+from INSTRUMENTACION import etapa, informar, resumen
 
 # Directorio base donde están los años
-base_directory = r'D:\KIM_USER\Tesis\KERNEL'
+base_directory = ruta("kernel")
+
+# Zonas del área de estudio (uno o varios departamentos) y campo con su nombre (None usa el FID)
+zonas_shp = ruta("aoi")
+campo_zona = None
 
 # Parámetros del kernel
 radius = 4500  # Radio en metros
 pixel_size = 300  # Tamaño del píxel en metros (X e Y)
 
-# Recorrer cada año (carpetas en el directorio base)
-for year in os.listdir(base_directory):
-    year_path = os.path.join(base_directory, year)
-    
-    # Asegurarse de que la carpeta es un directorio (por si hay archivos sueltos)
-    if os.path.isdir(year_path):
-        # Recorrer cada subcarpeta de fecha (dentro de cada año)
-        for date_folder in os.listdir(year_path):
-            date_path = os.path.join(year_path, date_folder)
-            
-            # Asegurarse de que es un directorio válido
-            if os.path.isdir(date_path):
-                # Buscar cualquier archivo .shp en la carpeta
-                shapefile_found = False
-                for file in os.listdir(date_path):
-                    if file.endswith('.shp'):
-                        input_shapefile = os.path.join(date_path, file)
-                        shapefile_found = True
-                        break
-
-                if not shapefile_found:
-                    print(f"No se encontró un archivo .shp en {date_path}. Saltando...")
-                    continue
-
-                # Crear directorio de resultados si no existe
-                output_directory = os.path.join(date_path, 'resultados')
-                if not os.path.exists(output_directory):
-                    os.makedirs(output_directory)
-                    print(f"Directorio creado: {output_directory}")
-
-                # Nombre de salida para el raster basado en la fecha de la carpeta
-                output_raster = os.path.join(output_directory, f'KERNEL_{date_folder}.tif')
-                print(f"Generando archivo raster: {output_raster}")
-
-                # Cargar el shapefile como capa vectorial en QGIS
-                layer = QgsVectorLayer(input_shapefile, "Puntos", "ogr")
-                if not layer.isValid():
-                    print(f"Error: La capa {input_shapefile} no es válida.")
+# Modo de varios anchos de banda: radios en metros que se guardan como bandas de
+# DENSIDAD_RADIOS_<fecha>.tif (un solo conteo y suavizado en cascada), por ejemplo
+# [1500, 3000, 4500, 9000]; vacío lo desactiva. La extensión se amplía con el mayor radio.
+radios = []
+
+# GeoPackage con los polígonos de isodensidad (clases 10 % y 50 % del rango, hasta el máximo),
+# una capa por fecha calculada sobre la densidad en memoria; None lo desactiva. Va fuera de la
+# carpeta del kernel para que no se tome como una entrada más de las etapas que leen sus .gpkg
+contornos_gpkg = ruta("contornos_kernel")
+
+# Canales de la densidad ponderada, guardados como bandas de DENSIDAD_CANALES_<fecha>.tif en una
+# sola pasada: nombre -> (campo del foco, umbral). Sin campo es el conteo, sin umbral el peso es el
+# valor (FRP) y con umbral es 1 si se alcanza (confianza MODIS 0-100; VIIRS 'h' = 100). Vacío lo desactiva.
+canales = {"conteo": (None, None), "frp": ("FRP", None), "alta_confianza": ("CONFIDENCE", 80)}
+
+# Índice preparado de las zonas, en el SRC de los focos (EPSG:32721)
+indice_zonas = indice_aoi(zonas_shp, campo_zona, 32721)
+
+# Consultar en el catálogo los shapefiles de focos de calor (uno por carpeta de fecha)
+catalogo_db = actualizar_catalogo(base_directory)
+carpetas_procesadas = set()
+salidas = []
+for registro in consultar(catalogo_db, producto="HOTSPOTS", raiz=base_directory):
+    input_shapefile = registro["ruta"]
+    date_path = os.path.dirname(input_shapefile)
+    date_folder = os.path.basename(date_path)
+    if date_path in carpetas_procesadas:
+        continue
+    carpetas_procesadas.add(date_path)
+
+    # Crear directorio de resultados si no existe
+    output_directory = os.path.join(date_path, 'resultados')
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+        informar(f"Directorio creado: {output_directory}")
+
+    # Nombre de salida para el raster basado en la fecha de la carpeta
+    output_raster = os.path.join(output_directory, f'KERNEL_{date_folder}.tif')
+    informar(f"Generando archivo raster: {output_raster}")
+
+    with etapa("kernel", fecha=date_folder, salida=output_raster):
+        # Cargar el shapefile como capa vectorial en QGIS
+        layer = QgsVectorLayer(input_shapefile, "Puntos", "ogr")
+        if not layer.isValid():
+            informar(f"Error: La capa {input_shapefile} no es válida.", "error")
+            continue
+
+        # Verificar si es una capa de puntos
+        if layer.geometryType() != QgsWkbTypes.PointGeometry:
+            informar(f"El shapefile {input_shapefile} no es de puntos. Saltando...", "aviso")
+            continue
+
+        # Extraer las coordenadas de los puntos y los atributos que usan los canales ponderados
+        campos = {campo for campo, _ in canales.values() if campo and layer.fields().indexOf(campo) >= 0}
+        faltantes = {campo for campo, _ in canales.values() if campo} - campos
+        if faltantes:
+            informar(f"Campos sin datos en {input_shapefile}: {', '.join(sorted(faltantes))} (peso 0)", "aviso")
+        with etapa("leer_focos", shapefile=input_shapefile):
+            points = []
+            atributos = {campo: [] for campo in campos}
+            for feature in layer.getFeatures():
+                geom = feature.geometry()
+                if geom.isEmpty():
                     continue
-                else:
-                    QgsProject.instance().addMapLayer(layer)
-
-                    # Verificar si es una capa de puntos
-                    if layer.geometryType() != QgsWkbTypes.PointGeometry:
-                        print(f"El shapefile {input_shapefile} no es de puntos. Saltando...")
-                        continue
-
-                    # Extraer las coordenadas de los puntos
-                    points = []
-                    for feature in layer.getFeatures():
-                        geom = feature.geometry()
-                        if geom.isEmpty():
-                            continue
-                        points.append((geom.asPoint().x(), geom.asPoint().y()))
-
-                    # Verificar los puntos extraídos
-                    print(f"Puntos extraídos: {len(points)}")
-                    if not points:
-                        print(f"No se encontraron puntos en el shapefile {input_shapefile}. Saltando...")
-                        continue
-
-                    points = np.array(points)
-
-                    # Definir el tamaño de la matriz en función del área de los puntos y la resolución
-                    min_x, min_y, max_x, max_y = layer.extent().xMinimum(), layer.extent().yMinimum(), layer.extent().xMaximum(), layer.extent().yMaximum()
-
-                    n_cols = int((max_x - min_x) / pixel_size) + 1  # +1 para incluir el borde
-                    n_rows = int((max_y - min_y) / pixel_size) + 1  # +1 para incluir el borde
-
-                    # Crear una matriz vacía para la densidad
-                    density = np.zeros((n_rows, n_cols))
-
-                    # Convertir las coordenadas de puntos a celdas de la cuadrícula
-                    x_indices = ((points[:, 0] - min_x) / pixel_size).astype(int)
-                    y_indices = ((max_y - points[:, 1]) / pixel_size).astype(int)
-
-                    # Verificar los índices de las celdas
-                    print(f"x_indices: {x_indices[:5]}... y_indices: {y_indices[:5]}...")  # Mostrar los primeros 5 índices
-
-                    # Llenar la matriz con los conteos de puntos
-                    for x, y in zip(x_indices, y_indices):
-                        if 0 <= x < n_cols and 0 <= y < n_rows:  # Verificar que las coordenadas estén dentro del rango
-                            density[y, x] += 1
-
-                    # Aplicar un filtro gaussiano para simular el kernel
-                    sigma = radius / pixel_size
-                    density = gaussian_filter(density, sigma=sigma)
-
-                    # Verificar la densidad generada
-                    print(f"Densidad calculada, min: {np.min(density)}, max: {np.max(density)}")
-
-                    # Guardar la matriz como un archivo raster usando GDAL
-                    driver = gdal.GetDriverByName('GTiff')
-                    out_raster = driver.Create(output_raster, n_cols, n_rows, 1, gdal.GDT_Float32)
-
-                    # Definir la transformación geo-espacial (ubicación del raster en el espacio)
-                    out_raster.SetGeoTransform((min_x, pixel_size, 0, max_y, 0, -pixel_size))
-
-                    # Obtener referencia espacial con EPSG:32721 (UTM Zona 21S)
-                    srs = osr.SpatialReference()
-                    srs.ImportFromEPSG(32721)  # EPSG:32721 para UTM Zona 21S
-                    out_raster.SetProjection(srs.ExportToWkt())
-
-                    # Escribir la densidad en el raster
-                    outband = out_raster.GetRasterBand(1)
-                    outband.WriteArray(density)
-
-                    # Establecer el valor no válido para que el raster se procese correctamente
-                    outband.SetNoDataValue(-9999)
-                    outband.FlushCache()
-
-                    # Cerrar el archivo raster para asegurarse de que se escriben los datos
-                    outband = None
-                    out_raster = None
-
-                    print(f"Densidad de kernel guardada en: {output_raster}")
-
-                    # Agregar el raster a QGIS
-                    raster_layer = QgsRasterLayer(output_raster, f"Densidad Kernel {date_folder}")
-
-                    if raster_layer.isValid():
-                        QgsProject.instance().addMapLayer(raster_layer)
-
-                        # Crear un shader de rampa de colores
-                        color_ramp_shader = QgsColorRampShader()
-                        color_ramp_shader.setColorRampType(QgsColorRampShader.Interpolated)
-
-                        # Obtener los valores mínimo y máximo del raster
-                        min_value = np.min(density)
-                        max_value = np.max(density)
-
-                        # Definir la rampa de colores usando los tonos indicados
-                        color_ramp_shader.setColorRampItemList([ 
-                            QgsColorRampShader.ColorRampItem(min_value, QColor(255, 247, 181), 'Bajas Densidades'),
-                            QgsColorRampShader.ColorRampItem(min_value + (max_value - min_value) * 0.1, QColor(255, 169, 49), 'Densidades Medias'),
-                            QgsColorRampShader.ColorRampItem(min_value + (max_value - min_value) * 0.5, QColor(255, 51, 51), 'Densidades Altas'),
-                            QgsColorRampShader.ColorRampItem(max_value, QColor(153, 0, 0), 'Máxima Densidad'),
-                        ])
-
-                        # Crear el shader raster y asignar el color ramp shader
-                        raster_shader = QgsRasterShader()
-                        raster_shader.setRasterShaderFunction(color_ramp_shader)
-
-                        # Crear el renderer
-                        renderer = QgsSingleBandPseudoColorRenderer(raster_layer.dataProvider(), 1, raster_shader)
-
-                        # Asignar el renderer a la capa
-                        raster_layer.setRenderer(renderer)
-
-                        # Ajustar la opacidad del renderizador
-                        renderer.setOpacity(0.76)
-
-                        print(f"Opacidad ajustada al 76% para el kernel de la fecha {date_folder}.")
-                    else:
-                        print(f"Error: la capa raster no es válida para {date_folder}.")
-                
-print("Proceso completado.")
+                points.append((geom.asPoint().x(), geom.asPoint().y()))
+                for campo in campos:
+                    atributos[campo].append(feature.attribute(campo))
+
+        # Verificar los puntos extraídos
+        informar(f"Puntos extraídos: {len(points)}", puntos=len(points))
+        if not points:
+            informar(f"No se encontraron puntos en el shapefile {input_shapefile}. Saltando...", "aviso")
+            continue
+
+        points = np.array(points)
+        pesos = pesos_canales(atributos, canales, len(points)) if canales else None
+
+        # Quedarse solo con los focos dentro de las zonas del área de estudio
+        with etapa("filtrar_focos", puntos=points):
+            zonas = zona_de_puntos(points[:, 0], points[:, 1], indice_zonas)
+            dentro = zonas >= 0
+        informar(f"Puntos dentro del área de estudio: {np.count_nonzero(dentro)} de {len(points)}",
+                 dentro=int(np.count_nonzero(dentro)), puntos=len(points))
+        if not dentro.any():
+            informar(f"Ningún punto de {input_shapefile} cae en el área de estudio. Saltando...", "aviso")
+            continue
+        points, zonas = points[dentro], zonas[dentro]
+        if pesos is not None:
+            pesos = pesos[:, dentro]
+
+        # Guardar el conteo de focos por zona
+        conteo = np.bincount(zonas, minlength=len(indice_zonas["zonas"]))
+        with open(os.path.join(output_directory, f'FOCOS_ZONA_{date_folder}.csv'), 'w', newline='',
+                  encoding='utf-8') as csv_file:
+            escritor = csv.writer(csv_file)
+            escritor.writerow(["zona", "nombre", "focos"])
+            for i, zona in enumerate(indice_zonas["zonas"]):
+                escritor.writerow([i, zona["nombre"], int(conteo[i])])
+
+        # Definir el tamaño de la matriz con la extensión de las zonas más el mayor radio del kernel
+        radios_fecha = sorted(set(radios) | {radius}) if radios else [radius]
+        margen = max(radios_fecha)
+        min_x, min_y, max_x, max_y = indice_zonas["extension"]
+        min_x, min_y, max_x, max_y = min_x - margen, min_y - margen, max_x + margen, max_y + margen
+
+        extension = (min_x, min_y, max_x, max_y)
+
+        # Con canales ponderados, el conteo es una fila más de la matriz de pesos (la del canal sin
+        # campo, o una de unos si no lo hay) y todos se cuentan y filtran en la misma pasada
+        if pesos is not None:
+            i_conteo = next((i for i, (campo, _) in enumerate(canales.values()) if campo is None), None)
+            if i_conteo is None:
+                i_conteo = len(pesos)
+                pesos = np.vstack([pesos, np.ones((1, pesos.shape[1]))])
+
+        # Contar los puntos por celda y aplicar un filtro gaussiano para simular el kernel
+        with etapa("densidad_kernel", radios=radios_fecha, canales=list(canales)) as medicion:
+            if radios:
+                densidades = densidades_kernel(points[:, 0], points[:, 1], extension, pixel_size, radios_fecha, pesos)
+                medicion["densidades"] = densidades
+                if pesos is not None:
+                    densidad_ponderada = densidades[radios_fecha.index(radius), :len(canales)]
+                    densidades = densidades[:, i_conteo]
+                density = densidades[radios_fecha.index(radius)]
+            else:
+                density = densidad_kernel(points[:, 0], points[:, 1], extension, pixel_size, radius, pesos)
+                medicion["densidad"] = density
+                if pesos is not None:
+                    densidad_ponderada = density[:len(canales)]
+                    density = density[i_conteo]
+
+        # Polígonos de isodensidad sobre el array en memoria (sin volver a leer el raster)
+        if contornos_gpkg:
+            with etapa("contornos_densidad", salida=contornos_gpkg) as medicion:
+                medicion["poligonos"] = contornos_densidad(density, extension, pixel_size, contornos_gpkg,
+                                                           f"kernel_{date_folder}", atributos={"fecha": date_folder})
+
+        # Verificar la densidad generada
+        informar(f"Densidad calculada, min: {np.min(density)}, max: {np.max(density)}",
+                 minimo=float(np.min(density)), maximo=float(np.max(density)))
+
+        # Guardar la matriz como un archivo raster (EPSG:32721, UTM Zona 21S)
+        with etapa("guardar_densidad", salida=output_raster):
+            guardar_densidad(output_raster, density, extension, pixel_size, 32721)
+            if radios:
+                radios_raster = os.path.join(output_directory, f'DENSIDAD_RADIOS_{date_folder}.tif')
+                guardar_densidad(radios_raster, densidades, extension, pixel_size, 32721,
+                                 descripciones=[f"radio_{r}" for r in radios_fecha])
+            if canales:
+                canales_raster = os.path.join(output_directory, f'DENSIDAD_CANALES_{date_folder}.tif')
+                guardar_densidad(canales_raster, densidad_ponderada, extension, pixel_size, 32721,
+                                 descripciones=list(canales))
+
+        informar(f"Densidad de kernel guardada en: {output_raster}")
+
+        salidas.append(output_raster)
+
+# Agregar todos los kernels al proyecto de una vez (simbología desde la plantilla del producto)
+ensamblar_proyecto({"KERNEL": salidas})
+
+informar("Proceso completado.")
+resumen()
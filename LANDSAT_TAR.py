@@ -0,0 +1,145 @@
+import os
+import re
+import threading
+from osgeo import gdal
+from INSTRUMENTACION import instrumentar, informar
+
+# Bandas de nivel 1 de un .tar de Colección 2 (LC08_L1TP_225078_20200915_20200920_02_T1_B4.TIF). La térmica
+# de ETM+ se toma de ganancia baja (B6_VCID_1); los productos de nivel 2 (SR_, ST_) ya vienen escalados y no se usan
+patron_miembro = re.compile(r"^(L[COTE]0\d)_(L1\w\w)_(\d{6})_(\d{8})_\d{8}_\d{2}_\w{2}_B(\d{1,2})(_VCID_1)?\.TIF$",
+                            re.IGNORECASE)
+patron_mtl = re.compile(r"_MTL\.txt$", re.IGNORECASE)
+
+# Sensor de cada misión según el prefijo del identificador de producto
+sensores_mision = {"LC08": "OLI", "LC09": "OLI", "LO08": "OLI", "LO09": "OLI", "LE07": "ETM"}
+
+# Índices de los .tar ya leídos en esta sesión ((ruta, mtime) -> índice)
+_indices_en_memoria = {}
+_lock = threading.Lock()
+
+def es_tar(ruta):
+    """Indica si una escena Landsat es un .tar de Colección 2 (en lugar de una carpeta con B<n>.tif)."""
+    return ruta.lower().endswith(".tar")
+
+def ruta_vsitar(tar_path, miembro):
+    """Ruta GDAL (/vsitar/) de un archivo dentro del .tar, para leerlo sin extraerlo."""
+    return "/vsitar/" + os.path.abspath(tar_path).replace("\\", "/") + "/" + miembro
+
+def leer_mtl(mtl_path):
+    """Lee un MTL de Landsat (texto ODL) como diccionario plano clave -> valor (número si lo es)."""
+    f = gdal.VSIFOpenL(mtl_path, "rb")
+    if f is None:
+        raise IOError(f"No se pudo abrir el MTL: {mtl_path}")
+    try:
+        gdal.VSIFSeekL(f, 0, 2)
+        n_bytes = gdal.VSIFTellL(f)
+        gdal.VSIFSeekL(f, 0, 0)
+        texto = gdal.VSIFReadL(1, n_bytes, f).decode("utf-8", errors="replace")
+    finally:
+        gdal.VSIFCloseL(f)
+
+    mtl = {}
+    for linea in texto.splitlines():
+        clave, _, valor = linea.partition("=")
+        clave, valor = clave.strip(), valor.strip().strip('"')
+        if not valor or clave in ("GROUP", "END_GROUP"):
+            continue
+        try:
+            valor = float(valor)
+        except ValueError:
+            pass
+        mtl.setdefault(clave, valor)
+    return mtl
+
+@instrumentar("indexar_tar")
+def _indexar(tar_path):
+    miembros = gdal.ReadDir("/vsitar/" + os.path.abspath(tar_path).replace("\\", "/")) or []
+    bandas, mtl_path, producto = {}, None, None
+    for miembro in miembros:
+        match = patron_miembro.match(miembro)
+        if match:
+            bandas[f"B{int(match.group(5))}"] = ruta_vsitar(tar_path, miembro)
+            producto = producto or match
+        elif patron_mtl.search(miembro):
+            mtl_path = ruta_vsitar(tar_path, miembro)
+    if producto is None:
+        return None
+
+    mision = producto.group(1).upper()
+    fecha = producto.group(4)
+    return {"bandas": bandas, "mtl": leer_mtl(mtl_path) if mtl_path else {},
+            "sensor": sensores_mision.get(mision), "tile": producto.group(3),
+            "fecha": f"{fecha[:4]}-{fecha[4:6]}-{fecha[6:]}",
+            "nombre": re.sub(r"\.tar$", "", os.path.basename(tar_path), flags=re.IGNORECASE)}
+
+def indexar_tar(tar_path):
+    """Índice de un .tar de Colección 2: banda (B4, B10...) -> ruta /vsitar/, MTL, sensor, path/row y fecha.
+
+    Los miembros se listan y el MTL se lee una sola vez por archivo en cada sesión; las
+    bandas se leen después directamente desde el .tar. Devuelve None si no es un .tar Landsat.
+    """
+    clave = (os.path.abspath(tar_path), os.path.getmtime(tar_path))
+    with _lock:
+        if clave not in _indices_en_memoria:
+            _indices_en_memoria[clave] = _indexar(tar_path)
+        return _indices_en_memoria[clave]
+
+def bandas_landsat(ruta, bandas):
+    """Rutas de las bandas de una escena (carpeta con B4.tif o b4.tif, o .tar de Colección 2); None si falta alguna."""
+    if es_tar(ruta):
+        indice = indexar_tar(ruta)
+        disponibles = indice["bandas"] if indice else {}
+        if not all(banda in disponibles for banda in bandas):
+            return None
+        return {banda: disponibles[banda] for banda in bandas}
+
+    rutas = {}
+    for banda in bandas:
+        for nombre in (f"{banda}.tif", f"{banda.lower()}.tif"):
+            if os.path.exists(os.path.join(ruta, nombre)):
+                rutas[banda] = os.path.join(ruta, nombre)
+                break
+        else:
+            return None
+    return rutas
+
+def destino_escena(ruta):
+    """(carpeta de salida, nombre de la escena): la carpeta de fecha, o la del .tar y su identificador de producto."""
+    if es_tar(ruta):
+        return os.path.dirname(os.path.abspath(ruta)), indexar_tar(ruta)["nombre"]
+    return ruta, os.path.basename(ruta)
+
+def mtl_escena(ruta):
+    """Metadatos MTL de una escena empaquetada ({} en una carpeta o si el .tar no trae MTL)."""
+    if not es_tar(ruta):
+        return {}
+    indice = indexar_tar(ruta)
+    return indice["mtl"] if indice else {}
+
+def reflectancia_mtl(mtl, bandas):
+    """Conversión a reflectancia TOA de las bandas según el MTL.
+
+    Devuelve (escala, desplazamiento) si es igual en todas las bandas (OLI), un diccionario
+    banda -> (escala, desplazamiento) si cambia con la ganancia de cada banda (ETM+) o None
+    si al MTL le falta alguna constante.
+    """
+    pares = {banda: (mtl.get(f"REFLECTANCE_MULT_BAND_{banda[1:]}"), mtl.get(f"REFLECTANCE_ADD_BAND_{banda[1:]}"))
+             for banda in bandas}
+    if not all(isinstance(valor, float) for par in pares.values() for valor in par):
+        return None
+    if len(set(pares.values())) == 1:
+        return next(iter(pares.values()))
+    return pares
+
+def constantes_termicas(mtl, banda):
+    """(ML, AL, K1, K2) de radiancia y conversión térmica de una banda según el MTL, o None si faltan."""
+    numero = banda[1:]
+    sufijo = f"{numero}_VCID_1" if f"K1_CONSTANT_BAND_{numero}_VCID_1" in mtl else numero
+    claves = (f"RADIANCE_MULT_BAND_{sufijo}", f"RADIANCE_ADD_BAND_{sufijo}",
+              f"K1_CONSTANT_BAND_{sufijo}", f"K2_CONSTANT_BAND_{sufijo}")
+    valores = [mtl.get(clave) for clave in claves]
+    if not all(isinstance(valor, float) for valor in valores):
+        if mtl:
+            informar(f"El MTL no tiene las constantes térmicas de {banda}; se usan las predeterminadas.", "aviso")
+        return None
+    return tuple(valores)
@@ -1,40 +1,39 @@
 import os
 import numpy as np
-from osgeo import gdal
-from qgis.core import QgsProject, QgsRasterLayer, QgsSingleBandPseudoColorRenderer, QgsColorRampShader, QgsRasterShader
-from qgis.utils import iface
-from PyQt5.QtGui import QColor
+from CATALOGO_SATELITAL import actualizar_catalogo, consultar
+from REJILLAS import abrir_en_rejilla
+from ENSAMBLAR_PROYECTO import ensamblar_proyecto
+from CONFIGURACION import ruta
+from INSTRUMENTACION import etapa, anotar, resumen
+from PRECARGA import en_tuberia
+from CODIFICACION import crear_salida, codificar
+from LANDSAT_TAR import bandas_landsat, destino_escena, mtl_escena, constantes_termicas
 
 # Parámetros de entrada
-base_directory = r"D:\KIM_USER\Tesis\LANDSAT 8 OLI"
-
-def add_layer_to_project(path, name):
-    """Añade una capa raster al proyecto QGIS."""
-    layer = QgsRasterLayer(path, name)
-    if layer.isValid():
-        QgsProject.instance().addMapLayer(layer)
-        return layer
-    else:
-        print(f"Error al cargar la capa {name}")
-        return None
-
-def calculate_lst_gdal(band3_path, band4_path, band6_path, output_path):
-    """Calcula la LST utilizando GDAL y guarda el resultado."""
-    # Abrir las bandas usando GDAL
-    band3_ds = gdal.Open(band3_path)
-    band4_ds = gdal.Open(band4_path)
-    band6_ds = gdal.Open(band6_path)
-    
-    # Leer los datos de las bandas
-    band3 = band3_ds.GetRasterBand(1).ReadAsArray().astype(float)
-    band4 = band4_ds.GetRasterBand(1).ReadAsArray().astype(float)
-    band6 = band6_ds.GetRasterBand(1).ReadAsArray().astype(float)
-
-    # Parámetros de radiancia
-    ML = 0.067087
-    AL = -0.06709
-    K1 = 666.09
-    K2 = 1282.71
+base_directory = ruta("landsat7_lst")
+
+# Rejilla común de salida (las bandas se reproyectan al leerlas)
+rejilla_landsat = "LANDSAT_30"
+
+def leer_bandas_lst(band3_path, band4_path, band6_path):
+    """Lee las bandas necesarias para la LST sobre la rejilla común (se puede ejecutar en segundo plano)."""
+    bandas = {}
+    for nombre, path in (("band3", band3_path), ("band4", band4_path), ("band6", band6_path)):
+        ds = abrir_en_rejilla(path, rejilla_landsat)
+        bandas[nombre] = ds.GetRasterBand(1).ReadAsArray().astype(float)
+        if nombre == "band3":
+            bandas["tamano"] = (ds.RasterXSize, ds.RasterYSize)
+            bandas["geotransform"] = ds.GetGeoTransform()
+            bandas["proyeccion"] = ds.GetProjection()
+        ds = None
+    return bandas
+
+def calcular_lst(bandas):
+    """Calcula la LST a partir de las bandas leídas."""
+    band3, band4, band6 = bandas["band3"], bandas["band4"], bandas["band6"]
+
+    # Parámetros de radiancia (los del MTL de la escena si se leyeron, si no los de referencia)
+    ML, AL, K1, K2 = bandas.get("termicas") or (0.067087, -0.06709, 666.09, 1282.71)
 
     # Cálculo de la radiancia
     radiance_band6 = (ML * band6) + AL
@@ -53,81 +52,74 @@ def calculate_lst_gdal(band3_path, band4_path, band6_path, output_path):
     lst = bt / (1 + (0.00115 * bt / 1.4388) * np.log(emisivity))
     lst[lst < 0] = -9999
 
-    # Crear un archivo TIFF para guardar el resultado
-    driver = gdal.GetDriverByName('GTiff')
-    out_ds = driver.Create(output_path, band3_ds.RasterXSize, band3_ds.RasterYSize, 1, gdal.GDT_Float32)
-    out_ds.SetGeoTransform(band3_ds.GetGeoTransform())
-    out_ds.SetProjection(band3_ds.GetProjection())
+    return lst
+
+def guardar_lst(output_path, lst, bandas):
+    """Guarda la LST como GeoTIFF (Int16 en centésimas de °C o Float32) con la rejilla de las bandas leídas."""
+    out_ds, escala = crear_salida(output_path, bandas["tamano"][0], bandas["tamano"][1], bandas["proyeccion"],
+                                  bandas["geotransform"], "LST", -9999)
     
     # Escribir los datos calculados
     out_band = out_ds.GetRasterBand(1)
-    out_band.WriteArray(lst)
-    out_band.SetNoDataValue(-9999)
+    anotar(lst=lst)
+    out_band.WriteArray(codificar(lst, escala, -9999))
     out_band.FlushCache()
-    
-    # Cerrar datasets
-    band3_ds = None
-    band4_ds = None
-    band6_ds = None
+    out_band = None
     out_ds = None
+    return output_path
 
-def apply_color_ramp(layer):
-    """Aplica una rampa de colores continua desde amarillo a rojo oscuro y muestra los valores exactos."""
-    if layer.isValid():
-        # Obtener el rango de valores del raster
-        provider = layer.dataProvider()
-        stats = provider.bandStatistics(1)
-        min_value = stats.minimumValue
-        max_value = stats.maximumValue
-
-        # Crear una rampa de color que empiece en amarillo y termine en rojo oscuro
-        color_ramp_shader = QgsColorRampShader()
-        color_ramp_shader.setColorRampType(QgsColorRampShader.Interpolated)
-
-        # Definir la rampa de color
-        color_ramp_shader.setColorRampItemList([
-            QgsColorRampShader.ColorRampItem(min_value, QColor(255, 255, 0), f"{min_value:.2f}°C"),  # Amarillo
-            QgsColorRampShader.ColorRampItem(min_value + (max_value - min_value) * 0.33, QColor(255, 165, 0), f"{(min_value + (max_value - min_value) * 0.33):.2f}°C"),  # Anaranjado
-            QgsColorRampShader.ColorRampItem(min_value + (max_value - min_value) * 0.66, QColor(255, 69, 0), f"{(min_value + (max_value - min_value) * 0.66):.2f}°C"),  # Rojo
-            QgsColorRampShader.ColorRampItem(max_value, QColor(153, 0, 0), f"{max_value:.2f}°C")  # Rojo oscuro
-        ])
-
-        # Aplicar la rampa de color
-        raster_shader = QgsRasterShader()
-        raster_shader.setRasterShaderFunction(color_ramp_shader)
-        renderer = QgsSingleBandPseudoColorRenderer(layer.dataProvider(), 1, raster_shader)
-
-        # Asignar el renderizador a la capa
-        layer.setRenderer(renderer)
-        layer.triggerRepaint()
-    else:
-        print("Error: La capa no es válida para aplicar la simbología.")
-
-def process_landsat_data(year_folder):
-    """Procesa los datos Landsat para cada carpeta de fecha."""
-    for date_folder in os.listdir(year_folder):
-        date_path = os.path.join(year_folder, date_folder)
-        if os.path.isdir(date_path):
-            # Definir las rutas de las bandas
-            band_3_path = os.path.join(date_path, "B3.tif")
-            band_4_path = os.path.join(date_path, "B4.tif")
-            band_6_path = os.path.join(date_path, "B6.tif")
-
-            # Calcular LST
-            lst_path = os.path.join(date_path, f"LST_{date_folder}.tif")
-            calculate_lst_gdal(band_3_path, band_4_path, band_6_path, lst_path)
-            lst_layer = add_layer_to_project(lst_path, f"LST_{date_folder}")
-
-            # Aplicar la rampa de colores
-            if lst_layer:
-                apply_color_ramp(lst_layer)
+def calculate_lst_gdal(band3_path, band4_path, band6_path, output_path):
+    """Calcula la LST utilizando GDAL y guarda el resultado."""
+    bandas = leer_bandas_lst(band3_path, band4_path, band6_path)
+    return guardar_lst(output_path, calcular_lst(bandas), bandas)
+
+def rutas_escena(date_path):
+    """Rutas de las bandas y de la LST de una escena (carpeta de fecha o .tar de Colección 2, leído sin extraer)."""
+    output_dir, date_folder = destino_escena(date_path)
+    nombres = ["B3", "B4", "B6"]
+    rutas = bandas_landsat(date_path, nombres) or {b: os.path.join(date_path, f"{b}.tif") for b in nombres}
+    return [rutas[b] for b in nombres], os.path.join(output_dir, f"LST_{date_folder}.tif")
+
+def process_landsat_scene(date_path):
+    """Procesa los datos Landsat de una carpeta de fecha."""
+    bandas, lst_path = rutas_escena(date_path)
+    with etapa("lst_landsat7", fecha=os.path.basename(date_path), salida=lst_path):
+        calculate_lst_gdal(*bandas, lst_path)
+    return lst_path
+
+def leer_escena(date_path):
+    """Lee las bandas de una escena y, si es un .tar, sus constantes térmicas del MTL (en un hilo de lectura)."""
+    with etapa("leer_lst_landsat7", fecha=os.path.basename(date_path)):
+        bandas = leer_bandas_lst(*rutas_escena(date_path)[0])
+        bandas["termicas"] = constantes_termicas(mtl_escena(date_path), "B6")
+        return bandas
+
+def calcular_escena(date_path, bandas):
+    """Calcula la LST de una escena ya leída."""
+    with etapa("lst_landsat7", fecha=os.path.basename(date_path)):
+        return calcular_lst(bandas), bandas
+
+def guardar_escena(date_path, resultado):
+    """Escribe la LST de una escena (en el hilo de escritura)."""
+    lst_path = rutas_escena(date_path)[1]
+    with etapa("guardar_lst_landsat7", fecha=os.path.basename(date_path), salida=lst_path):
+        return guardar_lst(lst_path, *resultado)
 
 def main():
-    """Función principal para procesar todos los datos Landsat."""
-    for year_folder in os.listdir(base_directory):
-        year_path = os.path.join(base_directory, year_folder)
-        if os.path.isdir(year_path):
-            process_landsat_data(year_path)
+    """Función principal para procesar todos los datos Landsat.
+
+    Las escenas se procesan en tubería: mientras se calcula una, se leen las siguientes y se
+    escribe la anterior en segundo plano.
+    """
+    catalogo_db = actualizar_catalogo(base_directory)
+    escenas = consultar(catalogo_db, producto="LANDSAT", bandas=["B3", "B4", "B6"], raiz=base_directory)
+    salidas = en_tuberia([escena["ruta"] for escena in escenas], leer_escena, calcular_escena, guardar_escena,
+                         nombre="tuberia_lst_landsat7")
+
+    # Agregar todos los resultados al proyecto de una vez
+    ensamblar_proyecto({"LST": salidas})
 
 # Ejecutar el proceso
-main()
+if __name__ == "__main__":
+    main()
+    resumen()
@@ -0,0 +1,170 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from osgeo import gdal, ogr, osr
+from INSTRUMENTACION import instrumentar, informar
+from CODIFICACION import opciones_creacion, escalada, decodificar
+
+# Máscaras ya cargadas en esta sesión ((shapefile, mtime, firma) -> (máscara, ventana))
+_mascaras_en_memoria = {}
+_lock = threading.Lock()
+
+def firma_rejilla(proyeccion, geotransform, n_cols, n_rows):
+    """Devuelve una firma corta que identifica la rejilla (SRC, geotransformación y tamaño)."""
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(proyeccion)
+    contenido = json.dumps({
+        "srs": srs.ExportToWkt(),
+        "geotransform": [round(v, 6) for v in geotransform],
+        "tamano": [n_cols, n_rows]
+    })
+    return hashlib.sha1(contenido.encode("utf-8")).hexdigest()[:16]
+
+@instrumentar("rasterizar_aoi")
+def rasterizar_aoi(mask_shp, proyeccion, geotransform, n_cols, n_rows):
+    """Rasteriza el shapefile del área de estudio sobre la rejilla indicada (1 dentro, 0 fuera)."""
+    mem_ds = gdal.GetDriverByName("MEM").Create("", n_cols, n_rows, 1, gdal.GDT_Byte)
+    mem_ds.SetProjection(proyeccion)
+    mem_ds.SetGeoTransform(geotransform)
+
+    shp_ds = ogr.Open(mask_shp)
+    if shp_ds is None:
+        raise IOError(f"No se pudo abrir el shapefile de máscara: {mask_shp}")
+    # RasterizeLayer reproyecta las geometrías si el SRC del shapefile es distinto
+    gdal.RasterizeLayer(mem_ds, [1], shp_ds.GetLayer(), burn_values=[1])
+
+    mascara = mem_ds.GetRasterBand(1).ReadAsArray().astype(bool)
+    shp_ds = None
+    mem_ds = None
+    return mascara
+
+def ventana_mascara(mascara):
+    """Calcula la ventana mínima (xoff, yoff, xsize, ysize) que contiene el área de estudio."""
+    filas = np.flatnonzero(mascara.any(axis=1))
+    columnas = np.flatnonzero(mascara.any(axis=0))
+    if filas.size == 0:
+        return (0, 0, 0, 0)
+    return (int(columnas[0]), int(filas[0]), int(columnas[-1] - columnas[0] + 1), int(filas[-1] - filas[0] + 1))
+
+def obtener_mascara(mask_shp, proyeccion, geotransform, n_cols, n_rows, cache_dir=None):
+    """Devuelve (máscara recortada, ventana) del área de estudio para la rejilla indicada.
+
+    La máscara se rasteriza una sola vez por rejilla y se guarda en disco empaquetada en bits
+    junto con la firma de la rejilla; las llamadas siguientes la leen de la caché.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(mask_shp), "mascaras_cache")
+    firma = firma_rejilla(proyeccion, geotransform, n_cols, n_rows)
+    shp_mtime = os.path.getmtime(mask_shp)
+    nombre_aoi = os.path.splitext(os.path.basename(mask_shp))[0]
+    clave = (os.path.abspath(mask_shp), shp_mtime, firma)
+
+    # Los hilos de lectura de PRECARGA pueden pedir la misma máscara a la vez
+    with _lock:
+        if clave in _mascaras_en_memoria:
+            return _mascaras_en_memoria[clave]
+
+        cache_path = os.path.join(cache_dir, f"{nombre_aoi}_{firma}.npz")
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as datos:
+                if str(datos["firma"]) == firma and float(datos["shp_mtime"]) == shp_mtime:
+                    ventana = tuple(int(v) for v in datos["ventana"])
+                    n_pixeles = ventana[2] * ventana[3]
+                    mascara = np.unpackbits(datos["bits"], count=n_pixeles).reshape(ventana[3], ventana[2]).astype(bool)
+                    _mascaras_en_memoria[clave] = (mascara, ventana)
+                    return mascara, ventana
+
+        mascara_completa = rasterizar_aoi(mask_shp, proyeccion, geotransform, n_cols, n_rows)
+        xoff, yoff, xsize, ysize = ventana_mascara(mascara_completa)
+        mascara = mascara_completa[yoff:yoff + ysize, xoff:xoff + xsize]
+        ventana = (xoff, yoff, xsize, ysize)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        np.savez(cache_path, bits=np.packbits(mascara, axis=None), ventana=np.array(ventana),
+                 firma=firma, shp_mtime=shp_mtime)
+        informar(f"Máscara de {nombre_aoi} rasterizada y guardada en: {cache_path}")
+
+        _mascaras_en_memoria[clave] = (mascara, ventana)
+        return mascara, ventana
+
+def desplazar_geotransform(geotransform, xoff, yoff):
+    """Devuelve la geotransformación de una ventana que empieza en (xoff, yoff)."""
+    gt = list(geotransform)
+    gt[0] = geotransform[0] + xoff * geotransform[1] + yoff * geotransform[2]
+    gt[3] = geotransform[3] + xoff * geotransform[4] + yoff * geotransform[5]
+    return tuple(gt)
+
+def recortar_array(array, mask_shp, proyeccion, geotransform, nodata, cache_dir=None):
+    """Recorta un array al área de estudio y asigna nodata fuera del polígono.
+
+    Devuelve (array recortado, geotransformación del recorte) o (None, None) si el área
+    de estudio no se superpone con la rejilla.
+    """
+    n_rows, n_cols = array.shape
+    mascara, (xoff, yoff, xsize, ysize) = obtener_mascara(mask_shp, proyeccion, geotransform, n_cols, n_rows, cache_dir)
+    if xsize == 0 or ysize == 0:
+        return None, None
+
+    recorte = array[yoff:yoff + ysize, xoff:xoff + xsize].copy()
+    recorte[~mascara] = nodata
+    return recorte, desplazar_geotransform(geotransform, xoff, yoff)
+
+def guardar_recorte(output_path, recorte, proyeccion, geotransform, tipo_gdal, nodata, escala=None):
+    """Guarda un array recortado como GeoTIFF de una banda (comprimido por bloques).
+
+    `escala` es el (escala, desplazamiento) de los enteros de un producto codificado.
+    """
+    driver = gdal.GetDriverByName("GTiff")
+    out_ds = driver.Create(output_path, recorte.shape[1], recorte.shape[0], 1, tipo_gdal,
+                           options=opciones_creacion(tipo_gdal))
+    out_ds.SetProjection(proyeccion)
+    out_ds.SetGeoTransform(geotransform)
+    out_band = out_ds.GetRasterBand(1)
+    out_band.WriteArray(recorte)
+    out_band.SetNoDataValue(nodata)
+    if escala:
+        out_band.SetScale(escala[0])
+        out_band.SetOffset(escala[1])
+    out_band.FlushCache()
+    out_band = None
+    out_ds = None
+    return output_path
+
+def recortar_raster(input_path, output_path, mask_shp, nodata=None, cache_dir=None):
+    """Recorta un raster al área de estudio usando la máscara en caché, sin gdal.Warp."""
+    in_ds = gdal.Open(input_path)
+    if in_ds is None:
+        informar(f"No se pudo abrir el raster: {input_path}", "error")
+        return None
+    band = in_ds.GetRasterBand(1)
+    proyeccion = in_ds.GetProjection()
+    geotransform = in_ds.GetGeoTransform()
+
+    mascara, (xoff, yoff, xsize, ysize) = obtener_mascara(
+        mask_shp, proyeccion, geotransform, in_ds.RasterXSize, in_ds.RasterYSize, cache_dir)
+    if xsize == 0 or ysize == 0:
+        informar(f"El área de estudio no se superpone con: {input_path}", "aviso")
+        return None
+
+    # Igual que gdalwarp: se usa el nodata de la banda y, si no existe, 0
+    if nodata is None:
+        nodata = band.GetNoDataValue()
+        if nodata is None:
+            nodata = 0
+
+    tipo_gdal = band.DataType
+    # Los productos en int16 conservan su escala y desplazamiento
+    escala = (band.GetScale() or 1.0, band.GetOffset() or 0.0) if escalada(band) else None
+    recorte = band.ReadAsArray(xoff, yoff, xsize, ysize)
+    if np.isnan(nodata) and not np.issubdtype(recorte.dtype, np.floating):
+        # Con nodata NaN un producto escalado se guarda ya en valores reales
+        recorte = decodificar(recorte, *escala, band.GetNoDataValue()) if escala else recorte.astype(np.float32)
+        tipo_gdal = gdal.GDT_Float32
+        escala = None
+    recorte[~mascara] = nodata
+
+    in_ds = None
+    return guardar_recorte(output_path, recorte, proyeccion, desplazar_geotransform(geotransform, xoff, yoff), tipo_gdal, nodata,
+                           escala)
@@ -2,115 +2,241 @@ import os
 from osgeo import gdal
 from qgis.core import (
     QgsProject, QgsRasterLayer, QgsColorRampShader, QgsRasterShader, QgsSingleBandPseudoColorRenderer,
-    QgsPrintLayout, QgsLayoutItemMap, QgsLayoutItemLabel, QgsLayoutItemLegend, QgsLayoutExporter
+    QgsPrintLayout, QgsLayoutItemMap, QgsLayoutItemLabel, QgsLayoutItemLegend, QgsLayoutExporter,
+    QgsRasterBandStats, QgsLayerTree
 )
 from PyQt5.QtGui import QColor, QFont
 from pathlib import Path
+from MASCARA_AOI import recortar_raster
+from CATALOGO_SATELITAL import actualizar_catalogo, consultar
+from REJILLAS import opciones_warp
+from CONFIGURACION import ruta, parametro
+from INSTRUMENTACION import etapa, informar, resumen
+from PRECARGA import en_tuberia
+from CODIFICACION import codificacion_producto, opciones_creacion
+from ENSAMBLAR_PROYECTO import ensamblar_proyecto
 
 # Ruta base de MODIS_TERRA
-base_dir = r"E:/carmen_power/MODIS_TERRA"
-mask_shp = r"E:/CARMEN/BENJAMIN ACEVAL.shp"
-
-# EPSG de salida
-epsg_code = "EPSG:32721"
-
-# Recorrer cada año y mes en la estructura de carpetas
-for year in ["2012", "2014", "2016", "2018", "2020", "2022"]:
-    year_path = os.path.join(base_dir, year)
-    for month in range(1, 13):
-        month_folder = f"{month:02d}_{year}"
-        month_path = os.path.join(year_path, month_folder)
-        
-        if not os.path.exists(month_path):
-            continue
-        
-        hdf_files = [f for f in os.listdir(month_path) if f.endswith(".hdf")]
-        for hdf_file in hdf_files:
-            hdf_path = os.path.join(month_path, hdf_file)
-            out_dir = os.path.join(month_path, "Reproyectado")
-            lst_dir = os.path.join(month_path, "LST")
-            os.makedirs(out_dir, exist_ok=True)
-            os.makedirs(lst_dir, exist_ok=True)
-            
-            hdf_dataset = gdal.Open(hdf_path, gdal.GA_ReadOnly)
-            subdatasets = hdf_dataset.GetSubDatasets()
+base_dir = ruta("modis_terra")
+mask_shp = ruta("aoi")
+
+# Rejilla de salida (EPSG:32721, 1 km, alineada al área de estudio)
+rejilla_lst = "MODIS_1KM"
+
+# Modo serie: un único layout reutilizado para todos los meses y capas raster temporales
+# que no se agregan al proyecto (la memoria se mantiene constante con cualquier número de meses)
+modo_serie = True
+
+def crear_layout_serie(project):
+    """Crea el layout único de la serie mensual con su mapa, título y leyenda."""
+    layout = QgsPrintLayout(project)
+    layout.initializeDefaults()
+    layout.setName("LST - Serie mensual")
+
+    map_item = QgsLayoutItemMap(layout)
+    map_item.setRect(20, 20, 150, 100)
+    layout.addLayoutItem(map_item)
+
+    title_item = QgsLayoutItemLabel(layout)
+    title_item.setFont(QFont("Arial", 16))
+    title_item.setPos(20, 10)
+    layout.addLayoutItem(title_item)
+
+    legend_item = QgsLayoutItemLegend(layout)
+    legend_item.setTitle("Leyenda")
+    legend_item.setLinkedMap(map_item)
+    legend_item.setAutoUpdateModel(False)
+    legend_item.setPos(160, 20)
+    layout.addLayoutItem(legend_item)
+
+    return {"layout": layout, "mapa": map_item, "titulo": title_item, "leyenda": legend_item, "arbol": None}
+
+def exportar_mes_serie(layout_serie, raster_layer, month_folder, output_png_path):
+    """Actualiza mapa, título y leyenda del layout de la serie y exporta el PNG del mes."""
+    map_item = layout_serie["mapa"]
+    legend_item = layout_serie["leyenda"]
+
+    map_item.setLayers([raster_layer])
+    map_item.setExtent(raster_layer.extent())
+    layout_serie["titulo"].setText(f"LST - {month_folder}")
+
+    # La capa no está en el proyecto, así que la leyenda usa su propio árbol de capas
+    legend_tree = QgsLayerTree()
+    legend_tree.addLayer(raster_layer)
+    legend_item.model().setRootGroup(legend_tree)
+    layout_serie["arbol"] = legend_tree
+    legend_item.refresh()
+
+    exporter = QgsLayoutExporter(layout_serie["layout"])
+    result = exporter.exportToImage(output_png_path, QgsLayoutExporter.ImageExportSettings())
+
+    # Liberar las referencias a la capa para que se descargue tras la exportación
+    map_item.setLayers([])
+    layout_serie["arbol"] = QgsLayerTree()
+    legend_item.model().setRootGroup(layout_serie["arbol"])
+    return result
+
+layout_serie = crear_layout_serie(QgsProject.instance()) if modo_serie else None
+
+# Años a procesar
+anios = parametro("anios_lst_modis")
+
+# Consultar en el catálogo los HDF con LST diurna que cubren el área de estudio
+catalogo_db = actualizar_catalogo(base_dir)
+registros = consultar(catalogo_db, bandas=["LST_Day_1km"], aoi=mask_shp, raiz=base_dir)
+
+def preparar_hdf(registro):
+    """Reproyecta los subdatasets de un HDF, escala la LST a °C y la recorta (solo GDAL)."""
+    hdf_path = registro["ruta"]
+    hdf_file = os.path.basename(hdf_path)
+    month_path = os.path.dirname(hdf_path)
+    month_folder = os.path.basename(month_path)
+    out_dir = os.path.join(month_path, "Reproyectado")
+    lst_dir = os.path.join(month_path, "LST")
+    os.makedirs(out_dir, exist_ok=True)
+    os.makedirs(lst_dir, exist_ok=True)
+    
+    hdf_dataset = gdal.Open(hdf_path, gdal.GA_ReadOnly)
+    subdatasets = hdf_dataset.GetSubDatasets()
+    hdf_dataset = None
+    
+    lst_raster = None
+    with etapa("warp_lst_modis", hdf=hdf_path, subdatasets=len(subdatasets)):
+        for subdataset, desc in subdatasets:
+            name = desc.split(':')[-1]
+            output_tif = os.path.join(out_dir, f"{name}.tif")
             
-            lst_raster = None
-            for subdataset, desc in subdatasets:
-                name = desc.split(':')[-1]
-                output_tif = os.path.join(out_dir, f"{name}.tif")
-                
-                gdal.Warp(output_tif, subdataset, dstSRS=epsg_code, resampleAlg=gdal.GRA_Bilinear)
-                
-                if "LST_Day_1km" in name:
-                    lst_raster = output_tif
+            gdal.Warp(output_tif, subdataset, **opciones_warp(rejilla_lst, remuestreo=gdal.GRA_Bilinear))
             
-            if lst_raster:
-                lst_output = os.path.join(lst_dir, f"LST_{month_folder}.tif")
-                gdal.Translate(lst_output, lst_raster, outputType=gdal.GDT_Float32, scaleParams=[[7500, 13000, 27, 70]])
-                
-                lst_clip_output = os.path.join(lst_dir, f"LST_{month_folder}_BENJAMIN_ACEVAL.tif")
-                gdal.Warp(lst_clip_output, lst_output, cutlineDSName=mask_shp, cropToCutline=True)
-                
-                raster_layer = QgsRasterLayer(lst_clip_output, f"LST_{month_folder}_BENJAMIN_ACEVAL")
-                if raster_layer.isValid():
-                    provider = raster_layer.dataProvider()
-                    stats = provider.bandStatistics(1, QgsRasterBandStats.All)
-                    min_value = stats.minimumValue
-                    max_value = stats.maximumValue
-                    
-                    shader = QgsColorRampShader()
-                    shader.setColorRampType(QgsColorRampShader.Interpolated)
-                    shader.setColorRampItemList([
-                        QgsColorRampShader.ColorRampItem(min_value, QColor(255, 255, 0), f"{min_value:.2f}°C"),
-                        QgsColorRampShader.ColorRampItem(min_value + (max_value - min_value) * 0.33, QColor(255, 165, 0), f"{(min_value + (max_value - min_value) * 0.33):.2f}°C"),
-                        QgsColorRampShader.ColorRampItem(min_value + (max_value - min_value) * 0.66, QColor(255, 69, 0), f"{(min_value + (max_value - min_value) * 0.66):.2f}°C"),
-                        QgsColorRampShader.ColorRampItem(max_value, QColor(153, 0, 0), f"{max_value:.2f}°C")
-                    ])
-                    
-                    raster_shader = QgsRasterShader()
-                    raster_shader.setRasterShaderFunction(shader)
-                    renderer = QgsSingleBandPseudoColorRenderer(raster_layer.dataProvider(), 1, raster_shader)
-                    raster_layer.setRenderer(renderer)
-                    raster_layer.triggerRepaint()
-                    
-                    QgsProject.instance().addMapLayer(raster_layer)
-                    print(f"LST {month_folder} agregado a QGIS con simbología corregida y en °C.")
-                    
-                    # Generar mapa y exportar como PNG en el mismo directorio del raster
-                    project = QgsProject.instance()
-                    layout = QgsPrintLayout(project)
-                    layout.initializeDefaults()
-                    project.layoutManager().addLayout(layout)
-                    
-                    map_item = QgsLayoutItemMap(layout)
-                    map_item.setRect(20, 20, 150, 100)
-                    layout.addLayoutItem(map_item)
-                    
-                    map_item.setLayers([raster_layer])
-                    map_item.setExtent(raster_layer.extent())
-                    
-                    title_item = QgsLayoutItemLabel(layout)
-                    title_item.setText(f"LST - {month_folder}")
-                    title_item.setFont(QFont("Arial", 16))
-                    title_item.setPos(20, 10)
-                    layout.addLayoutItem(title_item)
-                    
-                    legend_item = QgsLayoutItemLegend(layout)
-                    legend_item.setTitle("Leyenda")
-                    legend_item.setLinkedMap(map_item)
-                    legend_item.setPos(160, 20)
-                    layout.addLayoutItem(legend_item)
-                    
-                    output_png_path = os.path.join(lst_dir, f"LST_{month_folder}.png")
-                    exporter = QgsLayoutExporter(layout)
-                    result = exporter.exportToImage(output_png_path, QgsLayoutExporter.ImageExportSettings())
-                    
-                    if result == QgsLayoutExporter.Success:
-                        print(f"Mapa guardado en: {output_png_path}")
-                    else:
-                        print("Error al guardar el mapa.")
-                else:
-                    print(f"Error: No se pudo cargar la capa {month_folder} en QGIS.")
-            else:
-                print(f"Error: No se encontró la capa LST_Day_1km en {hdf_file}.")
+            if "LST_Day_1km" in name:
+                lst_raster = output_tif
+    
+    if not lst_raster:
+        informar(f"Error: No se encontró la capa LST_Day_1km en {hdf_file}.", "error")
+        return None
+
+    lst_output = os.path.join(lst_dir, f"LST_{month_folder}.tif")
+    lst_clip_output = os.path.join(lst_dir, f"LST_{month_folder}_BENJAMIN_ACEVAL.tif")
+    with etapa("lst_modis", fecha=month_folder, salida=lst_clip_output):
+        # Escalado a °C; en int16 se guardan centésimas de grado con la escala en los metadatos
+        escala = codificacion_producto("LST")
+        if escala:
+            gdal.Translate(lst_output, lst_raster, outputType=gdal.GDT_Int16,
+                           scaleParams=[[7500, 13000, (27 - escala[1]) / escala[0], (70 - escala[1]) / escala[0]]],
+                           creationOptions=opciones_creacion(gdal.GDT_Int16),
+                           options=["-a_scale", str(escala[0]), "-a_offset", str(escala[1])])
+        else:
+            gdal.Translate(lst_output, lst_raster, outputType=gdal.GDT_Float32, scaleParams=[[7500, 13000, 27, 70]])
+        # Recorte con la máscara rasterizada en caché (sin volver a leer el shapefile)
+        recortar_raster(lst_output, lst_clip_output, mask_shp)
+    return {"month_folder": month_folder, "lst_dir": lst_dir, "lst_clip_output": lst_clip_output}
+
+def preparar_mes(registros_mes):
+    """Prepara en orden los HDF de una carpeta de mes (en un hilo de lectura).
+
+    Todos escriben los mismos Reproyectado/<subdataset>.tif y LST_<mes>.tif, así que una carpeta
+    es una sola tarea de la tubería y dos hilos nunca escriben a la vez en ella. Como antes, el
+    mes queda con la LST del último HDF; devuelve su resultado o None si ninguno tenía LST.
+    """
+    mes = None
+    for registro in registros_mes:
+        mes = preparar_hdf(registro) or mes
+    return mes
+
+def exportar_mes_proyecto(raster_layer, month_folder, output_png_path):
+    """Crea el layout del mes en el proyecto con una capa ya agregada y exporta su PNG."""
+    project = QgsProject.instance()
+    layout = QgsPrintLayout(project)
+    layout.initializeDefaults()
+    project.layoutManager().addLayout(layout)
+    
+    map_item = QgsLayoutItemMap(layout)
+    map_item.setRect(20, 20, 150, 100)
+    layout.addLayoutItem(map_item)
+    
+    map_item.setLayers([raster_layer])
+    map_item.setExtent(raster_layer.extent())
+    
+    title_item = QgsLayoutItemLabel(layout)
+    title_item.setText(f"LST - {month_folder}")
+    title_item.setFont(QFont("Arial", 16))
+    title_item.setPos(20, 10)
+    layout.addLayoutItem(title_item)
+    
+    legend_item = QgsLayoutItemLegend(layout)
+    legend_item.setTitle("Leyenda")
+    legend_item.setLinkedMap(map_item)
+    legend_item.setPos(160, 20)
+    layout.addLayoutItem(legend_item)
+    
+    exporter = QgsLayoutExporter(layout)
+    return exporter.exportToImage(output_png_path, QgsLayoutExporter.ImageExportSettings())
+
+# Meses preparados fuera del modo serie: sus capas se agregan juntas al proyecto al terminar
+meses_proyecto = []
+
+def publicar_mes(registros_mes, mes):
+    """Aplica la simbología a la LST del mes y exporta su mapa (QGIS, en el hilo principal).
+
+    Fuera del modo serie solo anota el mes: las capas se agregan al final con ensamblar_proyecto
+    y los layouts se arman sobre ellas.
+    """
+    if not modo_serie:
+        meses_proyecto.append(mes)
+        return
+    month_folder, lst_dir, lst_clip_output = mes["month_folder"], mes["lst_dir"], mes["lst_clip_output"]
+    raster_layer = QgsRasterLayer(lst_clip_output, f"LST_{month_folder}_BENJAMIN_ACEVAL")
+    if raster_layer.isValid():
+        provider = raster_layer.dataProvider()
+        stats = provider.bandStatistics(1, QgsRasterBandStats.All)
+        min_value = stats.minimumValue
+        max_value = stats.maximumValue
+        
+        shader = QgsColorRampShader()
+        shader.setColorRampType(QgsColorRampShader.Interpolated)
+        shader.setColorRampItemList([
+            QgsColorRampShader.ColorRampItem(min_value, QColor(255, 255, 0), f"{min_value:.2f}°C"),
+            QgsColorRampShader.ColorRampItem(min_value + (max_value - min_value) * 0.33, QColor(255, 165, 0), f"{(min_value + (max_value - min_value) * 0.33):.2f}°C"),
+            QgsColorRampShader.ColorRampItem(min_value + (max_value - min_value) * 0.66, QColor(255, 69, 0), f"{(min_value + (max_value - min_value) * 0.66):.2f}°C"),
+            QgsColorRampShader.ColorRampItem(max_value, QColor(153, 0, 0), f"{max_value:.2f}°C")
+        ])
+        
+        raster_shader = QgsRasterShader()
+        raster_shader.setRasterShaderFunction(shader)
+        renderer = QgsSingleBandPseudoColorRenderer(raster_layer.dataProvider(), 1, raster_shader)
+        raster_layer.setRenderer(renderer)
+        raster_layer.triggerRepaint()
+        
+        output_png_path = os.path.join(lst_dir, f"LST_{month_folder}.png")
+        result = exportar_mes_serie(layout_serie, raster_layer, month_folder, output_png_path)
+        raster_layer = None
+        if result == QgsLayoutExporter.Success:
+            informar(f"Mapa guardado en: {output_png_path}")
+        else:
+            informar("Error al guardar el mapa.", "error")
+    else:
+        informar(f"Error: No se pudo cargar la capa {month_folder} en QGIS.", "error")
+
+# Los meses siguientes se reproyectan y recortan en segundo plano mientras se exporta el mapa del actual
+registros = [registro for registro in registros if registro["fecha"] and registro["fecha"][:4] in anios]
+meses = {}
+for registro in sorted(registros, key=lambda registro: (registro["fecha"], registro["ruta"])):
+    meses.setdefault(os.path.dirname(registro["ruta"]), []).append(registro)
+en_tuberia(list(meses.values()), preparar_mes, publicar_mes, nombre="tuberia_lst_modis")
+
+# Fuera del modo serie, agregar todas las LST al proyecto de una vez (simbología desde la plantilla del
+# producto) y exportar el mapa de cada mes con su capa ya en el proyecto
+if meses_proyecto:
+    capas = ensamblar_proyecto({"LST": [mes["lst_clip_output"] for mes in meses_proyecto]})
+    capas = {capa.source(): capa for capa in capas}
+    for mes in meses_proyecto:
+        raster_layer = capas.get(mes["lst_clip_output"])
+        if raster_layer is None:
+            continue
+        output_png_path = os.path.join(mes["lst_dir"], f"LST_{mes['month_folder']}.png")
+        if exportar_mes_proyecto(raster_layer, mes["month_folder"], output_png_path) == QgsLayoutExporter.Success:
+            informar(f"Mapa guardado en: {output_png_path}")
+        else:
+            informar("Error al guardar el mapa.", "error")
+
+resumen()
@@ -1,110 +1,34 @@
-import os
-from osgeo import gdal
-from qgis.core import (
-    QgsProject,
-    QgsRasterLayer,
-    QgsSingleBandPseudoColorRenderer,
-    QgsColorRampShader,
-    QgsRasterShader
-)
-from PyQt5.QtGui import QColor
+from ALGEBRA_RASTER import calcular_indice, calcular_indice_escena, procesar_indice_landsat
+from ENSAMBLAR_PROYECTO import ensamblar_proyecto
+from CONFIGURACION import ruta
+from INSTRUMENTACION import resumen
 
 # Parámetros de entrada
-base_directory = r"C:\Users\rodov\Downloads\LANDSAT 8 OLI"
+base_directory = ruta("landsat7_ndwi")
 
-def add_layer_to_project(path, name):
-    """Añade una capa raster al proyecto QGIS."""
-    layer = QgsRasterLayer(path, name)
-    if layer.isValid():
-        QgsProject.instance().addMapLayer(layer)
-        return layer
-    else:
-        print(f"Error al cargar la capa {name}")
-        return None
+# Rejilla común de salida (las bandas se reproyectan al leerlas)
+rejilla_landsat = "LANDSAT_30"
 
-def calculate_ndwi(band2_path, band4_path, output_path):
-    """Calcula el NDWI utilizando GDAL y guarda el resultado."""
-    band2_ds = gdal.Open(band2_path)
-    band4_ds = gdal.Open(band4_path)
-    
-    band2 = band2_ds.GetRasterBand(1).ReadAsArray().astype(float)
-    band4 = band4_ds.GetRasterBand(1).ReadAsArray().astype(float)
-
-    ndwi = (band2 - band4) / (band2 + band4)
-    ndwi[np.isnan(ndwi)] = 0
-
-    driver = gdal.GetDriverByName('GTiff')
-    out_ds = driver.Create(output_path, band2_ds.RasterXSize, band2_ds.RasterYSize, 1, gdal.GDT_Float32)
-    out_ds.SetGeoTransform(band2_ds.GetGeoTransform())
-    out_ds.SetProjection(band2_ds.GetProjection())
-    
-    out_band = out_ds.GetRasterBand(1)
-    out_band.WriteArray(ndwi)
-    out_band.SetNoDataValue(-9999)
-    out_band.FlushCache()
-    
-    band2_ds = None
-    band4_ds = None
-    out_ds = None
-
-def apply_simple_color_ramp(layer):
-    """Aplica una rampa de colores azul simple al raster NDWI con 4 clases."""
-    if layer.isValid():
-        provider = layer.dataProvider()
-
-        # Crear una lista de colores para las clases (tonos de azul)
-        color_mapping = [
-            QgsColorRampShader.ColorRampItem(-1, QColor(0, 0, 255), "-1"),    # Azul oscuro
-            QgsColorRampShader.ColorRampItem(0, QColor(0, 128, 255), "0"),    # Azul medio
-            QgsColorRampShader.ColorRampItem(0.5, QColor(0, 191, 255), "0.5"), # Azul claro
-            QgsColorRampShader.ColorRampItem(1, QColor(173, 216, 230), "1")   # Azul muy claro
-        ]
-
-        # Crear un shader de rampa de colores
-        color_ramp_shader = QgsColorRampShader()
-        color_ramp_shader.setColorRampType(QgsColorRampShader.Interpolated)  # Modo interpolado
-        color_ramp_shader.setColorRampItemList(color_mapping)
-
-        raster_shader = QgsRasterShader()
-        raster_shader.setRasterShaderFunction(color_ramp_shader)
+# Índice y sensor (expresión en la sección 'indices' de la configuración, alias de bandas en ALGEBRA_RASTER)
+indice = "NDWI"
+sensor = "LANDSAT7"
 
-        # Crear un renderizador de pseudocolor monobanda
-        renderer = QgsSingleBandPseudoColorRenderer(layer.dataProvider(), 1, raster_shader)
-
-        layer.setRenderer(renderer)
-        layer.triggerRepaint()
-    else:
-        print("Error: La capa no es válida para aplicar la simbología.")
-
-def process_landsat_data(year_folder):
-    """Procesa los datos Landsat para cada carpeta de fecha."""
-    for date_folder in os.listdir(year_folder):
-        date_path = os.path.join(year_folder, date_folder)
-        if os.path.isdir(date_path):
-            # Definir las rutas de las bandas
-            band_2_path = os.path.join(date_path, "b2.tif")
-            band_4_path = os.path.join(date_path, "b4.tif")
-
-            # Verificar si las bandas existen
-            if not (os.path.exists(band_2_path) and os.path.exists(band_4_path)):
-                print(f"Faltan algunas bandas en {date_path}.")
-                continue
-
-            # Calcular NDWI
-            ndwi_path = os.path.join(date_path, f"NDWI_{date_folder}.tif")
-            calculate_ndwi(band_2_path, band_4_path, ndwi_path)
-            ndwi_layer = add_layer_to_project(ndwi_path, f"NDWI_{date_folder}")
+def calculate_ndwi(band2_path, band4_path, output_path):
+    """Calcula el NDWI por bloques en float32 y guarda el resultado."""
+    return calcular_indice(indice, sensor, {"GREEN": band2_path, "NIR": band4_path}, output_path, rejilla_landsat)
 
-            # Aplicar la rampa de colores
-            if ndwi_layer:
-                apply_simple_color_ramp(ndwi_layer)
+def process_landsat_scene(date_path):
+    """Procesa los datos Landsat de una carpeta de fecha."""
+    return calcular_indice_escena(indice, sensor, date_path, rejilla_landsat)
 
 def main():
     """Función principal para procesar todos los datos Landsat."""
-    for year_folder in os.listdir(base_directory):
-        year_path = os.path.join(base_directory, year_folder)
-        if os.path.isdir(year_path):
-            process_landsat_data(year_path)
+    salidas = procesar_indice_landsat(indice, sensor, base_directory, rejilla_landsat)
+
+    # Agregar todos los resultados al proyecto de una vez
+    ensamblar_proyecto({"NDWI_LANDSAT": salidas})
 
 # Ejecutar el proceso
-main()
+if __name__ == "__main__":
+    main()
+    resumen()
@@ -0,0 +1,269 @@
+import os
+import ast
+import sys
+import glob
+import json
+import time
+import runpy
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from CONFIGURACION import archivo_configuracion, cargar_configuracion
+from INSTRUMENTACION import ejecucion, etapa, informar, registrar_etapa, leer_registro, resumen
+
+# Carpeta de los scripts del repositorio
+carpeta_scripts = os.path.dirname(os.path.abspath(__file__))
+
+# Tamaño de lectura para calcular los hashes de contenido
+bloque_hash = 1 << 20
+
+def expandir(patrones, rutas):
+    """Expande los patrones de una etapa ({clave} de 'rutas' y comodines **) a la lista de archivos."""
+    archivos = set()
+    for patron in patrones:
+        patron = patron.format(**rutas)
+        if glob.has_magic(patron):
+            archivos.update(glob.glob(patron, recursive=True))
+        elif os.path.exists(patron):
+            archivos.add(patron)
+    return sorted(os.path.normpath(a) for a in archivos if os.path.isfile(a))
+
+def hash_archivo(ruta, cache):
+    """Hash SHA-1 del contenido de un archivo, reutilizado mientras no cambien su tamaño y fecha."""
+    stat = os.stat(ruta)
+    guardado = cache.get(ruta)
+    if guardado and guardado[0] == stat.st_size and guardado[1] == stat.st_mtime:
+        return guardado[2]
+    sha1 = hashlib.sha1()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(bloque_hash), b""):
+            sha1.update(bloque)
+    cache[ruta] = [stat.st_size, stat.st_mtime, sha1.hexdigest()]
+    return cache[ruta][2]
+
+def hash_archivos(archivos, cache):
+    """Hash combinado de una lista de archivos (rutas y contenidos)."""
+    sha1 = hashlib.sha1()
+    for ruta in archivos:
+        sha1.update(ruta.encode("utf-8"))
+        sha1.update(hash_archivo(ruta, cache).encode("ascii"))
+    return sha1.hexdigest()
+
+def modulos_script(script, vistos=None):
+    """Script y módulos del repositorio que importa, directa o indirectamente (rutas ordenadas)."""
+    vistos = set() if vistos is None else vistos
+    path = os.path.join(carpeta_scripts, script)
+    if path in vistos or not os.path.isfile(path):
+        return sorted(vistos)
+    vistos.add(path)
+    with open(path, encoding="utf-8") as f:
+        arbol = ast.parse(f.read(), filename=path)
+    for nodo in ast.walk(arbol):
+        if isinstance(nodo, ast.Import):
+            nombres = [alias.name for alias in nodo.names]
+        elif isinstance(nodo, ast.ImportFrom) and nodo.module and not nodo.level:
+            nombres = [nodo.module]
+        else:
+            continue
+        for nombre in nombres:
+            modulos_script(nombre.split(".")[0] + ".py", vistos)
+    return sorted(vistos)
+
+def huella_etapa(etapa, rutas, estado):
+    """Huella de una etapa: script y módulos que importa, definición, entradas y salidas de sus dependencias.
+
+    Si la huella coincide con la de la última ejecución correcta y sus salidas no
+    cambiaron desde entonces, la etapa está al día y no se vuelve a ejecutar.
+    """
+    cache = estado["hashes"]
+    sha1 = hashlib.sha1()
+    # Cambiar una biblioteca del repositorio (DENSIDAD_KERNEL, ALGEBRA_RASTER...) invalida las etapas que la usan
+    sha1.update(hash_archivos(modulos_script(etapa["script"]), cache).encode("ascii"))
+    sha1.update(json.dumps(etapa, sort_keys=True).encode("utf-8"))
+    sha1.update(json.dumps(rutas, sort_keys=True).encode("utf-8"))
+    sha1.update(hash_archivos(expandir(etapa.get("entradas", []), rutas), cache).encode("ascii"))
+    for dependencia in etapa.get("depende", []):
+        sha1.update(estado["etapas"].get(dependencia, {}).get("salidas", "").encode("ascii"))
+    return sha1.hexdigest()
+
+def ordenar_etapas(etapas):
+    """Comprueba que las dependencias formen un grafo acíclico y devuelve un orden topológico."""
+    orden, visitadas, en_curso = [], set(), set()
+
+    def visitar(nombre):
+        if nombre in visitadas:
+            return
+        if nombre in en_curso:
+            raise ValueError(f"Dependencia circular en la etapa: {nombre}")
+        if nombre not in etapas:
+            raise ValueError(f"Etapa no definida: {nombre}")
+        en_curso.add(nombre)
+        for dependencia in etapas[nombre].get("depende", []):
+            visitar(dependencia)
+        en_curso.discard(nombre)
+        visitadas.add(nombre)
+        orden.append(nombre)
+
+    for nombre in etapas:
+        visitar(nombre)
+    return orden
+
+def leer_estado(estado_path):
+    if os.path.exists(estado_path):
+        with open(estado_path, encoding="utf-8") as f:
+            return json.load(f)
+    return {"hashes": {}, "etapas": {}}
+
+def guardar_estado(estado, estado_path):
+    temporal = estado_path + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(estado, f, indent=1)
+    os.replace(temporal, estado_path)
+
+def lanzar_etapa(nombre, etapa, python, config_path, logs_dir):
+    """Ejecuta una etapa en un proceso aparte y guarda su salida en logs/<etapa>.log."""
+    comando = [python, os.path.abspath(__file__), "--ejecutar", etapa["script"]]
+    if etapa.get("qgis", True):
+        comando.append("--qgis")
+    entorno = dict(os.environ, FIRE_MAPS_CONFIG=os.path.abspath(config_path), FIRE_MAPS_EJECUCION=ejecucion)
+    log_path = os.path.join(logs_dir, f"{nombre}.log")
+    inicio = time.time()
+    with open(log_path, "w", encoding="utf-8") as log:
+        proceso = subprocess.run(comando, stdout=log, stderr=subprocess.STDOUT, env=entorno, cwd=carpeta_scripts)
+    return proceso.returncode, time.time() - inicio, log_path
+
+def ejecutar_pipeline(config_path=None, solo=None, forzar=(), simular=False):
+    """Ejecuta las etapas desactualizadas del pipeline, en paralelo cuando no dependen entre sí.
+
+    `solo` limita la ejecución a esas etapas y sus dependencias; `forzar` vuelve a ejecutar
+    las etapas indicadas aunque estén al día, y `simular` solo informa qué se ejecutaría.
+    """
+    config_path = config_path or archivo_configuracion
+    configuracion = cargar_configuracion(config_path)
+    rutas = configuracion["rutas"]
+    pipeline = configuracion["pipeline"]
+    etapas = {n: e for n, e in pipeline["etapas"].items() if e.get("activa", True)}
+    orden = ordenar_etapas(etapas)
+
+    if solo:
+        necesarias = set()
+        pendientes = list(solo)
+        while pendientes:
+            nombre = pendientes.pop()
+            if nombre not in necesarias:
+                necesarias.add(nombre)
+                pendientes += etapas[nombre].get("depende", [])
+        orden = [n for n in orden if n in necesarias]
+
+    estado_dir = pipeline.get("estado") or os.path.join(carpeta_scripts, ".pipeline")
+    logs_dir = os.path.join(estado_dir, "logs")
+    os.makedirs(logs_dir, exist_ok=True)
+    estado_path = os.path.join(estado_dir, "estado.json")
+    estado = leer_estado(estado_path)
+    python = pipeline.get("python") or sys.executable
+
+    # Registro JSON-lines compartido por el pipeline y las etapas (se resume al terminar)
+    registro_path = (os.environ.get("FIRE_MAPS_REGISTRO") or configuracion.get("parametros", {}).get("registro")
+                     or os.path.join(estado_dir, "registro.jsonl"))
+    os.environ["FIRE_MAPS_REGISTRO"] = registro_path
+
+    terminadas, fallidas, ejecutadas = set(), set(), []
+    en_curso = {}
+    with ThreadPoolExecutor(max_workers=pipeline.get("procesos") or 1) as executor:
+        while len(terminadas) + len(fallidas) < len(orden):
+            for nombre in orden:
+                if nombre in terminadas or nombre in fallidas or nombre in en_curso.values():
+                    continue
+                dependencias = etapas[nombre].get("depende", [])
+                if any(d in fallidas for d in dependencias):
+                    informar(f"[{nombre}] omitida: falló una dependencia.", "error", etapa=nombre)
+                    fallidas.add(nombre)
+                    continue
+                if not all(d in terminadas for d in dependencias if d in orden):
+                    continue
+
+                definicion = etapas[nombre]
+                huella = huella_etapa(definicion, rutas, estado)
+                previa = estado["etapas"].get(nombre, {})
+                salidas = expandir(definicion.get("salidas", []), rutas)
+                al_dia = (previa.get("huella") == huella and (salidas or not definicion.get("salidas"))
+                          and hash_archivos(salidas, estado["hashes"]) == previa.get("salidas"))
+                if nombre not in forzar and al_dia:
+                    informar(f"[{nombre}] al día.", etapa=nombre)
+                    terminadas.add(nombre)
+                    continue
+                if simular:
+                    informar(f"[{nombre}] se ejecutaría.", etapa=nombre)
+                    estado["etapas"].setdefault(nombre, {})["salidas"] = "pendiente"
+                    terminadas.add(nombre)
+                    continue
+
+                informar(f"[{nombre}] ejecutando {etapas[nombre]['script']}...", etapa=nombre)
+                futuro = executor.submit(lanzar_etapa, nombre, definicion, python, config_path, logs_dir)
+                en_curso[futuro] = nombre
+                estado["etapas"].setdefault(nombre, {})["huella_pendiente"] = huella
+
+            if not en_curso:
+                continue
+            hechos, _ = wait(list(en_curso), return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                nombre = en_curso.pop(futuro)
+                codigo, segundos, log_path = futuro.result()
+                registro = estado["etapas"].setdefault(nombre, {})
+                huella = registro.pop("huella_pendiente")
+                if codigo != 0:
+                    registrar_etapa(f"pipeline:{nombre}", segundos, "error", codigo=codigo, log=log_path)
+                    informar(f"[{nombre}] falló (código {codigo}) tras {segundos:.1f} s. Ver {log_path}", "error", etapa=nombre)
+                    fallidas.add(nombre)
+                    continue
+                salidas = expandir(etapas[nombre].get("salidas", []), rutas)
+                registro["huella"] = huella
+                registro["salidas"] = hash_archivos(salidas, estado["hashes"])
+                registro["archivos"] = len(salidas)
+                registro["segundos"] = round(segundos, 1)
+                registrar_etapa(f"pipeline:{nombre}", segundos, salidas=len(salidas), log=log_path)
+                informar(f"[{nombre}] completada en {segundos:.1f} s ({len(salidas)} salidas).", etapa=nombre)
+                terminadas.add(nombre)
+                ejecutadas.append(nombre)
+            if not simular:
+                guardar_estado(estado, estado_path)
+
+    if not simular:
+        guardar_estado(estado, estado_path)
+    informar(f"Pipeline terminado: {len(ejecutadas)} etapas ejecutadas, {len(fallidas)} con errores.")
+    if ejecutadas or fallidas:
+        resumen(leer_registro(registro_path, ejecucion))
+    return ejecutadas, sorted(fallidas)
+
+def ejecutar_script(script, qgis=False):
+    """Ejecuta un script del repositorio como programa principal, con QGIS inicializado si lo necesita."""
+    sys.path.insert(0, carpeta_scripts)
+    app = None
+    if qgis:
+        from qgis.core import QgsApplication
+        if QgsApplication.instance() is None:
+            app = QgsApplication([], False)
+            app.initQgis()
+    try:
+        with etapa(os.path.splitext(script)[0], script=script):
+            runpy.run_path(os.path.join(carpeta_scripts, script), run_name="__main__")
+    finally:
+        if app is not None:
+            app.exitQgis()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ejecuta las etapas desactualizadas del pipeline de Fire-Maps.")
+    parser.add_argument("--config", default=None, help="archivo de configuración (por defecto fire_maps.json)")
+    parser.add_argument("--solo", nargs="+", default=None, help="ejecutar solo estas etapas y sus dependencias")
+    parser.add_argument("--forzar", nargs="+", default=(), help="volver a ejecutar estas etapas aunque estén al día")
+    parser.add_argument("--simular", action="store_true", help="mostrar qué etapas se ejecutarían")
+    parser.add_argument("--ejecutar", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--qgis", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.ejecutar:
+        ejecutar_script(args.ejecutar, args.qgis)
+    else:
+        _, fallidas = ejecutar_pipeline(args.config, args.solo, args.forzar, args.simular)
+        sys.exit(1 if fallidas else 0)
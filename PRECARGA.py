@@ -0,0 +1,76 @@
+import time
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from INSTRUMENTACION import etapa
+
+# Ejecución en tubería (False procesa las tareas una tras otra, en este hilo, con las mismas funciones)
+activa = True
+
+# Tareas leídas por adelantado (cola acotada: en memoria hay a lo sumo precarga + 1 tareas leídas)
+precarga = 2
+
+# Hilos de lectura en segundo plano (GDAL libera el GIL al leer)
+hilos_lectura = 2
+
+# Escrituras pendientes antes de esperar a la más antigua
+escrituras_pendientes = 2
+
+def en_tuberia(tareas, leer, calcular, escribir=None, nombre="tuberia", precarga=precarga, hilos=hilos_lectura):
+    """Procesa tareas (escenas, HDF, meses) superponiendo lectura, cálculo y escritura.
+
+    `leer(tarea)` corre en hilos de fondo hasta `precarga` tareas por delante; `calcular(tarea,
+    datos)` corre en este hilo (puede usar QGIS) y `escribir(tarea, resultado)`, si se indica, en
+    un hilo de escritura propio, así el disco trabaja mientras se calcula. Las tareas cuya
+    lectura devuelve None se omiten. Devuelve los resultados de escribir (o de calcular) en
+    el orden de las tareas; los errores se propagan.
+    """
+    resultados = []
+    if not activa:
+        for tarea in tareas:
+            datos = leer(tarea)
+            if datos is None:
+                continue
+            resultado = calcular(tarea, datos)
+            resultados.append(escribir(tarea, resultado) if escribir else resultado)
+        return resultados
+
+    iterador = iter(tareas)
+    with etapa(nombre, precarga=precarga, hilos=hilos) as medicion, \
+            ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="lectura") as lector, \
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="escritura") as escritor:
+        lecturas = deque((tarea, lector.submit(leer, tarea)) for tarea in islice(iterador, precarga))
+        escrituras = deque()
+        espera_lectura = espera_escritura = 0.0
+        n_tareas = 0
+        while lecturas:
+            tarea, futuro = lecturas.popleft()
+            for siguiente in islice(iterador, 1):
+                lecturas.append((siguiente, lector.submit(leer, siguiente)))
+            inicio = time.perf_counter()
+            datos = futuro.result()
+            espera_lectura += time.perf_counter() - inicio
+            n_tareas += 1
+            if datos is None:
+                continue
+
+            resultado = calcular(tarea, datos)
+            datos = None
+            if escribir is None:
+                resultados.append(resultado)
+                continue
+            escrituras.append(escritor.submit(escribir, tarea, resultado))
+            resultado = None
+            while len(escrituras) > escrituras_pendientes:
+                inicio = time.perf_counter()
+                resultados.append(escrituras.popleft().result())
+                espera_escritura += time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        while escrituras:
+            resultados.append(escrituras.popleft().result())
+        espera_escritura += time.perf_counter() - inicio
+        # Tiempo en que el cálculo estuvo parado esperando al disco (cerca de cero = E/S oculta)
+        medicion.update(tareas=n_tareas, espera_lectura_s=round(espera_lectura, 3),
+                        espera_escritura_s=round(espera_escritura, 3))
+    return resultados
@@ -0,0 +1,185 @@
+import os
+import uuid
+import numpy as np
+from osgeo import gdal
+from MASCARA_AOI import recortar_raster
+from CATALOGO_SATELITAL import actualizar_catalogo, consultar
+from REJILLAS import opciones_warp
+from ALGEBRA_RASTER import calcular_indice, bandas_indice
+from INSTRUMENTACION import etapa, instrumentar, anotar, informar, resumen
+from PRECARGA import en_tuberia
+
+# Grupo de subdatasets de reflectancia de superficie de MOD09A1
+grupo_reflectancia = "MOD_Grid_500m_Surface_Reflectance"
+
+# Índices normalizados (a - b) / (a + b) de los compuestos (los productos por fecha usan ALGEBRA_RASTER)
+indices_mod09a1 = {
+    "NDVI": ("sur_refl_b02", "sur_refl_b01"),
+    "NDWI": ("sur_refl_b02", "sur_refl_b05")
+}
+
+def leer_bandas_mod09a1(hdf_path, bandas, rejilla="MODIS_500", bandas_qa=()):
+    """Reproyecta en memoria las bandas pedidas de un HDF MOD09A1 sobre una rejilla común.
+
+    Todas las bandas se reproyectan con una sola llamada a gdal.Warp sobre un VRT
+    multibanda ajustado a una rejilla registrada, así comparten los mismos píxeles
+    entre bandas y entre fechas, y no se escribe ningún archivo temporal en el archivo
+    satelital. Las bandas de `bandas_qa` se devuelven como enteros sin modificar
+    (banderas de bits). Devuelve (bandas, proyección, geotransformación) o None si
+    faltan bandas.
+    """
+    todas = list(bandas) + list(bandas_qa)
+    rutas = subdatasets_mod09a1(hdf_path, todas)
+    if rutas is None:
+        return None
+    return reproyectar_bandas(rutas, todas, rejilla, bandas_qa)
+
+def subdatasets_mod09a1(hdf_path, bandas):
+    """Rutas de los subdatasets de las bandas pedidas de un HDF MOD09A1 (None si falta alguna)."""
+    hdf_dataset = gdal.Open(hdf_path, gdal.GA_ReadOnly)
+    if not hdf_dataset:
+        informar(f"No se pudo abrir el archivo: {hdf_path}", "error")
+        return None
+
+    subdatasets = hdf_dataset.GetSubDatasets()
+    rutas = [next((s[0] for s in subdatasets if f"{grupo_reflectancia}:{banda}" in s[0]), None) for banda in bandas]
+    hdf_dataset = None
+    if not all(rutas):
+        informar(f"No se encontraron las bandas necesarias en el archivo HDF: {hdf_path}", "error")
+        return None
+    return rutas
+
+@instrumentar("reproyectar_dataset")
+def reproyectar_dataset(rutas, rejilla="MODIS_500", tipo_salida=gdal.GDT_Unknown):
+    """Reproyecta una lista de rasters de una banda a un dataset MEM multibanda con una sola llamada a gdal.Warp."""
+    vrt_path = f"/vsimem/mod09a1_{uuid.uuid4().hex}.vrt"
+    gdal.BuildVRT(vrt_path, rutas, separate=True)
+    mem_ds = gdal.Warp("", vrt_path, format="MEM", outputType=tipo_salida, **opciones_warp(rejilla))
+    gdal.Unlink(vrt_path)
+    return mem_ds
+
+@instrumentar("reproyectar_bandas")
+def reproyectar_bandas(rutas, nombres, rejilla="MODIS_500", bandas_qa=()):
+    """Reproyecta una lista de rasters de una banda (subdatasets o GeoTIFF) en una sola llamada a gdal.Warp.
+
+    Devuelve un diccionario nombre -> array, la proyección y la geotransformación de la rejilla.
+    """
+    # Int32 evita recortar las banderas de 16 bits sin signo al mezclarlas con la reflectancia
+    mem_ds = reproyectar_dataset(rutas, rejilla, gdal.GDT_Int32 if bandas_qa else gdal.GDT_Unknown)
+
+    arrays = {}
+    for i, banda in enumerate(nombres):
+        arr = mem_ds.GetRasterBand(i + 1).ReadAsArray()
+        if banda in bandas_qa:
+            arrays[banda] = arr.astype(np.uint16)
+            continue
+        arr = arr.astype(np.float32)
+        arr[arr <= 0] = np.nan
+        arrays[banda] = arr
+
+    proyeccion = mem_ds.GetProjection()
+    geotransform = mem_ds.GetGeoTransform()
+    mem_ds = None
+    anotar(**arrays)
+    return arrays, proyeccion, geotransform
+
+def indice_normalizado(a, b):
+    """Calcula (a - b) / (a + b) con NaN donde la suma es cero."""
+    suma = a + b
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(suma == 0, np.nan, (a - b) / suma)
+
+def guardar_indice(output_path, indice, proyeccion, geotransform):
+    """Guarda un índice como GeoTIFF Float32 con nodata NaN."""
+    with etapa("guardar_indice", salida=output_path, indice=indice):
+        driver = gdal.GetDriverByName("GTiff")
+        out_raster = driver.Create(output_path, indice.shape[1], indice.shape[0], 1, gdal.GDT_Float32)
+        out_raster.SetProjection(proyeccion)
+        out_raster.SetGeoTransform(geotransform)
+        out_raster.GetRasterBand(1).WriteArray(indice)
+        out_raster.GetRasterBand(1).SetNoDataValue(np.nan)
+        out_raster.FlushCache()
+        out_raster = None
+    return output_path
+
+def leer_hdf_indices(hdf_path, indices=("NDVI", "NDWI")):
+    """Reproyecta en memoria las bandas que necesitan los índices pedidos de un HDF MOD09A1.
+
+    Devuelve (dataset MEM, bandas en el orden del dataset) o None si faltan bandas.
+    """
+    bandas = []
+    for indice in indices:
+        for banda in bandas_indice(indice, "MOD09A1"):
+            if banda not in bandas:
+                bandas.append(banda)
+
+    rutas = subdatasets_mod09a1(hdf_path, bandas)
+    if rutas is None:
+        return None
+    return reproyectar_dataset(rutas), bandas
+
+def indices_desde_dataset(hdf_path, leido, mask_shp, indices=("NDVI", "NDWI"), agregar=None):
+    """Calcula y guarda los índices de un HDF a partir de sus bandas ya reproyectadas (leer_hdf_indices)."""
+    output_folder = os.path.dirname(hdf_path)
+    folder_name = os.path.basename(output_folder)
+    mem_ds, bandas = leido
+    fuentes = {banda: (mem_ds, i + 1) for i, banda in enumerate(bandas)}
+
+    salidas = []
+    for indice in indices:
+        output_path = calcular_indice(indice, "MOD09A1", fuentes, os.path.join(output_folder, f"{indice}_{folder_name}.tif"),
+                                      nodata=np.nan)
+        informar(f"{indice} guardado en: {output_path}")
+        salidas.append(output_path)
+        if agregar:
+            agregar(output_path)
+
+        if mask_shp:
+            clipped_output_path = os.path.join(output_folder, f"{indice}_{folder_name}_BENJAMIN_ACEVAL.tif")
+            if recortar_raster(output_path, clipped_output_path, mask_shp) is None:
+                continue
+            informar(f"{indice} recortado guardado en: {clipped_output_path}")
+            salidas.append(clipped_output_path)
+            if agregar:
+                agregar(clipped_output_path)
+    mem_ds = None
+    return salidas
+
+def calcular_indices_mod09a1(hdf_path, mask_shp, indices=("NDVI", "NDWI"), agregar=None):
+    """Calcula los índices pedidos de un HDF MOD09A1 a partir de una única reproyección de bandas.
+
+    Las expresiones de los índices se toman de la configuración y se evalúan por bloques con
+    ALGEBRA_RASTER sobre el dataset en memoria. `agregar` es una función opcional que recibe
+    la ruta de cada raster generado (por ejemplo, para cargarlo en QGIS). Devuelve la lista
+    de rasters escritos.
+    """
+    leido = leer_hdf_indices(hdf_path, indices)
+    if leido is None:
+        return []
+    return indices_desde_dataset(hdf_path, leido, mask_shp, indices, agregar)
+
+def procesar_modis_indices(base_folder, mask_shp, indices=("NDVI", "NDWI"), desde=None, hasta=None, agregar=None,
+                           etiqueta="indices_mod09a1"):
+    """Calcula los índices de todos los HDF MOD09A1 del catálogo que cubren el área de estudio.
+
+    Los HDF se procesan en tubería: mientras se calculan los índices de uno, las bandas de los
+    siguientes se reproyectan en memoria en segundo plano.
+    """
+    catalogo_db = actualizar_catalogo(base_folder)
+    registros = consultar(catalogo_db, producto="MOD09A1", desde=desde, hasta=hasta, aoi=mask_shp, raiz=base_folder)
+
+    def calcular(hdf_path, leido):
+        informar(f"Procesando: {hdf_path}")
+        with etapa(etiqueta, hdf=hdf_path, indices=list(indices)):
+            return indices_desde_dataset(hdf_path, leido, mask_shp, indices, agregar)
+
+    partes = en_tuberia([registro["ruta"] for registro in registros], lambda hdf_path: leer_hdf_indices(hdf_path, indices),
+                        calcular, nombre=f"tuberia_{etiqueta}")
+    return [salida for parte in partes for salida in parte]
+
+if __name__ == "__main__":
+    from CONFIGURACION import ruta
+    base_directory = ruta("modis_aqua")
+    mask_shapefile = ruta("aoi")
+    procesar_modis_indices(base_directory, mask_shapefile)
+    resumen()
@@ -0,0 +1,164 @@
+import math
+import numpy as np
+from osgeo import gdal, ogr, osr
+from MASCARA_AOI import firma_rejilla
+from CONFIGURACION import ruta
+
+# Área de estudio que define la extensión de todas las rejillas
+aoi_shp = ruta("aoi")
+
+# SRC común de salida (UTM zona 21S)
+epsg_rejillas = 32721
+
+# Margen alrededor del área de estudio (metros)
+margen_aoi = 5000
+
+# Rejillas registradas: nombre -> resolución en metros
+rejillas = {
+    "MODIS_250": 250,
+    "MODIS_500": 500,
+    "MODIS_1KM": 1000,
+    "LANDSAT_30": 30
+}
+
+# Rejillas ya calculadas en esta sesión ((nombre, shapefile) -> rejilla)
+_rejillas_calculadas = {}
+
+def orden_tradicional(srs):
+    """Copia de un SRC con el orden de ejes tradicional (x = este o longitud, y = norte o latitud)."""
+    srs = srs.Clone()
+    if hasattr(osr, "OAMS_TRADITIONAL_GIS_ORDER"):
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+def srs_epsg(epsg):
+    """SRC de un código EPSG con el orden de ejes tradicional."""
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    return orden_tradicional(srs)
+
+def transformar_extension(srs, x_min, y_min, x_max, y_max, epsg=epsg_rejillas, n=5):
+    """Extensión (x_min, y_min, x_max, y_max) de un rectángulo de `srs` en el SRC `epsg`.
+
+    Se transforman n puntos por borde, porque los bordes se curvan al cambiar de proyección.
+    """
+    transformacion = osr.CoordinateTransformation(orden_tradicional(srs), srs_epsg(epsg))
+    puntos = []
+    for i in range(n):
+        t = i / (n - 1)
+        x = x_min + (x_max - x_min) * t
+        y = y_min + (y_max - y_min) * t
+        puntos += [(x, y_min), (x, y_max), (x_min, y), (x_max, y)]
+    xy = np.array(transformacion.TransformPoints(puntos))
+    return (float(xy[:, 0].min()), float(xy[:, 1].min()), float(xy[:, 0].max()), float(xy[:, 1].max()))
+
+def extension_aoi(mask_shp, n=5):
+    """Extensión (x_min, y_min, x_max, y_max) del área de estudio en el SRC de las rejillas."""
+    shp_ds = ogr.Open(mask_shp)
+    if shp_ds is None:
+        raise IOError(f"No se pudo abrir el shapefile del área de estudio: {mask_shp}")
+    layer = shp_ds.GetLayer()
+    x_min, x_max, y_min, y_max = layer.GetExtent()
+    srs = layer.GetSpatialRef()
+    shp_ds = None
+
+    if srs is None:
+        return (x_min, y_min, x_max, y_max)
+    return transformar_extension(srs, x_min, y_min, x_max, y_max, epsg_rejillas, n)
+
+def obtener_rejilla(nombre, mask_shp=None):
+    """Devuelve la definición de una rejilla registrada.
+
+    El origen se alinea a múltiplos de la resolución, así las rejillas de distinta
+    resolución se anidan y todas las fechas de un producto comparten los mismos píxeles.
+    """
+    if nombre not in rejillas:
+        raise ValueError(f"Rejilla no registrada: {nombre}")
+    mask_shp = mask_shp or aoi_shp
+    clave = (nombre, mask_shp)
+    if clave in _rejillas_calculadas:
+        return _rejillas_calculadas[clave]
+
+    resolucion = rejillas[nombre]
+    x_min, y_min, x_max, y_max = extension_aoi(mask_shp)
+    x_min = math.floor((x_min - margen_aoi) / resolucion) * resolucion
+    y_min = math.floor((y_min - margen_aoi) / resolucion) * resolucion
+    x_max = math.ceil((x_max + margen_aoi) / resolucion) * resolucion
+    y_max = math.ceil((y_max + margen_aoi) / resolucion) * resolucion
+
+    ancho = int(round((x_max - x_min) / resolucion))
+    alto = int(round((y_max - y_min) / resolucion))
+    geotransform = (x_min, resolucion, 0.0, y_max, 0.0, -resolucion)
+    proyeccion = srs_epsg(epsg_rejillas).ExportToWkt()
+
+    rejilla = {
+        "nombre": nombre,
+        "epsg": epsg_rejillas,
+        "proyeccion": proyeccion,
+        "resolucion": resolucion,
+        "extension": (x_min, y_min, x_max, y_max),
+        "ancho": ancho,
+        "alto": alto,
+        "geotransform": geotransform,
+        "firma": firma_rejilla(proyeccion, geotransform, ancho, alto)
+    }
+    _rejillas_calculadas[clave] = rejilla
+    return rejilla
+
+def opciones_warp(nombre, mask_shp=None, remuestreo=gdal.GRA_NearestNeighbour):
+    """Argumentos de gdal.Warp que ajustan la salida exactamente a una rejilla registrada."""
+    rejilla = obtener_rejilla(nombre, mask_shp)
+    return {
+        "dstSRS": f"EPSG:{rejilla['epsg']}",
+        "xRes": rejilla["resolucion"],
+        "yRes": rejilla["resolucion"],
+        "outputBounds": rejilla["extension"],
+        "resampleAlg": remuestreo
+    }
+
+def abrir_en_rejilla(ruta, nombre, mask_shp=None, remuestreo=gdal.GRA_NearestNeighbour):
+    """Abre un raster como VRT reproyectado a una rejilla registrada (se remuestrea al leer)."""
+    return gdal.Warp("", ruta, format="VRT", **opciones_warp(nombre, mask_shp, remuestreo))
+
+def en_rejilla(ds, nombre, mask_shp=None):
+    """Indica si un dataset está exactamente sobre la rejilla registrada."""
+    rejilla = obtener_rejilla(nombre, mask_shp)
+    return firma_rejilla(ds.GetProjection(), ds.GetGeoTransform(), ds.RasterXSize, ds.RasterYSize) == rejilla["firma"]
+
+def ventana_en_rejilla(ruta, nombre, mask_shp=None, n=5):
+    """Ventana (xoff, yoff, xsize, ysize) de una rejilla registrada que cubre la extensión de un raster."""
+    rejilla = obtener_rejilla(nombre, mask_shp)
+    ds = gdal.Open(ruta)
+    if ds is None:
+        raise IOError(f"No se pudo abrir el raster: {ruta}")
+    gt = ds.GetGeoTransform()
+    puntos = []
+    for i in range(n):
+        t = i / (n - 1)
+        puntos += [(t * ds.RasterXSize, 0), (t * ds.RasterXSize, ds.RasterYSize),
+                   (0, t * ds.RasterYSize), (ds.RasterXSize, t * ds.RasterYSize)]
+    xy = np.array([(gt[0] + c * gt[1] + f * gt[2], gt[3] + c * gt[4] + f * gt[5]) for c, f in puntos])
+    srs = ds.GetSpatialRef()
+    ds = None
+    if srs is not None:
+        transformacion = osr.CoordinateTransformation(orden_tradicional(srs), srs_epsg(epsg_rejillas))
+        xy = np.array(transformacion.TransformPoints(xy.tolist()))[:, :2]
+
+    x_min, y_max = rejilla["extension"][0], rejilla["extension"][3]
+    resolucion = rejilla["resolucion"]
+    col_0 = max(0, int(math.floor((xy[:, 0].min() - x_min) / resolucion)))
+    col_1 = min(rejilla["ancho"], int(math.ceil((xy[:, 0].max() - x_min) / resolucion)))
+    fila_0 = max(0, int(math.floor((y_max - xy[:, 1].max()) / resolucion)))
+    fila_1 = min(rejilla["alto"], int(math.ceil((y_max - xy[:, 1].min()) / resolucion)))
+    return (col_0, fila_0, max(0, col_1 - col_0), max(0, fila_1 - fila_0))
+
+def apilar_serie(rutas, nombre, vrt_path, mask_shp=None):
+    """Apila una serie temporal de rasters de la misma rejilla en un VRT multibanda sin copiar píxeles."""
+    for ruta in rutas:
+        ds = gdal.Open(ruta)
+        if ds is None or not en_rejilla(ds, nombre, mask_shp):
+            raise ValueError(f"El raster no está sobre la rejilla {nombre}: {ruta}")
+        ds = None
+    vrt = gdal.BuildVRT(vrt_path, rutas, separate=True)
+    vrt.FlushCache()
+    return vrt
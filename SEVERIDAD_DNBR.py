@@ -0,0 +1,236 @@
+import os
+import argparse
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy.ndimage import label, maximum
+from osgeo import gdal, ogr, osr
+from ALGEBRA_RASTER import sensores, definicion_indice, compilar_expresion, evaluar_bloque, pixeles_bloque
+from REJILLAS import obtener_rejilla, abrir_en_rejilla, ventana_en_rejilla
+from MASCARA_AOI import desplazar_geotransform
+from CATALOGO_SATELITAL import actualizar_catalogo, consultar
+from INSTRUMENTACION import etapa, anotar, informar, resumen
+from LANDSAT_TAR import bandas_landsat, destino_escena
+
+# Rejilla común de salida (las bandas se reproyectan al leerlas)
+rejilla_landsat = "LANDSAT_30"
+
+# Días máximos entre la escena previa y la posterior para emparejarlas automáticamente
+dias_max_par = 64
+
+# Límites de dNBR (×1000) entre clases de severidad (Key y Benson): 1 rebrote, 2 no quemado,
+# 3 baja, 4 moderada-baja, 5 moderada-alta, 6 alta; 0 es nodata
+umbrales_severidad = (-100, 100, 270, 440, 660)
+
+# Clase mínima que se considera quemada al vectorizar las manchas
+clase_quemada = 3
+
+# Área mínima de una mancha quemada (hectáreas)
+area_minima_ha = 5
+
+# Pares de escenas procesados a la vez
+pares_en_paralelo = 4
+
+# Sensor del catálogo de cada juego de bandas (el par NBR sale del sensor: B5/B7 en OLI, B4/B7 en ETM+)
+sensor_catalogo = {"LANDSAT8": "OLI", "LANDSAT7": "ETM"}
+
+def emparejar_escenas(escenas, dias_max=dias_max_par):
+    """Empareja cada escena con la siguiente del mismo sensor y tile (path/row) si están a menos de `dias_max` días.
+
+    Las escenas sin tile conocido se agrupan por la carpeta que contiene su carpeta de fecha o su .tar,
+    así nunca se comparan dos path/row distintos de fechas cercanas.
+    """
+    grupos = {}
+    for escena in escenas:
+        lugar = escena.get("tile") or os.path.dirname(os.path.abspath(escena["ruta"]))
+        grupos.setdefault((escena.get("sensor"), lugar), []).append(escena)
+
+    pares = []
+    for grupo in grupos.values():
+        grupo.sort(key=lambda escena: escena.get("fecha") or "")
+        for previa, posterior in zip(grupo, grupo[1:]):
+            if not previa.get("fecha") or not posterior.get("fecha"):
+                continue
+            dias = (date.fromisoformat(posterior["fecha"][:10]) - date.fromisoformat(previa["fecha"][:10])).days
+            if 0 < dias <= dias_max:
+                pares.append((previa["ruta"], posterior["ruta"]))
+    return pares
+
+def ventana_comun(rutas, rejilla=rejilla_landsat):
+    """Intersección de las ventanas de la rejilla que cubren cada raster."""
+    ventanas = [ventana_en_rejilla(path, rejilla) for path in rutas]
+    col_0 = max(v[0] for v in ventanas)
+    fila_0 = max(v[1] for v in ventanas)
+    col_1 = min(v[0] + v[2] for v in ventanas)
+    fila_1 = min(v[1] + v[3] for v in ventanas)
+    return (col_0, fila_0, max(0, col_1 - col_0), max(0, fila_1 - fila_0))
+
+def clasificar_severidad(dnbr, umbrales=umbrales_severidad):
+    """Clases de severidad (1 a len(umbrales) + 1) de un bloque de dNBR; 0 donde no hay dato."""
+    clases = (np.digitize(dnbr, umbrales) + 1).astype(np.uint8)
+    clases[~np.isfinite(dnbr)] = 0
+    return clases
+
+def _crear_salida(path, ancho, alto, tipo, proyeccion, geotransform, nodata):
+    driver = gdal.GetDriverByName("GTiff")
+    out_ds = driver.Create(path, ancho, alto, 1, tipo, options=["COMPRESS=DEFLATE", "TILED=YES"])
+    out_ds.SetProjection(proyeccion)
+    out_ds.SetGeoTransform(geotransform)
+    out_ds.GetRasterBand(1).SetNoDataValue(nodata)
+    return out_ds
+
+def calcular_dnbr(previa, posterior, sensor, output_dir, rejilla=rejilla_landsat):
+    """dNBR, RdNBR y clases de severidad de un par de escenas, leídas por bloques solo en su ventana común.
+
+    dNBR = (NBR previo - NBR posterior) × 1000 y RdNBR = dNBR / √|NBR previo| (Miller y Thode).
+    Devuelve las rutas de salida o None si las escenas no se superponen.
+    """
+    expresion, _ = definicion_indice("NBR", sensor)
+    variables = compilar_expresion(expresion)[2]
+    alias = sensores[sensor]["bandas"]
+    minimo_valido = sensores[sensor]["minimo_valido"]
+    rutas_previa = bandas_landsat(previa, [alias[v] for v in variables])
+    rutas_posterior = bandas_landsat(posterior, [alias[v] for v in variables])
+    if rutas_previa is None or rutas_posterior is None:
+        informar(f"Faltan bandas para el NBR en {previa} o {posterior}.", "aviso")
+        return None
+
+    xoff, yoff, ancho, alto = ventana_comun(list(rutas_previa.values()) + list(rutas_posterior.values()), rejilla)
+    if ancho == 0 or alto == 0:
+        informar(f"Las escenas {previa} y {posterior} no se superponen.", "aviso")
+        return None
+
+    nombre = f"{destino_escena(previa)[1]}_{destino_escena(posterior)[1]}"
+    os.makedirs(output_dir, exist_ok=True)
+    salidas = {"dnbr": os.path.join(output_dir, f"DNBR_{nombre}.tif"),
+               "rdnbr": os.path.join(output_dir, f"RDNBR_{nombre}.tif"),
+               "severidad": os.path.join(output_dir, f"SEVERIDAD_{nombre}.tif")}
+
+    definicion = obtener_rejilla(rejilla)
+    geotransform = desplazar_geotransform(definicion["geotransform"], xoff, yoff)
+    bandas = {}
+    for momento, rutas in (("previa", rutas_previa), ("posterior", rutas_posterior)):
+        for v in variables:
+            ds = abrir_en_rejilla(rutas[alias[v]], rejilla)
+            bandas[momento, v] = (ds, ds.GetRasterBand(1))
+
+    dnbr_ds = _crear_salida(salidas["dnbr"], ancho, alto, gdal.GDT_Float32, definicion["proyeccion"], geotransform, -9999)
+    rdnbr_ds = _crear_salida(salidas["rdnbr"], ancho, alto, gdal.GDT_Float32, definicion["proyeccion"], geotransform, -9999)
+    clases_ds = _crear_salida(salidas["severidad"], ancho, alto, gdal.GDT_Byte, definicion["proyeccion"], geotransform, 0)
+
+    filas = max(1, pixeles_bloque // ancho)
+    with np.errstate(all="ignore"):
+        for fila in range(0, alto, filas):
+            n_filas = min(filas, alto - fila)
+            nbr = {}
+            for momento in ("previa", "posterior"):
+                entradas = {v: bandas[momento, v][1].ReadAsArray(xoff, yoff + fila, ancho, n_filas,
+                                                                   buf_type=gdal.GDT_Float32) for v in variables}
+                nbr[momento] = evaluar_bloque(expresion, entradas, np.nan, minimo_valido)
+            dnbr = (nbr["previa"] - nbr["posterior"]) * 1000
+            rdnbr = dnbr / np.sqrt(np.maximum(np.abs(nbr["previa"]), 1e-3))
+            clases = clasificar_severidad(dnbr)
+            dnbr_ds.GetRasterBand(1).WriteArray(np.where(np.isfinite(dnbr), dnbr, -9999), 0, fila)
+            rdnbr_ds.GetRasterBand(1).WriteArray(np.where(np.isfinite(rdnbr), rdnbr, -9999), 0, fila)
+            clases_ds.GetRasterBand(1).WriteArray(clases, 0, fila)
+
+    dnbr_ds = rdnbr_ds = clases_ds = None
+    bandas = None
+    anotar(ventana=[xoff, yoff, ancho, alto], bloques=-(-alto // filas))
+    return salidas
+
+def vectorizar_quemado(severidad_path, output_gpkg, clase_minima=clase_quemada, area_minima=area_minima_ha):
+    """Vectoriza las manchas quemadas (clase >= clase_minima) de al menos `area_minima` hectáreas.
+
+    Las manchas se etiquetan en el raster (8 vecinos) y las menores se descartan antes de
+    Polygonize; cada polígono lleva su número de mancha, su área y la severidad máxima.
+    """
+    src_ds = gdal.Open(severidad_path)
+    clases = src_ds.GetRasterBand(1).ReadAsArray()
+    geotransform = src_ds.GetGeoTransform()
+    proyeccion = src_ds.GetProjection()
+    src_ds = None
+    area_pixel_ha = abs(geotransform[1] * geotransform[5]) / 10000
+
+    manchas, n_manchas = label(clases >= clase_minima, structure=np.ones((3, 3), dtype=bool))
+    area = np.bincount(manchas.ravel(), minlength=n_manchas + 1) * area_pixel_ha
+    maxima = np.zeros(n_manchas + 1, dtype=np.uint8)
+    if n_manchas:
+        maxima[1:] = maximum(clases, manchas, np.arange(1, n_manchas + 1))
+    grandes = area >= area_minima
+    grandes[0] = False
+    manchas[~grandes[manchas]] = 0
+
+    mem_ds = gdal.GetDriverByName("MEM").Create("", clases.shape[1], clases.shape[0], 1, gdal.GDT_Int32)
+    mem_ds.SetProjection(proyeccion)
+    mem_ds.SetGeoTransform(geotransform)
+    band = mem_ds.GetRasterBand(1)
+    band.WriteArray(manchas)
+
+    if os.path.exists(output_gpkg):
+        os.remove(output_gpkg)
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(proyeccion)
+    vector_ds = ogr.GetDriverByName("GPKG").CreateDataSource(output_gpkg)
+    layer = vector_ds.CreateLayer("quemado", srs, ogr.wkbPolygon)
+    layer.CreateField(ogr.FieldDefn("mancha", ogr.OFTInteger))
+    vector_ds.StartTransaction()
+    gdal.Polygonize(band, band, layer, 0, ["8CONNECTED=8"])
+    layer.CreateField(ogr.FieldDefn("area_ha", ogr.OFTReal))
+    layer.CreateField(ogr.FieldDefn("severidad", ogr.OFTInteger))
+    for feature in layer:
+        mancha = feature.GetField("mancha")
+        feature.SetField("area_ha", round(float(area[mancha]), 2))
+        feature.SetField("severidad", int(maxima[mancha]))
+        layer.SetFeature(feature)
+    vector_ds.CommitTransaction()
+    vector_ds = None
+    mem_ds = None
+    anotar(manchas=int(grandes.sum()), descartadas=int(n_manchas - grandes.sum()))
+    return output_gpkg
+
+def procesar_par(previa, posterior, sensor, output_dir, rejilla=rejilla_landsat):
+    """dNBR, severidad y manchas quemadas de un par de escenas."""
+    nombre = f"{destino_escena(previa)[1]}_{destino_escena(posterior)[1]}"
+    with etapa("dnbr", par=nombre, sensor=sensor) as medicion:
+        salidas = calcular_dnbr(previa, posterior, sensor, output_dir, rejilla)
+        if salidas is None:
+            return None
+        medicion["salida"] = salidas["severidad"]
+    with etapa("vectorizar_quemado", par=nombre):
+        salidas["quemado"] = vectorizar_quemado(salidas["severidad"], os.path.join(output_dir, f"QUEMADO_{nombre}.gpkg"))
+    informar(f"Severidad de {nombre} guardada en: {output_dir}")
+    return salidas
+
+def procesar_temporada(pares, sensor, output_dir, rejilla=rejilla_landsat, hilos=pares_en_paralelo):
+    """Procesa todos los pares de una temporada en paralelo (la lectura, numpy y GDAL liberan el GIL)."""
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        resultados = list(executor.map(lambda par: procesar_par(par[0], par[1], sensor, output_dir, rejilla), pares))
+    return [r for r in resultados if r]
+
+if __name__ == "__main__":
+    from CONFIGURACION import ruta, parametro
+
+    parser = argparse.ArgumentParser(description="dNBR, RdNBR, clases de severidad y manchas quemadas de pares Landsat.")
+    parser.add_argument("--sensor", choices=["LANDSAT8", "LANDSAT7"], default="LANDSAT8")
+    parser.add_argument("--carpeta", help="carpeta base de las escenas (por defecto, la ruta landsat_lst)")
+    parser.add_argument("--desde", help="fecha inicial de la temporada (AAAA-MM-DD)")
+    parser.add_argument("--hasta", help="fecha final de la temporada (AAAA-MM-DD)")
+    args = parser.parse_args()
+
+    base_directory = args.carpeta or ruta("landsat_lst" if args.sensor == "LANDSAT8" else "landsat7_lst")
+
+    # Pares explícitos [carpeta previa, carpeta posterior] o, si no hay, escenas consecutivas del catálogo
+    pares = [tuple(par) for par in parametro("pares_dnbr", [])]
+    if not pares:
+        catalogo_db = actualizar_catalogo(base_directory)
+        alias = sensores[args.sensor]["bandas"]
+        bandas = [alias[v] for v in compilar_expresion(definicion_indice("NBR", args.sensor)[0])[2]]
+        # Solo escenas del sensor pedido: una ETM+ también tiene B5/B7, pero su NBR usa B4/B7
+        escenas = consultar(catalogo_db, producto="LANDSAT", sensor=sensor_catalogo[args.sensor], desde=args.desde,
+                            hasta=args.hasta, bandas=bandas, raiz=base_directory)
+        pares = emparejar_escenas(escenas)
+    informar(f"Pares de escenas a procesar: {len(pares)}", pares=len(pares))
+
+    procesar_temporada(pares, args.sensor, ruta("severidad"))
+    resumen()
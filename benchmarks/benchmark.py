@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+import importlib.util
+import numpy as np
+
+carpeta_benchmarks = os.path.dirname(os.path.abspath(__file__))
+carpeta_repositorio = os.path.dirname(carpeta_benchmarks)
+sys.path.insert(0, carpeta_repositorio)
+sys.path.insert(0, carpeta_benchmarks)
+
+from osgeo import gdal
+from datos_sinteticos import tamanos, preparar_datos
+from INSTRUMENTACION import contadores_io, pico_rss
+
+# Carpeta de los datos sintéticos (se generan una vez por tamaño y se reutilizan)
+carpeta_datos = os.path.join(tempfile.gettempdir(), "fire_maps_benchmarks")
+
+# Referencias guardadas y umbrales de regresión (fracción sobre la referencia)
+referencias_path = os.path.join(carpeta_benchmarks, "referencias.json")
+umbrales = {"segundos": 0.20, "pico_rss_mb": 0.15, "bytes_escritos_mb": 0.10}
+
+# Repeticiones de cada caso (se toma el menor tiempo y la mayor memoria)
+repeticiones = 3
+
+# Parámetros del kernel de KERNEL_POR_FECHA.py
+radio_kernel = 4500
+pixel_kernel = 300
+radios_kernel = [1500, 3000, 4500, 9000]
+
+MB = 1024 * 1024
+
+def cargar_script(nombre_archivo):
+    """Importa un script del repositorio por su ruta (admite nombres con espacios).
+
+    Solo se cargan scripts que importan QGIS dentro de main(): los casos miden las funciones
+    de GDAL y numpy y tienen que correr con Python sin QGIS.
+    """
+    nombre = os.path.splitext(nombre_archivo)[0].replace(" ", "_")
+    spec = importlib.util.spec_from_file_location(nombre, os.path.join(carpeta_repositorio, nombre_archivo))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+def salida(datos, nombre):
+    return os.path.join(datos["salida"], nombre)
+
+# Cada caso prepara sus entradas (sin medir) y devuelve la función que se mide
+
+def caso_lst_landsat(datos):
+    modulo = cargar_script("LST_LANDSAT8_FINAL.py")
+    bandas = datos["landsat"]
+    return lambda: modulo.calculate_lst_gdal(bandas["B4"], bandas["B5"], bandas["B10"], salida(datos, "LST.tif"))
+
+def caso_ndvi_landsat(datos):
+    from ALGEBRA_RASTER import calcular_indice
+    bandas = datos["landsat"]
+    return lambda: calcular_indice("NDVI", "LANDSAT8", {"RED": bandas["B4"], "NIR": bandas["B5"]},
+                                   salida(datos, "NDVI_LANDSAT.tif"), "LANDSAT_30")
+
+def caso_ndvi_modis(datos):
+    from REFLECTANCIA_MOD09A1 import reproyectar_dataset
+    from ALGEBRA_RASTER import calcular_indice
+    bandas = datos["modis"]
+
+    def ejecutar():
+        mem_ds = reproyectar_dataset([bandas["sur_refl_b01"], bandas["sur_refl_b02"]])
+        fuentes = {"sur_refl_b01": (mem_ds, 1), "sur_refl_b02": (mem_ds, 2)}
+        calcular_indice("NDVI", "MOD09A1", fuentes, salida(datos, "NDVI_MODIS.tif"), nodata=np.nan)
+    return ejecutar
+
+def caso_kernel(datos):
+    from FILTRO_AOI import indice_aoi, zona_de_puntos
+    from DENSIDAD_KERNEL import densidad_kernel, guardar_densidad
+    focos = np.load(datos["focos"])
+    x, y = focos["x"], focos["y"]
+
+    def ejecutar():
+        indice = indice_aoi(datos["aoi"])
+        dentro = zona_de_puntos(x, y, indice) >= 0
+        min_x, min_y, max_x, max_y = indice["extension"]
+        extension = (min_x - radio_kernel, min_y - radio_kernel, max_x + radio_kernel, max_y + radio_kernel)
+        density = densidad_kernel(x[dentro], y[dentro], extension, pixel_kernel, radio_kernel)
+        guardar_densidad(salida(datos, "KERNEL.tif"), density, extension, pixel_kernel)
+    return ejecutar
+
+def caso_kernel_radios(datos):
+    from FILTRO_AOI import indice_aoi, zona_de_puntos
+    from DENSIDAD_KERNEL import densidades_kernel, guardar_densidad
+    focos = np.load(datos["focos"])
+    x, y = focos["x"], focos["y"]
+    margen = max(radios_kernel)
+
+    def ejecutar():
+        indice = indice_aoi(datos["aoi"])
+        dentro = zona_de_puntos(x, y, indice) >= 0
+        min_x, min_y, max_x, max_y = indice["extension"]
+        extension = (min_x - margen, min_y - margen, max_x + margen, max_y + margen)
+        densidades = densidades_kernel(x[dentro], y[dentro], extension, pixel_kernel, radios_kernel)
+        guardar_densidad(salida(datos, "DENSIDAD_RADIOS.tif"), densidades, extension, pixel_kernel)
+    return ejecutar
+
+def caso_scale_to_byte(datos):
+    modulo = cargar_script("COMBINACION_LANDSAT 8OLI.py")
+    banda = gdal.Open(datos["landsat"]["B5"]).ReadAsArray()
+    low, high = modulo.percentile_cuts(datos["landsat"]["B5"])
+    return lambda: modulo.scale_to_byte(banda, low, high)
+
+def caso_combinacion_rgb(datos):
+    modulo = cargar_script("COMBINACION_LANDSAT 8OLI.py")
+    bandas = datos["landsat"]
+    return lambda: modulo.combine_bands([bandas["B6"], bandas["B5"], bandas["B2"]], salida(datos, "RGB.tif"))
+
+casos = {
+    "lst_landsat": caso_lst_landsat,
+    "ndvi_landsat": caso_ndvi_landsat,
+    "ndvi_modis": caso_ndvi_modis,
+    "kernel": caso_kernel,
+    "kernel_radios": caso_kernel_radios,
+    "scale_to_byte": caso_scale_to_byte,
+    "combinacion_rgb": caso_combinacion_rgb
+}
+
+def medir_caso(caso, tamano):
+    """Mide un caso en este proceso: tiempo, picos de memoria y bytes leídos y escritos."""
+    datos = preparar_datos(carpeta_datos, tamano)
+    ejecutar = casos[caso](datos)
+    rss_inicial = pico_rss()
+    io_inicial = contadores_io()
+
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    ejecutar()
+    segundos = time.perf_counter() - inicio
+    _, pico_python = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    io_final = contadores_io()
+    rss_final = pico_rss()
+    resultado = {"segundos": segundos, "pico_python_mb": pico_python / MB}
+    if rss_final is not None:
+        resultado["pico_rss_mb"] = rss_final / MB
+        resultado["incremento_rss_mb"] = (rss_final - rss_inicial) / MB
+    if io_inicial is not None:
+        resultado["bytes_leidos_mb"] = (io_final[0] - io_inicial[0]) / MB
+        resultado["bytes_escritos_mb"] = (io_final[1] - io_inicial[1]) / MB
+    return resultado
+
+def ejecutar_caso(caso, tamano, datos, n_repeticiones):
+    """Repite un caso en procesos nuevos (memoria independiente) y resume las mediciones."""
+    mediciones = []
+    for _ in range(n_repeticiones):
+        entorno = dict(os.environ, FIRE_MAPS_CONFIG=datos["configuracion"], FIRE_MAPS_REGISTRO="")
+        proceso = subprocess.run([sys.executable, os.path.abspath(__file__), "--medir", caso, tamano],
+                                 capture_output=True, text=True, env=entorno)
+        if proceso.returncode != 0:
+            print(f"Error en {caso}/{tamano}:\n{proceso.stderr[-2000:]}")
+            return None
+        mediciones.append(json.loads(proceso.stdout.strip().splitlines()[-1]))
+
+    resumen = {}
+    for clave in mediciones[0]:
+        valores = [m[clave] for m in mediciones]
+        resumen[clave] = round(min(valores) if clave == "segundos" else max(valores), 4)
+    return resumen
+
+def comparar(clave, resultado, referencias):
+    """Compara un resultado con su referencia; devuelve (estado, variaciones por métrica)."""
+    referencia = referencias.get(clave)
+    if referencia is None:
+        return "NUEVO", {}
+    variaciones, estado = {}, "OK"
+    for metrica, umbral in umbrales.items():
+        if metrica not in resultado or not referencia.get(metrica):
+            continue
+        variacion = resultado[metrica] / referencia[metrica] - 1
+        variaciones[metrica] = variacion
+        if variacion > umbral:
+            estado = "REGRESION"
+    return estado, variaciones
+
+def ejecutar_benchmarks(casos_elegidos, tamanos_elegidos, n_repeticiones=repeticiones, guardar_referencia=False):
+    """Ejecuta los casos pedidos, muestra la tabla comparada con las referencias y devuelve las regresiones."""
+    referencias = {"maquina": platform.node(), "resultados": {}}
+    if os.path.exists(referencias_path):
+        with open(referencias_path, encoding="utf-8") as f:
+            referencias = json.load(f)
+    if referencias.get("maquina") != platform.node():
+        print(f"Aviso: las referencias se tomaron en '{referencias.get('maquina')}', no en '{platform.node()}'.")
+
+    resultados, regresiones = {}, []
+    print(f"{'caso':<18}{'tamaño':<9}{'s':>9}{'Δs':>8}{'RSS MB':>9}{'ΔRSS':>8}{'leído MB':>10}{'escrito MB':>11}  estado")
+    for tamano in tamanos_elegidos:
+        datos = preparar_datos(carpeta_datos, tamano)
+        for caso in casos_elegidos:
+            resultado = ejecutar_caso(caso, tamano, datos, n_repeticiones)
+            if resultado is None:
+                regresiones.append(f"{caso}/{tamano}")
+                continue
+            clave = f"{caso}/{tamano}"
+            resultados[clave] = resultado
+            estado, variaciones = comparar(clave, resultado, referencias["resultados"])
+            if estado == "REGRESION":
+                regresiones.append(clave)
+            formato = lambda v: f"{v:+.0%}" if v is not None else "-"
+            print(f"{caso:<18}{tamano:<9}{resultado['segundos']:>9.3f}{formato(variaciones.get('segundos')):>8}"
+                  f"{resultado.get('pico_rss_mb', 0):>9.0f}{formato(variaciones.get('pico_rss_mb')):>8}"
+                  f"{resultado.get('bytes_leidos_mb', 0):>10.1f}{resultado.get('bytes_escritos_mb', 0):>11.1f}  {estado}")
+
+    if guardar_referencia:
+        referencias = {"maquina": platform.node(), "resultados": dict(referencias["resultados"], **resultados)}
+        with open(referencias_path, "w", encoding="utf-8") as f:
+            json.dump(referencias, f, indent=4, sort_keys=True)
+        print(f"Referencias guardadas en: {referencias_path}")
+    elif regresiones:
+        print(f"Regresiones: {', '.join(regresiones)}")
+    return regresiones
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks de Fire-Maps con datos sintéticos.")
+    parser.add_argument("--casos", nargs="+", choices=list(casos), default=list(casos))
+    parser.add_argument("--tamanos", nargs="+", choices=list(tamanos), default=["pequeno", "mediano"])
+    parser.add_argument("--repeticiones", type=int, default=repeticiones)
+    parser.add_argument("--guardar-referencia", action="store_true", help="guardar los resultados como nueva referencia")
+    parser.add_argument("--medir", nargs=2, metavar=("CASO", "TAMANO"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        print(json.dumps(medir_caso(*args.medir)))
+    else:
+        sys.exit(1 if ejecutar_benchmarks(args.casos, args.tamanos, args.repeticiones, args.guardar_referencia) else 0)
@@ -0,0 +1,177 @@
+import os
+import json
+import numpy as np
+from osgeo import gdal, ogr, osr
+from scipy.ndimage import zoom
+from CONFIGURACION import cargar_configuracion
+
+# Tamaños de los casos: lado de la escena Landsat y del tile MODIS (píxeles) y número de focos
+tamanos = {
+    "pequeno": {"landsat": 1000, "modis": 600, "focos": 10_000},
+    "mediano": {"landsat": 3000, "modis": 1200, "focos": 100_000},
+    "grande": {"landsat": 7000, "modis": 2400, "focos": 1_000_000}
+}
+
+# Centro de las escenas sintéticas en UTM 21S (Chaco paraguayo)
+centro_utm = (300000.0, 7500000.0)
+
+# Tamaño de píxel de MOD09A1 en la proyección sinusoidal
+pixel_modis = 463.312716528
+
+proyeccion_sinusoidal = "+proj=sinu +lon_0=0 +x_0=0 +y_0=0 +R=6371007.181 +units=m +no_defs"
+
+# Rangos de números digitales de cada banda Landsat (mínimo, máximo) para OLI
+rangos_landsat = {
+    "B2": (7000, 11000), "B3": (7500, 12000), "B4": (6000, 14000), "B5": (12000, 26000),
+    "B6": (9000, 22000), "B7": (7000, 18000), "B10": (25000, 32000)
+}
+
+def _srs(definicion):
+    srs = osr.SpatialReference()
+    if isinstance(definicion, int):
+        srs.ImportFromEPSG(definicion)
+    else:
+        srs.ImportFromProj4(definicion)
+    if hasattr(osr, "OAMS_TRADITIONAL_GIS_ORDER"):
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+def campo_suave(rng, lado, celdas=16):
+    """Campo aleatorio suave en [0, 1] (paisaje con parches), de lado x lado píxeles."""
+    base = rng.random((celdas, celdas))
+    campo = zoom(base, lado / celdas, order=1)[:lado, :lado]
+    return (campo - campo.min()) / max(campo.max() - campo.min(), 1e-9)
+
+def guardar_tif(path, array, geotransform, srs, nodata=None):
+    tipo = gdal.GDT_UInt16 if array.dtype == np.uint16 else gdal.GDT_Int16
+    ds = gdal.GetDriverByName("GTiff").Create(path, array.shape[1], array.shape[0], 1, tipo,
+                                              options=["TILED=YES", "COMPRESS=NONE"])
+    ds.SetGeoTransform(geotransform)
+    ds.SetProjection(srs.ExportToWkt())
+    band = ds.GetRasterBand(1)
+    band.WriteArray(array)
+    if nodata is not None:
+        band.SetNoDataValue(nodata)
+    ds = None
+    return path
+
+def generar_landsat(carpeta, lado, semilla=0):
+    """Escena Landsat 8 OLI sintética (B<n>.tif UInt16 en EPSG:32721, 30 m) con un borde de relleno."""
+    os.makedirs(carpeta, exist_ok=True)
+    rng = np.random.default_rng(semilla)
+    geotransform = (centro_utm[0] - lado * 15, 30, 0, centro_utm[1] + lado * 15, 0, -30)
+    vegetacion = campo_suave(rng, lado)
+    relleno = np.zeros((lado, lado), dtype=bool)
+    borde = lado // 20
+    relleno[:borde, :] = relleno[:, :borde] = True
+
+    rutas = {}
+    for banda, (minimo, maximo) in rangos_landsat.items():
+        factor = vegetacion if banda in ("B5", "B6") else 1 - vegetacion
+        valores = minimo + (maximo - minimo) * (0.7 * factor + 0.3 * rng.random((lado, lado)))
+        valores = valores.astype(np.uint16)
+        valores[relleno] = 0
+        rutas[banda] = guardar_tif(os.path.join(carpeta, f"{banda}.tif"), valores, geotransform, _srs(32721))
+    return rutas
+
+def generar_modis(carpeta, lado, semilla=0):
+    """Subdatasets MOD09A1 sintéticos (GeoTIFF Int16/UInt16 en proyección sinusoidal, 463 m)."""
+    os.makedirs(carpeta, exist_ok=True)
+    rng = np.random.default_rng(semilla)
+    transformacion = osr.CoordinateTransformation(_srs(32721), _srs(proyeccion_sinusoidal))
+    x, y, _ = transformacion.TransformPoint(*centro_utm)
+    geotransform = (x - lado * pixel_modis / 2, pixel_modis, 0, y + lado * pixel_modis / 2, 0, -pixel_modis)
+    srs = _srs(proyeccion_sinusoidal)
+    vegetacion = campo_suave(rng, lado)
+
+    rutas = {}
+    for banda, (minimo, maximo) in {"sur_refl_b01": (300, 1500), "sur_refl_b02": (1500, 4500),
+                                    "sur_refl_b05": (1000, 3500)}.items():
+        factor = 1 - vegetacion if banda == "sur_refl_b01" else vegetacion
+        valores = (minimo + (maximo - minimo) * (0.7 * factor + 0.3 * rng.random((lado, lado)))).astype(np.int16)
+        rutas[banda] = guardar_tif(os.path.join(carpeta, f"{banda}.tif"), valores, geotransform, srs, -28672)
+
+    # Banderas de estado: ~15 % de nubes, ~5 % de sombras y algo de cirros
+    estado = np.zeros((lado, lado), dtype=np.uint16)
+    azar = rng.random((lado, lado))
+    estado[azar < 0.15] |= 0b01
+    estado[(azar >= 0.15) & (azar < 0.20)] |= 1 << 2
+    estado[rng.random((lado, lado)) < 0.10] |= 2 << 8
+    rutas["sur_refl_state_500m"] = guardar_tif(os.path.join(carpeta, "sur_refl_state_500m.tif"), estado, geotransform, srs)
+    return rutas
+
+def generar_focos(n, extension, semilla=0, n_incendios=40):
+    """Focos de calor sintéticos: 80 % agrupados alrededor de incendios y 20 % dispersos."""
+    rng = np.random.default_rng(semilla)
+    min_x, min_y, max_x, max_y = extension
+    n_grupo = int(n * 0.8)
+    centros = np.column_stack([rng.uniform(min_x, max_x, n_incendios), rng.uniform(min_y, max_y, n_incendios)])
+    incendio = rng.integers(0, n_incendios, n_grupo)
+    agrupados = centros[incendio] + rng.normal(0, 3000, (n_grupo, 2))
+    dispersos = np.column_stack([rng.uniform(min_x, max_x, n - n_grupo), rng.uniform(min_y, max_y, n - n_grupo)])
+    puntos = np.vstack([agrupados, dispersos])
+    return puntos[:, 0], puntos[:, 1]
+
+def generar_aoi(path, extension, n_vertices=256, semilla=0):
+    """Área de estudio sintética: un polígono irregular inscrito en la extensión (EPSG:32721)."""
+    rng = np.random.default_rng(semilla)
+    min_x, min_y, max_x, max_y = extension
+    cx, cy = (min_x + max_x) / 2, (min_y + max_y) / 2
+    angulos = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    radios = 0.4 + 0.1 * rng.random(n_vertices)
+    anillo = ogr.Geometry(ogr.wkbLinearRing)
+    for angulo, radio in zip(angulos, radios):
+        anillo.AddPoint_2D(cx + radio * (max_x - min_x) * np.cos(angulo), cy + radio * (max_y - min_y) * np.sin(angulo))
+    anillo.CloseRings()
+    poligono = ogr.Geometry(ogr.wkbPolygon)
+    poligono.AddGeometry(anillo)
+
+    driver = ogr.GetDriverByName("ESRI Shapefile")
+    if os.path.exists(path):
+        driver.DeleteDataSource(path)
+    ds = driver.CreateDataSource(path)
+    layer = ds.CreateLayer("aoi", _srs(32721), ogr.wkbPolygon)
+    feature = ogr.Feature(layer.GetLayerDefn())
+    feature.SetGeometry(poligono)
+    layer.CreateFeature(feature)
+    ds = None
+    return path
+
+def preparar_datos(carpeta, tamano):
+    """Genera (o reutiliza) los datos sintéticos de un tamaño y el archivo de configuración que los usa."""
+    carpeta = os.path.join(carpeta, tamano)
+    indice_path = os.path.join(carpeta, "datos.json")
+    if os.path.exists(indice_path):
+        with open(indice_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    os.makedirs(carpeta, exist_ok=True)
+    parametros = tamanos[tamano]
+    lado_m = parametros["landsat"] * 30
+    extension = (centro_utm[0] - lado_m * 0.4, centro_utm[1] - lado_m * 0.4,
+                 centro_utm[0] + lado_m * 0.4, centro_utm[1] + lado_m * 0.4)
+    aoi = generar_aoi(os.path.join(carpeta, "aoi.shp"), extension)
+    x, y = generar_focos(parametros["focos"], extension)
+    focos = os.path.join(carpeta, "focos.npz")
+    np.savez(focos, x=x, y=y)
+
+    datos = {
+        "tamano": tamano,
+        "extension": extension,
+        "aoi": aoi,
+        "landsat": generar_landsat(os.path.join(carpeta, "LANDSAT"), parametros["landsat"]),
+        "modis": generar_modis(os.path.join(carpeta, "MODIS"), parametros["modis"]),
+        "focos": focos,
+        "salida": os.path.join(carpeta, "salida"),
+        "configuracion": os.path.join(carpeta, "fire_maps.json")
+    }
+    os.makedirs(datos["salida"], exist_ok=True)
+
+    # Configuración del repositorio con el área de estudio sintética (las rejillas se calculan a partir de ella)
+    configuracion = dict(cargar_configuracion())
+    configuracion["rutas"] = dict(configuracion["rutas"], aoi=aoi)
+    with open(datos["configuracion"], "w", encoding="utf-8") as f:
+        json.dump(configuracion, f, indent=4)
+    with open(indice_path, "w", encoding="utf-8") as f:
+        json.dump(datos, f, indent=4)
+    return datos
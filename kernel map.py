@@ -1,5 +1,6 @@
 import os
 import re
+import glob
 from qgis.core import (
     QgsProject,
     QgsPrintLayout,
@@ -12,6 +13,9 @@ from qgis.core import (
     QgsRasterLayer
 )
 from PyQt5.QtXml import QDomDocument
+from CONFIGURACION import ruta
+from ENSAMBLAR_PROYECTO import ensamblar_proyecto
+from INSTRUMENTACION import informar
 
 def extract_month_year_kernel(layer_name):
     match = re.search(r'Densidad Kernel (\d{2})_(\d{4})', layer_name)
@@ -28,16 +32,21 @@ def update_label_text(item, date_emission):
     if "Fecha de emision:" in original_text:
         new_text = re.sub(r"Fecha de emision: \d{2}/\d{4}", f"Fecha de emision: {date_emission}", original_text)
         item.setText(new_text)
-        print(f"Etiqueta actualizada: {new_text}")
+        informar(f"Etiqueta actualizada: {new_text}")
 
 def create_and_export_kernel_maps():
     project = QgsProject.instance()
-    template_path = 'C:/carmen/MAPA KERNEL.qpt'
+    template_path = ruta("plantilla_mapa_kernel")
 
     raster_layers = [layer for layer in project.mapLayers().values() if isinstance(layer, QgsRasterLayer)]
 
+    # Sin capas en el proyecto (por ejemplo, desde el pipeline): cargar los kernels generados
     if not raster_layers:
-        print("No se encontraron capas raster en el proyecto.")
+        kernels = sorted(glob.glob(os.path.join(ruta("kernel"), "**", "resultados", "KERNEL_*.tif"), recursive=True))
+        raster_layers = ensamblar_proyecto({"KERNEL": kernels}, project)
+
+    if not raster_layers:
+        informar("No se encontraron capas raster en el proyecto.", "error")
         return
 
     desired_scale = 600000
@@ -50,7 +59,7 @@ def create_and_export_kernel_maps():
             with open(template_path, 'rt') as f:
                 template_content = f.read()
         except Exception as e:
-            print(f"Error al leer la plantilla: {e}")
+            informar(f"Error al leer la plantilla: {e}", "error")
             continue
 
         doc = QDomDocument()
@@ -65,7 +74,7 @@ def create_and_export_kernel_maps():
                     if "Densidad de Kernel" in current_text:
                         new_text = f"Densidad de Kernel\n{month_name} {year}"
                         item.setText(new_text)
-                        print(f"Título actualizado a: {new_text}")
+                        informar(f"Título actualizado a: {new_text}")
                     elif "Fecha de emision:" in current_text:
                         update_label_text(item, date_emission)
 
@@ -78,7 +87,7 @@ def create_and_export_kernel_maps():
                 legend_item = item
 
         if map_item is None:
-            print("No se encontró ningún elemento de mapa en la plantilla.")
+            informar("No se encontró ningún elemento de mapa en la plantilla.", "error")
             continue
 
         # Centrar el contenido dentro del visor
@@ -121,9 +130,9 @@ def create_and_export_kernel_maps():
         result = exporter.exportToImage(output_png, QgsLayoutExporter.ImageExportSettings())
 
         if result == QgsLayoutExporter.Success:
-            print(f"Mapa exportado exitosamente a: {output_png}")
+            informar(f"Mapa exportado exitosamente a: {output_png}")
         else:
-            print("Error al exportar el mapa.")
+            informar("Error al exportar el mapa.", "error")
 
 # Ejecutar la función
 create_and_export_kernel_maps()